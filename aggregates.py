@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_commit import write_frame
+from data_layout import (DAILY_USAGE_AGGREGATE, HISTORY_ROLLUP_AGGREGATES, INTERVAL_USAGE_AGGREGATE,
+                         MONTHLY_USAGE_AGGREGATE, PAST_24_HOUR_USAGE_AGGREGATE, TYPICAL_DAY_PROFILE_AGGREGATE,
+                         aggregate_files_list)
+from series_lod import ROLLUP_LEVELS, build_rollups, readings_to_usage
+from time_series import TimeSeries
+
+DAILY_PLOT_DAYS = 45
+MONTHLY_PLOT_MONTHS = 12
+ROLLING_AVERAGE_DAYS = 7
+
+
+# Hourly Deltas between Consecutive Meter Readings
+def past_24_hour_usage(past_24_hours):
+    past_24_hours = past_24_hours.copy()
+    reading_time = pd.to_datetime(past_24_hours['READING_TIME'])
+    past_24_hours['USAGE'] = past_24_hours['METER_READING'].diff()
+    past_24_hours = past_24_hours.drop(columns=['METER_READING'])
+    past_24_hours['AVERAGE_USAGE'] = past_24_hours['USAGE'].mean()
+    past_24_hours['USAGE_DATE'] = reading_time.dt.date.astype('str')
+    past_24_hours['USAGE_TIME'] = reading_time.dt.time.astype('str')
+    return past_24_hours
+
+
+def interval_usage(past_day_interval):
+    past_day_interval = past_day_interval.copy()
+    usage_time = pd.to_datetime(past_day_interval['USAGE_TIME'])
+    past_day_interval['AVERAGE_USAGE'] = past_day_interval['USAGE'].mean()
+    past_day_interval['USAGE_DATE'] = usage_time.dt.date.astype('str')
+    past_day_interval['USAGE_TIME'] = usage_time.dt.time.astype('str')
+    return past_day_interval
+
+
+def daily_usage(daily_trends, num_days=DAILY_PLOT_DAYS):
+    daily_trends = daily_trends.sort_values('DAILY_DATE')
+    daily_trends['ROLLING_AVERAGE_USAGE'] = daily_trends['USAGE'].rolling(ROLLING_AVERAGE_DAYS, min_periods=1).mean()
+    daily_trends = daily_trends.tail(num_days).copy()
+    daily_trends['AVERAGE_USAGE'] = daily_trends['USAGE'].mean()
+    return daily_trends
+
+
+def monthly_usage(monthly_trends, num_months=MONTHLY_PLOT_MONTHS):
+    monthly_trends = monthly_trends.copy()
+    monthly_trends['MONTH_YEAR'] = pd.to_datetime(monthly_trends['MONTHLY_DATE']).dt.to_period('M').astype('str')
+    monthly_trends_grp = monthly_trends.groupby('MONTH_YEAR').USAGE.sum().reset_index().tail(num_months)
+    monthly_trends_grp['AVERAGE_USAGE'] = monthly_trends_grp['USAGE'].mean()
+    return monthly_trends_grp
+
+
+# Average Usage per Hour of Day, split by Weekdays and Weekends
+def typical_day_profile(hourly_usage):
+    reading_time = pd.to_datetime(hourly_usage['READING_TIME'])
+    profile = pd.DataFrame({
+        'HOUR_OF_DAY': reading_time.dt.strftime("%H:00"),
+        'DAY_TYPE': (reading_time.dt.dayofweek >= 5).map({False: 'WEEKDAY', True: 'WEEKEND'}),
+        'USAGE': hourly_usage['USAGE'].values
+    })
+    profile = profile.pivot_table(index='HOUR_OF_DAY', columns='DAY_TYPE', values='USAGE', aggfunc='mean')
+    for day_type in ['WEEKDAY', 'WEEKEND']:
+        if day_type not in profile.columns:
+            profile[day_type] = float('nan')
+    return profile[['WEEKDAY', 'WEEKEND']].reset_index()
+
+
+def history_rollups(history_readings):
+    # Series from the Store are already Sorted: the Deltas come straight off the Arrays
+    if isinstance(history_readings, TimeSeries):
+        return build_rollups(history_readings.deltas().to_frame().dropna(), 'READING_TIME', 'USAGE')
+    return build_rollups(readings_to_usage(history_readings), 'READING_TIME', 'USAGE')
+
+
+# The Rollups as last Written, or None when any Level is Missing
+def read_history_rollups(file_path):
+    rollups = dict()
+    for level, aggregate_file in HISTORY_ROLLUP_AGGREGATES.items():
+        local_file_name = os.path.join(file_path, aggregate_file)
+        if not os.path.exists(local_file_name):
+            return None
+        rollups[level] = pd.read_csv(local_file_name)
+        rollups[level]['READING_TIME'] = pd.to_datetime(rollups[level]['READING_TIME'])
+    return rollups
+
+
+# Only the Last Bucket of each Level (the only one a New Reading can Change) and anything after it is Re-Rolled
+def update_history_rollups(history_store, rollups):
+    if not rollups or any(rollups[level].empty for level, _ in ROLLUP_LEVELS):
+        return history_rollups(history_store.read_series())
+    last_labels = {level: rollups[level]['READING_TIME'].iloc[-1] for level, _ in ROLLUP_LEVELS}
+    # Buckets are Labelled by their Start, except Weeks: Monday to Sunday, Labelled by the Sunday
+    bucket_starts = dict(last_labels, WEEK=last_labels["WEEK"] - pd.Timedelta(days=6))
+    since = min(bucket_starts.values())
+    recent = history_store.read_series(start_time=since)
+    previous = history_store.last_before(since)
+    if previous is not None:
+        # The Reading before the Cut gives the First Delta
+        recent = TimeSeries(np.concatenate([[previous[0]], recent.times]),
+                            np.concatenate([[previous[1]], recent.values]), recent.time_col, recent.value_col)
+    usage = recent.deltas().to_frame().dropna()
+    updated = dict()
+    for level, _ in ROLLUP_LEVELS:
+        tail = build_rollups(usage[usage['READING_TIME'] >= bucket_starts[level]], 'READING_TIME', 'USAGE',
+                             levels=[level])[level]
+        kept = rollups[level][rollups[level]['READING_TIME'] < last_labels[level]]
+        updated[level] = pd.concat([kept, tail], ignore_index=True)
+    return updated
+
+
+def write_aggregate(df, file_path, file_name):
+    write_frame(df, os.path.join(file_path, file_name))
@@ -0,0 +1,196 @@
+import json
+import math
+import os
+
+import pandas as pd
+
+from data_commit import write_file, write_frame
+from data_layout import ANOMALY_FLAGS_DATAFILE, ANOMALY_STATE_DATAFILE
+from metrics import metrics
+
+# Weight of the Newest Usage in the Running Mean / Variance
+ANOMALY_EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", 0.1))
+# Deviations above the Running Mean (and above the Running Quantile) that make a Spike
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", 4))
+ANOMALY_QUANTILE = float(os.getenv("ANOMALY_QUANTILE", 0.95))
+# Readings an Hour of Day must have seen before it Flags anything
+ANOMALY_WARMUP_READINGS = int(os.getenv("ANOMALY_WARMUP_READINGS", 7))
+# Usage over a longer Gap is spread too thin to judge; it only moves the Baseline
+ANOMALY_MAX_GAP_HOURS = 6
+ANOMALY_MAX_FLAGS = 500
+# History replayed once when a Meter has no State yet
+ANOMALY_BOOTSTRAP_DAYS = 60
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+FLAG_COLUMNS = ["READING_TIME", "KIND", "USAGE", "EXPECTED_USAGE", "SCORE"]
+
+
+# Exponentially Weighted Mean and Variance
+class Ewma:
+    def __init__(self, state=None, alpha=ANOMALY_EWMA_ALPHA):
+        state = state or {}
+        self.alpha = alpha
+        self.count = state.get("count", 0)
+        self.mean = state.get("mean", 0.0)
+        self.var = state.get("var", 0.0)
+
+    def update(self, x):
+        if self.count == 0:
+            self.mean = x
+        else:
+            diff = x - self.mean
+            incr = self.alpha * diff
+            self.mean += incr
+            self.var = (1 - self.alpha) * (self.var + diff * incr)
+        self.count += 1
+
+    def score(self, x):
+        std = math.sqrt(self.var)
+        return (x - self.mean) / std if std > 0 else 0.0
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "var": self.var}
+
+
+# P-Square Estimate of one Quantile from Five Markers (Jain & Chlamtac), without keeping the Observations
+class P2Quantile:
+    def __init__(self, state=None, p=ANOMALY_QUANTILE):
+        state = state or {}
+        self.p = p
+        self.heights = state.get("heights", [])
+        self.positions = state.get("positions", [1, 2, 3, 4, 5])
+        self.desired = state.get("desired", [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5])
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x):
+        q, n = self.heights, self.positions
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+        if x < q[0]:
+            q[0], k = x, 0
+        elif x >= q[4]:
+            q[4], k = x, 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+        self.desired = [d + inc for d, inc in zip(self.desired, self.increments)]
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if q[i - 1] < parabolic < q[i + 1]:
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self):
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            return self.heights[min(len(self.heights) - 1, int(self.p * len(self.heights)))]
+        return self.heights[2]
+
+    def to_dict(self):
+        return {"heights": self.heights, "positions": self.positions, "desired": self.desired}
+
+
+# Hourly Usage Rate from Consecutive Readings, judged against the Same Hour of Day: O(1) Memory per Meter
+class AnomalyDetector:
+    def __init__(self, state=None):
+        state = state or {}
+        self.last_time = pd.Timestamp(state["last_time"]) if state.get("last_time") else None
+        self.last_reading = state.get("last_reading")
+        self.hours = {int(hour): (Ewma(stats.get("ewma")), P2Quantile(stats.get("quantile")))
+                      for hour, stats in state.get("hours", {}).items()}
+
+    def update(self, reading_time, meter_reading):
+        reading_time = pd.Timestamp(reading_time)
+        if self.last_time is not None and reading_time <= self.last_time:
+            return None
+        last_time, last_reading = self.last_time, self.last_reading
+        self.last_time, self.last_reading = reading_time, float(meter_reading)
+        if last_time is None or last_reading is None:
+            return None
+        delta = float(meter_reading) - last_reading
+        if delta < 0:
+            # A Meter Reset / Replacement starts a new Baseline; the Statistics are kept
+            return self._flag(reading_time, "METER_RESET", delta, None, None)
+        gap_hours = (reading_time - last_time).total_seconds() / 3600
+        if gap_hours <= 0 or gap_hours > ANOMALY_MAX_GAP_HOURS:
+            return None
+        usage = delta / gap_hours
+        ewma, quantile = self.hours.setdefault(reading_time.hour, (Ewma(), P2Quantile()))
+        flag = None
+        if ewma.count >= ANOMALY_WARMUP_READINGS:
+            score = ewma.score(usage)
+            if score > ANOMALY_Z_THRESHOLD and usage > (quantile.value() or 0):
+                flag = self._flag(reading_time, "SPIKE", usage, ewma.mean, score)
+        # Spikes feed the Statistics too, so a lasting Change of Habits stops being Flagged
+        ewma.update(usage)
+        quantile.update(usage)
+        return flag
+
+    @staticmethod
+    def _flag(reading_time, kind, usage, expected_usage, score):
+        return {"READING_TIME": reading_time.strftime(TIME_FORMAT), "KIND": kind, "USAGE": round(usage, 3),
+                "EXPECTED_USAGE": None if expected_usage is None else round(expected_usage, 3),
+                "SCORE": None if score is None else round(score, 2)}
+
+    def to_dict(self):
+        return {"last_time": self.last_time.strftime(TIME_FORMAT) if self.last_time is not None else None,
+                "last_reading": self.last_reading,
+                "hours": {str(hour): {"ewma": ewma.to_dict(), "quantile": quantile.to_dict()}
+                          for hour, (ewma, quantile) in sorted(self.hours.items())}}
+
+
+def _load_detector(state_file):
+    if os.path.exists(state_file):
+        try:
+            with open(state_file) as f:
+                return AnomalyDetector(json.load(f))
+        except ValueError:
+            print("Discarding Unreadable Anomaly State: [{}]".format(state_file))
+    return None
+
+
+# Run the New Reading through the Meter's Detector; State and Flags are Committed with the Reading
+@metrics.span("anomaly")
+def detect_meter_reading(file_path, reading_time, meter_reading, history_store=None):
+    state_file = os.path.join(file_path, ANOMALY_STATE_DATAFILE)
+    detector = _load_detector(state_file)
+    flags = list()
+    if detector is None:
+        detector = AnomalyDetector()
+        # First Run only: warm up on the Recent History instead of waiting Weeks for a Baseline
+        if history_store is not None and not history_store.is_empty():
+            start_time = pd.Timestamp(reading_time) - pd.Timedelta(days=ANOMALY_BOOTSTRAP_DAYS)
+            history = history_store.read_series(start_time=start_time)
+            for history_time, history_reading in zip(history.times, history.values):
+                flags.append(detector.update(history_time, history_reading))
+    elif detector.last_time is not None and pd.Timestamp(reading_time) <= detector.last_time:
+        return []
+    flags.append(detector.update(reading_time, meter_reading))
+    flags = [x for x in flags if x is not None]
+    write_file(state_file, json.dumps(detector.to_dict(), sort_keys=True))
+    if flags:
+        for flag in flags:
+            metrics.inc("anomalies_total", kind=flag["KIND"])
+            print("Flagged [{}] Reading at [{}]".format(flag["KIND"], flag["READING_TIME"]))
+        append_flags(flags, file_path)
+    return flags
+
+
+# Flags are kept as a Bounded Log of the Latest ANOMALY_MAX_FLAGS
+def append_flags(flags, file_path):
+    flags_file = os.path.join(file_path, ANOMALY_FLAGS_DATAFILE)
+    flags_df = pd.DataFrame(flags, columns=FLAG_COLUMNS)
+    if os.path.exists(flags_file):
+        flags_df = pd.concat([pd.read_csv(flags_file), flags_df])
+    flags_df = flags_df.drop_duplicates(subset=["READING_TIME", "KIND"], keep="last").sort_values("READING_TIME")
+    write_frame(flags_df.tail(ANOMALY_MAX_FLAGS), flags_file)
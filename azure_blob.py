@@ -1,21 +1,62 @@
 import os
 
 from azure.storage.blob import BlockBlobService
+from azure.storage.blob.models import BlobBlock
+
+from local_blob_service import LocalBlockBlobService
+
+# Set this to use a Folder instead of Azure (Testing / Offline Runs)
+BLOB_LOCAL_PATH = os.getenv("BLOB_LOCAL_PATH")
+# Set this to talk to a Local Azurite / Storage Emulator
+BLOB_EMULATED = True if os.getenv("BLOB_EMULATED") else False
 
 
 class AzureBlob:
-    def __init__(self, account_name, account_key, container_name):
+    def __init__(self, account_name, account_key, container_name, blob_service=None):
         self.account_name = account_name
         self.account_key = account_key
         self.container_name = container_name
-        self.blob_obj = BlockBlobService(account_name=account_name, account_key=account_key)
+        if blob_service:
+            self.blob_obj = blob_service
+        elif BLOB_LOCAL_PATH:
+            self.blob_obj = LocalBlockBlobService(BLOB_LOCAL_PATH)
+        else:
+            self.blob_obj = BlockBlobService(account_name=account_name, account_key=account_key,
+                                             is_emulated=BLOB_EMULATED)
+
+    def upload_file_to_blob(self, local_path, file_name, blob_prefix=""):
+        print("Uploading Local Data File [{file}] to BLOB".format(file=blob_prefix + file_name))
+        properties = self.blob_obj.create_blob_from_path(container_name=self.container_name,
+                                                         blob_name=blob_prefix + file_name,
+                                                         file_path=os.path.join(local_path, file_name))
+        return properties.etag if properties else None
+
+    def download_files_from_blob(self, local_path, file_name, blob_prefix=""):
+        print("Downloading Data File: [{file}] from BLOB".format(file=blob_prefix + file_name))
+        blob = self.blob_obj.get_blob_to_path(container_name=self.container_name, blob_name=blob_prefix + file_name,
+                                              file_path=os.path.join(local_path, file_name))
+        return blob.properties.etag if blob else None
+
+    # Stage the New Blocks and Commit them after the Already Committed ones: only the New Bytes are Sent
+    def put_blob_blocks(self, blob_name, blocks, committed_block_ids=(), blob_prefix=""):
+        for block_id, data in blocks:
+            self.blob_obj.put_block(container_name=self.container_name, blob_name=blob_prefix + blob_name,
+                                    block=data, block_id=block_id)
+        block_list = [BlobBlock(id=block_id) for block_id in list(committed_block_ids) + [x for x, _ in blocks]]
+        properties = self.blob_obj.put_block_list(container_name=self.container_name, blob_name=blob_prefix + blob_name,
+                                                  block_list=block_list)
+        return properties.etag if properties else None
+
+    def get_blob_bytes(self, blob_name, blob_prefix=""):
+        return self.blob_obj.get_blob_to_bytes(container_name=self.container_name,
+                                               blob_name=blob_prefix + blob_name).content
+
+    def get_blob_etag(self, file_name, blob_prefix=""):
+        return self.blob_obj.get_blob_properties(container_name=self.container_name,
+                                                 blob_name=blob_prefix + file_name).properties.etag
 
-    def upload_file_to_blob(self, local_path, file_name):
-        print("Uploading Local Data File [{file}] to BLOB".format(file=file_name))
-        self.blob_obj.create_blob_from_path(container_name=self.container_name, blob_name=file_name,
-                                            file_path=os.path.join(local_path, file_name))
+    def delete_blob(self, blob_name, blob_prefix=""):
+        self.blob_obj.delete_blob(container_name=self.container_name, blob_name=blob_prefix + blob_name)
 
-    def download_files_from_blob(self, local_path, file_name):
-        print("Downloading Data File: [{file}] from BLOB".format(file=file_name))
-        self.blob_obj.get_blob_to_path(container_name=self.container_name, blob_name=file_name,
-                                       file_path=os.path.join(local_path, file_name))
+    def list_blob_names(self, prefix=None):
+        return [blob.name for blob in self.blob_obj.list_blobs(container_name=self.container_name, prefix=prefix)]
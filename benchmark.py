@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from mock_smart_meter_server import MockSmartMeterServer
+
+BENCHMARK_RESULTS_PATH = "benchmark_results"
+DEFAULT_METER_COUNTS = [1, 10, 100]
+BENCHMARK_METRICS = ["RUN_WALL_SECONDS", "REQUEST_COUNT", "BYTES_TRANSFERRED", "CONNECTIONS_OPENED",
+                     "STORAGE_WRITE_SECONDS", "DASHBOARD_RENDER_SECONDS"]
+# Cold Start of a Fresh Interpreter for each Entry Point
+STARTUP_COMMANDS = {"CLI_HELP_SECONDS": ["cli.py", "--help"],
+                    "RUNNER_IMPORT_SECONDS": ["-c", "import runner"],
+                    "DASHBOARD_IMPORT_SECONDS": ["-c", "import render_dashboard"]}
+STARTUP_REPEATS = 3
+
+
+class StageTimer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.seconds = 0.0
+
+    # Wrap a Function so the Time spent inside it is added to this Timer; a Wrapped Call made from inside
+    # another one (a write_file that Commits its own Batch) is only counted once
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            depth = getattr(self.local, "depth", 0)
+            self.local.depth = depth + 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.local.depth = depth
+                if not depth:
+                    with self.lock:
+                        self.seconds += time.perf_counter() - start
+        return timed
+
+
+def _git_label():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception as e:
+        return "working-tree"
+
+
+def run_fetch(num_meters, work_path, latency, error_rate, odr_delay, max_workers):
+    import data_commit
+    import fleet_runner
+    import meter_session_manager
+    import meter_transport
+    import odr_scheduler
+    import request_scheduler
+    import runner
+
+    server = MockSmartMeterServer(latency=latency, error_rate=error_rate, odr_delay=odr_delay).start()
+    meter_session_manager.api_config['API_ENDPOINTS']['PORTAL_BASE'] = server.portal_base
+    meter_session_manager.api_config['API_ENDPOINTS']['API_BASE'] = server.api_base
+    odr_scheduler.ODR_POLL_BASE_DELAY = max(0.1, odr_delay / 2)
+    runner.data_file_path = work_path
+    # A Fresh Pool per Scenario, so Connections Opened are counted for this Run only
+    transport = meter_transport.MeterTransport()
+    meter_transport._default_transport = transport
+    # The Portal's Rate Limits do not apply to the Mock: Requests still go through a Scheduler, without Limits
+    request_scheduler._default_scheduler = request_scheduler.RequestScheduler(
+        max_concurrency=float("inf"), requests_per_minute=float("inf"), endpoint_concurrency=float("inf"),
+        endpoint_requests_per_minute=float("inf"))
+
+    # Storage Time is Staging and Committing Files: Modules that imported write_file by Name still Stage through
+    # WriteBatch, and a Commit runs the Store Appends deferred to it
+    storage_timer = StageTimer()
+    patched = [(data_commit, "write_file"), (data_commit.WriteBatch, "stage"), (data_commit.WriteBatch, "commit")]
+    originals = [(owner, name, getattr(owner, name)) for owner, name in patched]
+    for owner, name, func in originals:
+        setattr(owner, name, storage_timer.wrap(func))
+    meters = [{"METER_NAME": "meter_{:03d}".format(i), "USERNAME": "bench_user_{}".format(i), "PASSWORD": "bench"}
+              for i in range(num_meters)]
+    try:
+        start = time.perf_counter()
+        failed = fleet_runner.fetch_fleet(meters, max_workers=max_workers)
+        wall_seconds = time.perf_counter() - start
+    finally:
+        for owner, name, func in originals:
+            setattr(owner, name, func)
+        server.stop()
+    stats = server.state.stats()
+    return {"RUN_WALL_SECONDS": round(wall_seconds, 3),
+            "REQUEST_COUNT": stats["REQUEST_COUNT"],
+            "BYTES_TRANSFERRED": stats["BYTES_IN"] + stats["BYTES_OUT"],
+            "CONNECTIONS_OPENED": transport.stats()["CONNECTIONS_OPENED"],
+            "STORAGE_WRITE_SECONDS": round(storage_timer.seconds, 3),
+            "FAILED_METERS": len(failed),
+            "ROUTES": stats["ROUTES"]}, os.path.join(work_path, meters[0]["METER_NAME"])
+
+
+# Render the Dashboard Script for one Meter; the Second (Warm) Render is the per-Viewer Cost
+def run_render(meter_path, work_path):
+    render_path = os.path.join(work_path, "render")
+    blob_path = os.path.join(work_path, "blob")
+    shutil.copytree(meter_path, os.path.join(render_path, "data_files"))
+    shutil.copytree(meter_path, os.path.join(blob_path, "bench"))
+    env_overrides = {"FETCH_SECRETS_FROM_ENVIRONMENT": "1", "BLOB_ACCOUNT_NAME": "bench",
+                     "BLOB_ACCOUNT_KEY": "bench", "BLOB_CONTAINER_NAME": "bench", "BLOB_LOCAL_PATH": blob_path}
+    saved_env = {x: os.environ.get(x) for x in env_overrides}
+    os.environ.update(env_overrides)
+    script = os.path.abspath("render_dashboard.py")
+    cwd = os.getcwd()
+    timings = list()
+    try:
+        os.chdir(render_path)
+        for _ in range(2):
+            start = time.perf_counter()
+            runpy.run_path(script, run_name="__main__")
+            timings.append(time.perf_counter() - start)
+    except Exception as e:
+        print("Dashboard Render Failed: {}".format(e))
+        return None, None
+    finally:
+        os.chdir(cwd)
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return round(timings[0], 3), round(timings[1], 3)
+
+
+# Median Wall Time of each Entry Point in a New Process (Imports included)
+def run_startup():
+    results = dict()
+    for metric, command in STARTUP_COMMANDS.items():
+        timings = list()
+        for _ in range(STARTUP_REPEATS):
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable] + command, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        results[metric] = round(sorted(timings)[len(timings) // 2], 3) if completed.returncode == 0 else None
+    return results
+
+
+def run_benchmark(meter_counts, latency, error_rate, odr_delay, max_workers, render=True):
+    results = dict()
+    for num_meters in meter_counts:
+        print("=" * 30)
+        print("Benchmarking [{}] Meters".format(num_meters))
+        work_path = tempfile.mkdtemp(prefix="meter_bench_")
+        try:
+            result, first_meter_path = run_fetch(num_meters, work_path, latency, error_rate, odr_delay, max_workers)
+            if render:
+                result["DASHBOARD_COLD_RENDER_SECONDS"], result["DASHBOARD_RENDER_SECONDS"] = \
+                    run_render(first_meter_path, work_path)
+        finally:
+            shutil.rmtree(work_path, ignore_errors=True)
+        results[str(num_meters)] = result
+    return results
+
+
+def print_results(results):
+    print("=" * 30)
+    print("{:>8} ".format("METERS") + " ".join("{:>26}".format(x) for x in BENCHMARK_METRICS))
+    for num_meters, result in results.items():
+        print("{:>8} ".format(num_meters) + " ".join("{:>26}".format(str(result.get(x))) for x in BENCHMARK_METRICS))
+
+
+def print_startup(startup):
+    print("=" * 30)
+    for metric, value in startup.items():
+        print("{:>26} {:>10}".format(metric, str(value)))
+
+
+def compare_results(old_file, new_file):
+    with open(old_file) as f:
+        old_run = json.load(f)
+    with open(new_file) as f:
+        new_run = json.load(f)
+    old_results, new_results = old_run["RESULTS"], new_run["RESULTS"]
+    old_results["STARTUP"], new_results["STARTUP"] = old_run.get("STARTUP", {}), new_run.get("STARTUP", {})
+    print("{:>8} {:>26} {:>14} {:>14} {:>9}".format("METERS", "METRIC", "OLD", "NEW", "CHANGE"))
+    for num_meters in new_results:
+        if num_meters not in old_results:
+            continue
+        for metric in BENCHMARK_METRICS + list(STARTUP_COMMANDS):
+            old_value, new_value = old_results[num_meters].get(metric), new_results[num_meters].get(metric)
+            if old_value is None or new_value is None:
+                continue
+            change = "{:+.1%}".format((new_value - old_value) / old_value) if old_value else "n/a"
+            print("{:>8} {:>26} {:>14} {:>14} {:>9}".format(num_meters, metric, old_value, new_value, change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-End Throughput Benchmark against the Mock Portal")
+    parser.add_argument("--meters", type=int, nargs="+", default=DEFAULT_METER_COUNTS)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock Portal Latency per Request (Seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of Requests failing with HTTP 500")
+    parser.add_argument("--odr-delay", type=float, default=2.0, help="Seconds until an On Demand Read Completes")
+    parser.add_argument("--workers", type=int, default=32, help="Fleet Worker Threads")
+    parser.add_argument("--no-render", action="store_true", help="Skip the Dashboard Render Timing")
+    parser.add_argument("--label", default=None, help="Result Label (defaults to the Git Commit)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD_JSON", "NEW_JSON"))
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare_results(*args.compare)
+        return 0
+    label = args.label or _git_label()
+    startup_results = run_startup()
+    print_startup(startup_results)
+    benchmark_results = run_benchmark(args.meters, args.latency, args.error_rate, args.odr_delay, args.workers,
+                                      render=not args.no_render)
+    print_results(benchmark_results)
+    os.makedirs(BENCHMARK_RESULTS_PATH, exist_ok=True)
+    results_file = os.path.join(BENCHMARK_RESULTS_PATH, "{}.json".format(label))
+    with open(results_file, "w") as f:
+        json.dump({"LABEL": label, "SETTINGS": vars(args), "STARTUP": startup_results,
+                   "RESULTS": benchmark_results}, f, indent=1, sort_keys=True)
+    print("Results written to [{}]".format(results_file))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
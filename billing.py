@@ -0,0 +1,205 @@
+import configparser
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_commit import write_file, write_frame
+from data_layout import BILL_CYCLE_DATAFILE, BILL_PROJECTION_DATAFILE
+
+TARIFF_CONFIG_FILE = os.getenv("TARIFF_CONFIG_FILE", "tariff.ini")
+PERIOD_SECTION_PREFIX = "PERIOD:"
+BASE_PERIOD = "BASE"
+# Expected Days between Bills; the Billed Reading is not asked for again before the Next one is Due
+BILL_CYCLE_DAYS = int(os.getenv("BILL_CYCLE_DAYS", 30))
+# How often a Bill that is Due but not Published yet is looked for
+BILL_RECHECK_HOURS = int(os.getenv("BILL_RECHECK_HOURS", 12))
+# Usage over a longer Gap between Readings is spread over the Periods by the Usage Profile
+BILL_MAX_GAP_HOURS = 6
+# Days of Interval Usage that give the Share of each Tariff Period in the Projection
+PROFILE_DAYS = 14
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+WEEKDAY_SETS = {"ALL": set(range(7)), "WEEKDAY": set(range(5)), "WEEKEND": {5, 6}}
+
+
+# Tiered Energy Rates plus Time-of-Use Adders per Period, read from tariff.ini
+class Tariff:
+    def __init__(self, base_charge=0.0, tier_bounds=(), tier_rates=(0.0,), periods=None):
+        assert len(tier_rates) == len(tier_bounds) + 1, "One more Tier Rate than Tier Bounds is expected"
+        self.base_charge = base_charge
+        self.tier_bounds = np.array([0.0] + list(tier_bounds) + [np.inf])
+        self.tier_rates = np.array(tier_rates, dtype='float64')
+        # Period Name -> (Start Hour, End Hour, Weekdays, Rate Adder); the First Matching Period wins
+        self.periods = periods or dict()
+
+    @classmethod
+    def from_config(cls, config_file=TARIFF_CONFIG_FILE):
+        if not os.path.exists(config_file):
+            return None
+        tariff_config = configparser.ConfigParser()
+        tariff_config.optionxform = str
+        tariff_config.read(config_file)
+        tariff = tariff_config['TARIFF']
+        tier_bounds = [float(x) for x in tariff.get('TIER_BOUNDS', '').split(',') if x.strip()]
+        tier_rates = [float(x) for x in tariff.get('TIER_RATES', '0').split(',') if x.strip()]
+        periods = dict()
+        for section in tariff_config.sections():
+            if not section.startswith(PERIOD_SECTION_PREFIX):
+                continue
+            start_hour, end_hour = (int(x) for x in tariff_config[section]['HOURS'].split('-'))
+            weekdays = WEEKDAY_SETS[tariff_config[section].get('DAYS', 'ALL').upper()]
+            periods[section[len(PERIOD_SECTION_PREFIX):]] = (start_hour, end_hour, weekdays,
+                                                             float(tariff_config[section]['RATE_ADDER']))
+        return cls(float(tariff.get('BASE_CHARGE', 0)), tier_bounds, tier_rates, periods)
+
+    # Tariff Period of every Timestamp at once
+    def period_of(self, times):
+        times = pd.DatetimeIndex(times)
+        hours, weekdays = times.hour.values, times.dayofweek.values
+        period = np.full(len(times), BASE_PERIOD, dtype=object)
+        for name, (start_hour, end_hour, days, _) in reversed(list(self.periods.items())):
+            # A Window like 21-6 wraps around Midnight
+            in_hours = (hours >= start_hour) & (hours < end_hour) if start_hour < end_hour \
+                else (hours >= start_hour) | (hours < end_hour)
+            period[in_hours & np.isin(weekdays, list(days))] = name
+        return period
+
+    def cost(self, kwh_by_period):
+        total_kwh = sum(kwh_by_period.values())
+        in_tier = np.clip(total_kwh - self.tier_bounds[:-1], 0, np.diff(self.tier_bounds))
+        adders = sum(kwh * self.periods[name][3] for name, kwh in kwh_by_period.items() if name in self.periods)
+        return self.base_charge + float(np.dot(in_tier, self.tier_rates)) + adders
+
+
+# Share of Usage per Tariff Period in the Recent Interval Data
+def period_shares(tariff, interval_usage):
+    if tariff is None or interval_usage is None or interval_usage.empty or not interval_usage['USAGE'].sum() > 0:
+        return {BASE_PERIOD: 1.0}
+    usage = interval_usage['USAGE'].values.astype('float64')
+    # A 15 Minute Interval is labelled with its End Time
+    periods = tariff.period_of(pd.to_datetime(interval_usage['USAGE_TIME']) - pd.Timedelta(minutes=1))
+    shares = pd.Series(usage).groupby(periods).sum() / np.nansum(usage)
+    return shares.to_dict()
+
+
+# Per-Cycle kWh per Tariff Period, advanced by each new Reading
+class BillCycle:
+    def __init__(self, state=None):
+        state = state or {}
+        self.cycle_start = state.get("cycle_start")
+        self.start_reading = state.get("start_reading")
+        self.last_time = pd.Timestamp(state["last_time"]) if state.get("last_time") else None
+        self.last_reading = state.get("last_reading")
+        self.kwh_by_period = state.get("kwh_by_period", {})
+
+    def update(self, billed_date, billed_reading, reading_time, meter_reading, tariff=None, shares=None):
+        shares = shares or {BASE_PERIOD: 1.0}
+        billed_date = pd.Timestamp(billed_date).strftime("%Y-%m-%d")
+        reading_time = pd.Timestamp(reading_time)
+        if self.cycle_start != billed_date:
+            # A New Bill opened a New Cycle: the Usage since its Start Reading is spread by the Profile
+            self.cycle_start, self.start_reading = billed_date, float(billed_reading)
+            self.last_time, self.last_reading, self.kwh_by_period = None, float(billed_reading), dict()
+        elif self.last_time is not None and reading_time <= self.last_time:
+            return False
+        delta = float(meter_reading) - self.last_reading
+        if delta > 0:
+            gap_hours = (reading_time - self.last_time).total_seconds() / 3600 if self.last_time is not None \
+                else None
+            if tariff is not None and gap_hours is not None and gap_hours <= BILL_MAX_GAP_HOURS:
+                period = tariff.period_of([reading_time - pd.Timedelta(hours=gap_hours / 2)])[0]
+                self._add(period, delta)
+            else:
+                for period, share in shares.items():
+                    self._add(period, delta * share)
+        # A Meter Reset only moves the Baseline
+        self.last_time, self.last_reading = reading_time, float(meter_reading)
+        return True
+
+    def _add(self, period, kwh):
+        self.kwh_by_period[period] = self.kwh_by_period.get(period, 0.0) + kwh
+
+    def usage(self):
+        return sum(self.kwh_by_period.values())
+
+    # Run-Rate of the Cycle so far over the Remaining Days, split by the Recent Usage Profile
+    def project(self, tariff=None, shares=None, cycle_days=BILL_CYCLE_DAYS):
+        shares = shares or {BASE_PERIOD: 1.0}
+        cycle_start = pd.Timestamp(self.cycle_start)
+        next_bill_date = cycle_start + pd.Timedelta(days=cycle_days)
+        elapsed_days = max((self.last_time - cycle_start).total_seconds() / 86400, 1 / 24) \
+            if self.last_time is not None else None
+        remaining_days = max((next_bill_date - self.last_time).total_seconds() / 86400, 0) \
+            if self.last_time is not None else cycle_days
+        remaining_kwh = self.usage() / elapsed_days * remaining_days if elapsed_days else 0.0
+        projected_by_period = dict(self.kwh_by_period)
+        for period, share in shares.items():
+            projected_by_period[period] = projected_by_period.get(period, 0.0) + remaining_kwh * share
+        return {"CYCLE_START": self.cycle_start,
+                "NEXT_BILL_DATE": next_bill_date.strftime("%Y-%m-%d"),
+                "DAYS_REMAINING": round(remaining_days, 1),
+                "CYCLE_USAGE": round(self.usage(), 3),
+                "PROJECTED_USAGE": round(sum(projected_by_period.values()), 3),
+                "CYCLE_COST": round(tariff.cost(self.kwh_by_period), 2) if tariff else None,
+                "PROJECTED_COST": round(tariff.cost(projected_by_period), 2) if tariff else None}
+
+    def to_dict(self):
+        return {"cycle_start": self.cycle_start, "start_reading": self.start_reading,
+                "last_time": self.last_time.strftime(TIME_FORMAT) if self.last_time is not None else None,
+                "last_reading": self.last_reading,
+                "kwh_by_period": {k: round(v, 6) for k, v in sorted(self.kwh_by_period.items())}}
+
+
+def _read_json(state_file):
+    if os.path.exists(state_file):
+        try:
+            with open(state_file) as f:
+                return json.load(f)
+        except ValueError:
+            print("Discarding Unreadable Bill Cycle: [{}]".format(state_file))
+    return None
+
+
+# The Stored Billed Reading while no New Bill can be Due yet (None when the Portal should be asked)
+def cached_billed_reading(billed_file, now=None):
+    if not os.path.exists(billed_file):
+        return None
+    billed = pd.read_csv(billed_file)
+    if billed.empty or 'LAST_BILLED_DATE' not in billed.columns:
+        return None
+    now = pd.Timestamp(now or datetime.datetime.now())
+    last_billed_date = pd.Timestamp(billed['LAST_BILLED_DATE'][0])
+    next_check = pd.Timestamp(billed['NEXT_BILL_CHECK'][0]) if 'NEXT_BILL_CHECK' in billed.columns \
+        and not pd.isna(billed['NEXT_BILL_CHECK'][0]) else last_billed_date + pd.Timedelta(days=BILL_CYCLE_DAYS)
+    if now >= next_check:
+        return None
+    return {"LAST_BILLED_DATE": last_billed_date.to_pydatetime(),
+            "LAST_BILLED_READING": int(billed['LAST_BILLED_READING'][0]),
+            "NEXT_BILL_CHECK": next_check.strftime(TIME_FORMAT)}
+
+
+# When the Portal should next be asked for the Billed Reading
+def next_bill_check(last_billed_date, now=None):
+    now = pd.Timestamp(now or datetime.datetime.now())
+    next_check = pd.Timestamp(last_billed_date) + pd.Timedelta(days=BILL_CYCLE_DAYS)
+    if next_check <= now:
+        # The Bill is Due but not Published yet: look again in a while, not on every Run
+        next_check = now + pd.Timedelta(hours=BILL_RECHECK_HOURS)
+    return next_check.strftime(TIME_FORMAT)
+
+
+# Advance the Cycle Totals with the New Reading and write the Projection; Committed with the Reading
+def update_bill_projection(file_path, latest_billed_data, reading_time, meter_reading, interval_usage=None,
+                           tariff=None):
+    state_file = os.path.join(file_path, BILL_CYCLE_DATAFILE)
+    bill_cycle = BillCycle(_read_json(state_file))
+    shares = period_shares(tariff, interval_usage)
+    if not bill_cycle.update(latest_billed_data["LAST_BILLED_DATE"], latest_billed_data["LAST_BILLED_READING"],
+                             reading_time, meter_reading, tariff, shares):
+        return None
+    write_file(state_file, json.dumps(bill_cycle.to_dict(), sort_keys=True))
+    projection = bill_cycle.project(tariff, shares)
+    write_frame(pd.DataFrame(projection, index=[0]), os.path.join(file_path, BILL_PROJECTION_DATAFILE))
+    return projection
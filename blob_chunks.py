@@ -0,0 +1,240 @@
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from blob_sync import BLOB_SYNC_MAX_WORKERS
+from metrics import metrics
+from series_store import INDEX_FILE, TIME_COLUMN_DTYPE, VALUE_COLUMN_DTYPE, SeriesStore
+
+# Closed Partitions go to Immutable, Content-Addressed Chunks shared by all Stores of a Meter
+CHUNK_PREFIX = "chunks/"
+CHUNK_SUFFIX = ".gz"
+# Per Store in BLOB: the Manifest mapping Partitions to Chunk Hashes, and the Head Segment per Column
+CHUNK_MANIFEST_FILE = "chunks.json"
+# The Head Blob is named by its Partition: a Reader holding the previous Manifest never gets the next Month
+HEAD_BLOB_FORMAT = "head/{}/{}.gz"
+# Local Record of what was Uploaded / Downloaded, kept inside the Store
+CHUNK_SYNC_STATE_FILE = ".chunk_sync.json"
+BLOCK_SIZE = 4 * 1024 * 1024
+# The Head is re-written in One Block once its Appended Blocks pile up (Azure allows 50,000)
+HEAD_MAX_BLOCKS = 1000
+# Months of Closed Partitions a New Node pulls (0 pulls the whole History)
+BLOB_BOOTSTRAP_MONTHS = int(os.getenv("BLOB_BOOTSTRAP_MONTHS", 0))
+
+
+def _compress(data):
+    # No Timestamp in the Header: the same Bytes always give the same Chunk
+    return gzip.compress(data, mtime=0)
+
+
+def _block_id(n):
+    # Block IDs of a Blob must all have the same Length
+    return "{:06d}".format(n)
+
+
+def _write_atomic(local_file_name, data):
+    with open(local_file_name + ".tmp", "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(local_file_name + ".tmp", local_file_name)
+
+
+# Delta Sync of one Series Store: only New Chunks and the Bytes Appended to the Head are Sent
+class ChunkedStoreSync:
+    def __init__(self, blob_obj, store, store_name, blob_prefix="", max_workers=BLOB_SYNC_MAX_WORKERS):
+        self.blob_obj = blob_obj
+        self.store = store
+        self.store_name = store_name
+        self.blob_prefix = blob_prefix
+        self.max_workers = max_workers
+        self.state_file = os.path.join(store.store_path, CHUNK_SYNC_STATE_FILE)
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file) as f:
+                    return json.load(f)
+            except ValueError:
+                print("Discarding Unreadable Chunk Sync State: [{}]".format(self.state_file))
+        return {"manifest": None, "head": {}}
+
+    def _save_state(self):
+        _write_atomic(self.state_file, json.dumps(self.state, sort_keys=True, indent=1).encode())
+
+    def _store_blob(self, file_name):
+        return self.store_name + "/" + file_name
+
+    def _column_bytes(self, partition, column, dtype):
+        rows = self.store.index["partitions"][partition]
+        with open(self.store._column_file(partition, column, dtype), "rb") as f:
+            # Only Indexed Rows: a Torn Tail beyond them is never Sent
+            return f.read(rows * dtype.itemsize)
+
+    def _columns(self):
+        return [(self.store.time_col, TIME_COLUMN_DTYPE), (self.store.value_col, VALUE_COLUMN_DTYPE)]
+
+    def _put_blocks(self, blob_name, data, committed_block_ids=()):
+        blocks = [(_block_id(len(committed_block_ids) + i), data[x:x + BLOCK_SIZE])
+                  for i, x in enumerate(range(0, max(len(data), 1), BLOCK_SIZE))]
+        self.blob_obj.put_blob_blocks(blob_name, blocks, committed_block_ids, blob_prefix=self.blob_prefix)
+        metrics.inc("blob_bytes_total", len(data), direction="upload")
+        return list(committed_block_ids) + [block_id for block_id, _ in blocks]
+
+    def _chunk_exists(self, chunk_hash):
+        try:
+            self.blob_obj.get_blob_etag(CHUNK_PREFIX + chunk_hash + CHUNK_SUFFIX, blob_prefix=self.blob_prefix)
+            return True
+        except Exception as e:
+            return False
+
+    def _upload_chunk(self, partition, column, dtype, known_chunks, force=False):
+        data = self._column_bytes(partition, column, dtype)
+        chunk_hash = hashlib.sha256(data).hexdigest()
+        # Content-Addressed: a Chunk already in BLOB (from this or any other Node) is never Sent again
+        if force or (chunk_hash not in known_chunks and not self._chunk_exists(chunk_hash)):
+            self._put_blocks(CHUNK_PREFIX + chunk_hash + CHUNK_SUFFIX, _compress(data))
+        return chunk_hash
+
+    # Appended Bytes go up as a New Block after the Committed ones; anything else re-writes the Head
+    def _upload_head(self, partition, column, dtype):
+        data = self._column_bytes(partition, column, dtype)
+        blob_name = self._store_blob(HEAD_BLOB_FORMAT.format(partition, column))
+        head = self.state["head"].get(column)
+        if head and head["partition"] == partition and head["bytes"] <= len(data) \
+                and len(head["blocks"]) < HEAD_MAX_BLOCKS:
+            if head["bytes"] == len(data):
+                return head
+            # Gzip Members can be Concatenated: the Head Blob stays one Valid Compressed Stream
+            blocks = self._put_blocks(blob_name, _compress(data[head["bytes"]:]), head["blocks"])
+        else:
+            blocks = self._put_blocks(blob_name, _compress(data))
+        return {"partition": partition, "bytes": len(data), "blocks": blocks}
+
+    # Full re-sends every Local Chunk and the Head; the Partitions listed in BLOB are Merged in either way
+    def upload(self, full=False):
+        if full:
+            self.state["head"] = dict()
+        partitions = sorted(self.store.index["partitions"])
+        if not partitions:
+            return 0
+        closed, head_partition = partitions[:-1], partitions[-1]
+        # The Manifest in BLOB is the Base (the Local Record only stands in when it cannot be Read): a Node that
+        # pulled part of the History, or just Migrated its Store, never drops or misses a Partition
+        remote = self._read_remote_manifest() or self.state.get("manifest") or {"partitions": {}}
+        known_chunks = {chunk_hash for entry in remote["partitions"].values()
+                        for chunk_hash in entry["columns"].values()}
+        manifest = {"time_col": self.store.time_col, "value_col": self.store.value_col,
+                    "last_time": self.store.index["last_time"],
+                    # Partitions only in BLOB (a Node that pulled part of the History) are kept
+                    "partitions": {p: entry for p, entry in remote["partitions"].items() if p not in partitions}}
+        rows = self.store.index["partitions"]
+
+        def is_current(partition):
+            return partition in remote["partitions"] and remote["partitions"][partition]["rows"] == rows[partition]
+
+        pending = [(partition, column, dtype) for partition in closed for column, dtype in self._columns()
+                   if full or not is_current(partition)]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pending) or 1))) as executor:
+            hashes = list(executor.map(lambda x: self._upload_chunk(*x, known_chunks, force=full), pending))
+        for partition in closed:
+            manifest["partitions"][partition] = dict(remote["partitions"][partition]) if is_current(partition) \
+                else {"rows": rows[partition], "columns": {}}
+        for (partition, column, _), chunk_hash in zip(pending, hashes):
+            manifest["partitions"][partition]["columns"][column] = chunk_hash
+        for column, dtype in self._columns():
+            self.state["head"][column] = self._upload_head(head_partition, column, dtype)
+        manifest["head"] = {"partition": head_partition, "rows": rows[head_partition],
+                            "columns": {column: HEAD_BLOB_FORMAT.format(head_partition, column)
+                                        for column, _ in self._columns()}}
+        # The Manifest goes Last: a Reader never sees a Partition whose Chunks are not in BLOB yet
+        if manifest != remote:
+            manifest_bytes = json.dumps(manifest, sort_keys=True).encode()
+            self._put_blocks(self._store_blob(CHUNK_MANIFEST_FILE), manifest_bytes)
+        self.state["manifest"] = manifest
+        self._save_state()
+        self._delete_rolled_heads(remote, manifest)
+        print("Uploaded [{}] New Chunks of Store [{}] to BLOB".format(len(pending), self.store_name))
+        return len(pending)
+
+    # The Head of a Month that Rolled Over is Deleted once the Manifest lists that Month as a Chunk
+    def _delete_rolled_heads(self, remote, manifest):
+        old_head = remote.get("head")
+        if not old_head or old_head["partition"] == manifest["head"]["partition"] \
+                or old_head["partition"] not in manifest["partitions"]:
+            return
+        for blob_name in old_head["columns"].values():
+            try:
+                self.blob_obj.delete_blob(self._store_blob(blob_name), blob_prefix=self.blob_prefix)
+            except Exception as e:
+                print("Failed to Delete Head: [{}] from BLOB: {}".format(blob_name, e))
+
+    def _read_remote_manifest(self):
+        try:
+            return json.loads(self.blob_obj.get_blob_bytes(self._store_blob(CHUNK_MANIFEST_FILE),
+                                                           blob_prefix=self.blob_prefix))
+        except Exception as e:
+            return None
+
+    def _download_blob(self, blob_name):
+        compressed = self.blob_obj.get_blob_bytes(blob_name, blob_prefix=self.blob_prefix)
+        metrics.inc("blob_bytes_total", len(compressed), direction="download")
+        return gzip.decompress(compressed)
+
+    def _download_chunk(self, partition, column, dtype, chunk_hash, rows):
+        local_file_name = self.store._column_file(partition, column, dtype)
+        if os.path.exists(local_file_name) and os.path.getsize(local_file_name) == rows * dtype.itemsize:
+            with open(local_file_name, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() == chunk_hash:
+                    return False
+        data = self._download_blob(CHUNK_PREFIX + chunk_hash + CHUNK_SUFFIX)
+        assert hashlib.sha256(data).hexdigest() == chunk_hash, "Corrupt Chunk: [{}]".format(chunk_hash)
+        os.makedirs(os.path.dirname(local_file_name), exist_ok=True)
+        _write_atomic(local_file_name, data)
+        return True
+
+    # Pull the Chunks this Node is Missing (None when the Store is not in the Chunked Layout)
+    def download(self, months=BLOB_BOOTSTRAP_MONTHS):
+        manifest = self._read_remote_manifest()
+        if manifest is None:
+            return None
+        if manifest == self.state.get("manifest"):
+            return 0
+        closed = sorted(manifest["partitions"])
+        wanted = closed[-months:] if months else closed
+        pending = [(partition, column, dtype, manifest["partitions"][partition]["columns"][column],
+                    manifest["partitions"][partition]["rows"])
+                   for partition in wanted for column, dtype in self._columns()]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pending) or 1))) as executor:
+            downloaded = sum(executor.map(lambda x: self._download_chunk(*x), pending))
+        head = manifest["head"]
+        self.state["head"] = dict()
+        for column, dtype in self._columns():
+            local_file_name = self.store._column_file(head["partition"], column, dtype)
+            os.makedirs(os.path.dirname(local_file_name), exist_ok=True)
+            _write_atomic(local_file_name, self._download_blob(self._store_blob(head["columns"][column])))
+        # The Local Index covers the Pulled Partitions; the Rest stays listed in the Manifest only
+        index = {"last_time": manifest["last_time"],
+                 "partitions": dict({p: manifest["partitions"][p]["rows"] for p in wanted},
+                                    **{head["partition"]: head["rows"]})}
+        _write_atomic(os.path.join(self.store.store_path, INDEX_FILE), json.dumps(index, sort_keys=True).encode())
+        self.store.index = index
+        self.state["manifest"] = manifest
+        self._save_state()
+        print("Downloaded [{}] Chunks of Store [{}] from BLOB".format(downloaded, self.store_name))
+        return downloaded + len(self._columns())
+
+
+def upload_store(blob_obj, store_path, store_name, blob_prefix="", full=False, time_col="READING_TIME",
+                 value_col="METER_READING"):
+    store = SeriesStore(store_path, time_col=time_col, value_col=value_col)
+    return ChunkedStoreSync(blob_obj, store, store_name, blob_prefix).upload(full=full)
+
+
+def download_store(blob_obj, store_path, store_name, blob_prefix="", time_col="READING_TIME",
+                   value_col="METER_READING"):
+    store = SeriesStore(store_path, time_col=time_col, value_col=value_col)
+    return ChunkedStoreSync(blob_obj, store, store_name, blob_prefix).download()
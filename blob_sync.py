@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from data_commit import read_manifest
+from metrics import metrics
+
+BLOB_SYNC_MANIFEST = ".blob_manifest.json"
+BLOB_SYNC_MAX_WORKERS = int(os.getenv("BLOB_SYNC_MAX_WORKERS", 8))
+
+
+def file_md5(file_name):
+    md5 = hashlib.md5()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+# Concurrent Blob Transfers that Skip Files whose ETag / Content Hash is Unchanged
+class BlobSync:
+    def __init__(self, blob_obj, local_path, blob_prefix="", max_workers=BLOB_SYNC_MAX_WORKERS):
+        self.blob_obj = blob_obj
+        self.local_path = local_path
+        self.blob_prefix = blob_prefix
+        self.max_workers = max_workers
+        self.manifest_file = os.path.join(local_path, BLOB_SYNC_MANIFEST)
+        self.manifest_lock = threading.Lock()
+        self.manifest = self._load_manifest()
+        self.data_manifest = read_manifest(local_path)
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file) as f:
+                    return json.load(f)
+            except ValueError:
+                print("Discarding Unreadable Blob Manifest: [{}]".format(self.manifest_file))
+        return {}
+
+    def _save_manifest(self):
+        with self.manifest_lock:
+            tmp_file = self.manifest_file + ".tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(self.manifest, f, sort_keys=True, indent=1)
+            os.replace(tmp_file, self.manifest_file)
+
+    # Hash recorded when the File was Committed, as long as the File is untouched since
+    def _local_md5(self, file_name, local_file_name):
+        entry = self.data_manifest.get("files", {}).get(file_name)
+        if entry:
+            stat = os.stat(local_file_name)
+            if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+                return entry["md5"]
+        return file_md5(local_file_name)
+
+    def _record(self, file_name, etag, md5):
+        with self.manifest_lock:
+            self.manifest[file_name] = {"etag": etag, "md5": md5}
+
+    def _download_one(self, file_name):
+        local_file_name = os.path.join(self.local_path, file_name)
+        try:
+            etag = self.blob_obj.get_blob_etag(file_name, blob_prefix=self.blob_prefix)
+        except Exception as e:
+            print("Failed to Retrieve File: [{}] from BLOB".format(file_name))
+            return False
+        entry = self.manifest.get(file_name)
+        if entry and entry.get("etag") == etag and os.path.exists(local_file_name) \
+                and self._local_md5(file_name, local_file_name) == entry.get("md5"):
+            return False
+        os.makedirs(os.path.dirname(local_file_name), exist_ok=True)
+        try:
+            etag = self.blob_obj.download_files_from_blob(local_path=self.local_path, file_name=file_name,
+                                                          blob_prefix=self.blob_prefix) or etag
+        except Exception as e:
+            print("Failed to Retrieve File: [{}] from BLOB".format(file_name))
+            return False
+        self._record(file_name, etag, file_md5(local_file_name))
+        return True
+
+    def _upload_one(self, file_name):
+        local_file_name = os.path.join(self.local_path, file_name)
+        if not os.path.exists(local_file_name):
+            return False
+        md5 = self._local_md5(file_name, local_file_name)
+        entry = self.manifest.get(file_name)
+        if entry and entry.get("md5") == md5:
+            return False
+        try:
+            etag = self.blob_obj.upload_file_to_blob(local_path=self.local_path, file_name=file_name,
+                                                     blob_prefix=self.blob_prefix)
+        except Exception as e:
+            print("Failed to Upload File: [{}] to BLOB".format(file_name))
+            return False
+        self._record(file_name, etag, md5)
+        return True
+
+    def _run(self, func, file_names):
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(file_names)))) as executor:
+            transferred = list(executor.map(func, file_names))
+        self._save_manifest()
+        return [file_name for file_name, done in zip(file_names, transferred) if done]
+
+    def download(self, file_names):
+        file_names = list(file_names)
+        downloaded = self._run(self._download_one, file_names) if file_names else list()
+        print("Downloaded [{}] of [{}] Files from BLOB".format(len(downloaded), len(file_names)))
+        metrics.inc("blob_files_total", len(downloaded), direction="download")
+        return downloaded
+
+    def upload(self, file_names):
+        file_names = list(file_names)
+        uploaded = self._run(self._upload_one, file_names) if file_names else list()
+        print("Uploaded [{}] of [{}] Files to BLOB".format(len(uploaded), len(file_names)))
+        metrics.inc("blob_files_total", len(uploaded), direction="upload")
+        return uploaded
+
+    # One Metadata Call: True when the Local Copy matches the Remote ETag
+    def is_current(self, file_name):
+        entry = self.manifest.get(file_name)
+        if not entry or not os.path.exists(os.path.join(self.local_path, file_name)):
+            return False
+        try:
+            return self.blob_obj.get_blob_etag(file_name, blob_prefix=self.blob_prefix) == entry.get("etag")
+        except Exception as e:
+            return False
+
+    def list_remote(self, prefix):
+        return [blob_name[len(self.blob_prefix):]
+                for blob_name in self.blob_obj.list_blob_names(prefix=self.blob_prefix + prefix)]
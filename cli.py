@@ -0,0 +1,114 @@
+import argparse
+import os
+import sys
+import time
+
+# Only the Standard Library is imported here; each Command loads the Modules it needs
+CLI_START_TIME = time.perf_counter()
+
+
+def _record_startup(command):
+    from metrics import metrics
+    startup_seconds = time.perf_counter() - CLI_START_TIME
+    metrics.observe("startup_seconds", startup_seconds, command=command)
+    print("Startup for [{}] took [{:.2f}] Seconds".format(command, startup_seconds))
+
+
+def fetch(args):
+    if args.daemon:
+        import meter_daemon
+        _record_startup("daemon")
+        meter_daemon.MeterDaemon(meter_daemon.build_workers(fleet=args.fleet)).run_forever()
+        return 0
+    if args.fleet:
+        import fleet_runner
+        _record_startup("fetch")
+        return 1 if fleet_runner.run_fleet() else 0
+    import runner
+    _record_startup("fetch")
+    runner.run_fetch()
+    return 0
+
+
+def sync(args):
+    import data_sync
+    _record_startup("sync")
+    if args.direction == "download":
+        data_sync.download_all_files_from_blob()
+    else:
+        data_sync.upload_all_files_to_blob(full_stores=args.full_stores)
+    return 0
+
+
+def backfill(args):
+    import interval_backfill
+    _record_startup("backfill")
+    interval_backfill.run_backfill(args.num_days if args.num_days else interval_backfill.BACKFILL_DAYS)
+    return 0
+
+
+def render(args):
+    from streamlit import cli as streamlit_cli
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "render_dashboard.py")
+    sys.argv = ["streamlit", "run", script] + args.streamlit_args
+    return streamlit_cli.main()
+
+
+def snapshots(args):
+    import render_service
+    _record_startup("snapshots")
+    if args.watch:
+        render_service.run_forever(png=args.png)
+        return 0
+    render_service.render_all(png=args.png, force=args.force)
+    return 0
+
+
+def bench(args):
+    import benchmark
+    return benchmark.main(args.benchmark_args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Electricity Usage Monitoring")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    fetch_parser = commands.add_parser("fetch", help="Fetch the Latest Usage (One Run)")
+    fetch_parser.add_argument("--fleet", action="store_true", help="Fetch All Meters in the Fleet Config")
+    fetch_parser.add_argument("--daemon", action="store_true", help="Keep Running with per-Stage Cadences")
+    fetch_parser.set_defaults(func=fetch)
+
+    sync_parser = commands.add_parser("sync", help="Transfer Changed Data Files to or from BLOB")
+    sync_parser.add_argument("direction", choices=["download", "upload"])
+    sync_parser.add_argument("--full-stores", action="store_true", help="Upload Every Store Partition")
+    sync_parser.set_defaults(func=sync)
+
+    backfill_parser = commands.add_parser("backfill", help="Pull the 15 Minute Interval History (Resumable)")
+    backfill_parser.add_argument("num_days", type=int, nargs="?")
+    backfill_parser.set_defaults(func=backfill)
+
+    render_parser = commands.add_parser("render", help="Start the Streamlit Dashboard")
+    render_parser.add_argument("streamlit_args", nargs=argparse.REMAINDER)
+    render_parser.set_defaults(func=render)
+
+    snapshots_parser = commands.add_parser("snapshots", help="Render Standalone Dashboard Snapshots per Meter")
+    snapshots_parser.add_argument("--watch", action="store_true", help="Keep Rendering on each New Data Generation")
+    snapshots_parser.add_argument("--png", action="store_true", help="Also Export PNG Images (needs Selenium)")
+    snapshots_parser.add_argument("--force", action="store_true", help="Render even if the Data is Unchanged")
+    snapshots_parser.set_defaults(func=snapshots)
+
+    bench_parser = commands.add_parser("bench", help="Run the Throughput Benchmark against the Mock Portal")
+    bench_parser.add_argument("benchmark_args", nargs=argparse.REMAINDER)
+    bench_parser.set_defaults(func=bench)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    # Usage: python cli.py {fetch,sync,backfill,render,snapshots,bench} ...
+    sys.exit(main())
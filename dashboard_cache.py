@@ -0,0 +1,145 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# Seconds between Background Pulls of Changed Files from BLOB
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", 300))
+# Memory held by Cached Frames across all Meters; the Least Recently Viewed go first
+DASHBOARD_CACHE_MAX_MB = int(os.getenv("DASHBOARD_CACHE_MAX_MB", 256))
+# Meters kept Refreshed in the Background; Others are pulled again on their next View
+DASHBOARD_ACTIVE_METERS = int(os.getenv("DASHBOARD_ACTIVE_METERS", 16))
+
+
+# Approximate Memory of a Cached Object (Frames, Chart Layouts, and the Dicts / Lists built from them)
+def _object_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sum(_object_size(x) for x in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_object_size(x) for x in value)
+    if hasattr(value, "references"):
+        # Bokeh Layouts: the Column Data Sources they reach hold Full Copies of the Plotted Frames
+        return sys.getsizeof(value) + sum(int(pd.Series(column).memory_usage(deep=True))
+                                          for model in value.references() if type(model).__name__ == "ColumnDataSource"
+                                          for column in model.data.values())
+    return sys.getsizeof(value)
+
+
+# Process-Wide Frame Cache: Streamlit re-runs the Script per Viewer, but Imported Modules persist
+class FrameCache:
+    def __init__(self, max_bytes=DASHBOARD_CACHE_MAX_MB * 1024 * 1024):
+        self.frames = OrderedDict()
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        with self.lock:
+            cached = self.frames.get(key)
+            if cached is not None:
+                self.frames.move_to_end(key)
+        return cached
+
+    # Least Recently Used Entries are dropped until the Cache fits; the New Entry itself always stays
+    def _put(self, key, version, value):
+        size = _object_size(value)
+        with self.lock:
+            previous = self.frames.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous[2]
+            self.frames[key] = (version, value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self.frames) > 1:
+                _, (_, _, evicted_size) = self.frames.popitem(last=False)
+                self.total_bytes -= evicted_size
+        return value
+
+    def read_csv(self, local_file_name):
+        stat = os.stat(local_file_name)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._get(local_file_name)
+        df = cached[1] if cached is not None and cached[0] == version \
+            else self._put(local_file_name, version, pd.read_csv(local_file_name))
+        # Callers add Columns to the Frames they get, so hand out a Copy
+        return df.copy()
+
+    # Memoize a Derived Object until its Source Version changes
+    def get_or_compute(self, key, version, compute_func):
+        cached = self._get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        return self._put(key, version, compute_func())
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.total_bytes = 0
+
+
+# One Background Thread keeps the Recently Viewed Meters fresh, however many Meters are registered
+class BlobRefresher:
+    def __init__(self, ttl=DASHBOARD_CACHE_TTL, max_active=DASHBOARD_ACTIVE_METERS):
+        self.ttl = ttl
+        self.max_active = max_active
+        # Key -> [Refresh Function, Last Refresh Time], Most Recently Viewed Last
+        self.active = OrderedDict()
+        self.key_locks = dict()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _refresh(self, key, refresh_func):
+        try:
+            refresh_func()
+            return time.time()
+        except Exception as e:
+            print("Failed to Refresh Dashboard Data [{}]: {}".format(key, e))
+            return None
+
+    def ensure(self, key, refresh_func):
+        with self.lock:
+            if key in self.active:
+                self.active.move_to_end(key)
+                return
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        # The First Pull of a Meter is done inline so its first Page has Data to Render
+        with key_lock:
+            with self.lock:
+                if key in self.active:
+                    return
+            last_refresh = self._refresh(key, refresh_func)
+            with self.lock:
+                self.active[key] = [refresh_func, last_refresh or time.time()]
+                while len(self.active) > self.max_active:
+                    evicted_key, _ = self.active.popitem(last=False)
+                    self.key_locks.pop(evicted_key, None)
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="dashboard-blob-refresher", daemon=True)
+                    self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(min(self.ttl, 10))
+            with self.lock:
+                due = [(key, entry[0]) for key, entry in self.active.items() if time.time() - entry[1] >= self.ttl]
+            for key, refresh_func in due:
+                last_refresh = self._refresh(key, refresh_func)
+                with self.lock:
+                    if key in self.active:
+                        # A Failed Pull is tried again after another TTL, not on every Tick
+                        self.active[key][1] = last_refresh or time.time()
+
+
+frame_cache = FrameCache()
+blob_refresher = BlobRefresher()
+
+
+def ensure_blob_refresher(refresh_func, key="default"):
+    blob_refresher.ensure(key, refresh_func)
+    return blob_refresher
@@ -0,0 +1,179 @@
+import configparser
+import os
+
+from bokeh.layouts import gridplot
+from bokeh.models import (ColumnDataSource, NumeralTickFormatter, HoverTool,
+                          Span)
+from bokeh.plotting import figure
+
+from aggregates import (DAILY_USAGE_AGGREGATE, INTERVAL_USAGE_AGGREGATE, MONTHLY_USAGE_AGGREGATE,
+                        PAST_24_HOUR_USAGE_AGGREGATE, TYPICAL_DAY_PROFILE_AGGREGATE, daily_usage, interval_usage,
+                        monthly_usage, past_24_hour_usage)
+from dashboard_cache import frame_cache
+from data_commit import read_manifest
+
+# Chart Figures of the Dashboard, without Streamlit: built by the Page itself or by the Render Service
+
+# Set Data Files
+MONTHLY_TRENDS_DATAFILE = "monthly_trends.csv"
+DAILY_TRENDS_DATAFILE = "daily_trends.csv"
+INTERVAL_TRENDS_DATAFILE = "interval_trends.csv"
+PAST_24_HOUR_TREND_DATAFILE = "past_24_hour_trend.csv"
+
+# Prepare Local Data File Path
+data_file_path = os.path.join(os.path.abspath(os.path.curdir), "data_files")
+
+# Comma Separated Meter Names to serve (as named in the Fleet Config), or "fleet" for every [METER:<name>] there
+DASHBOARD_METERS = os.getenv("DASHBOARD_METERS", "")
+FLEET_CONFIG_FILE = os.getenv("FLEET_CONFIG_FILE", "fleet.ini")
+METER_SECTION_PREFIX = "METER:"
+
+
+# Meter Name -> (Local Folder, BLOB Prefix); the Fleet Runner's Layout, or the Single Meter one when not set
+def get_dashboard_meters():
+    if DASHBOARD_METERS.strip().lower() == "fleet":
+        fleet_config = configparser.ConfigParser()
+        fleet_config.optionxform = str
+        fleet_config.read(FLEET_CONFIG_FILE)
+        meter_names = [x[len(METER_SECTION_PREFIX):] for x in fleet_config.sections()
+                       if x.startswith(METER_SECTION_PREFIX)]
+    else:
+        meter_names = [x.strip() for x in DASHBOARD_METERS.split(",") if x.strip()]
+    if not meter_names:
+        return {"default": (data_file_path, "")}
+    return {x: (os.path.join(data_file_path, x), x + "/") for x in meter_names}
+
+
+# Read File from Local (Memoized until the File Changes)
+def read_data_from_file_as_pdf(file_name, file_path=None):
+    try:
+        local_file_name = os.path.join(file_path or data_file_path, file_name)
+        return frame_cache.read_csv(local_file_name)
+    except Exception as e:
+        print("Failed to Read Data from File: [{}]".format(file_name))
+        return None
+
+
+# Pre-Computed Aggregate written by the Data Handler, else Derived from the Raw File; None when neither is there
+def read_aggregate(aggregate_file, source_file, aggregate_func, file_path=None):
+    file_path = file_path or data_file_path
+    if os.path.exists(os.path.join(file_path, aggregate_file)):
+        return read_data_from_file_as_pdf(aggregate_file, file_path)
+    source_df = read_data_from_file_as_pdf(source_file, file_path) \
+        if os.path.exists(os.path.join(file_path, source_file)) else None
+    return aggregate_func(source_df) if source_df is not None and not source_df.empty else None
+
+
+# Data Generation of a Meter Folder: the Manifest's, bumped on every Committed Write (or Pull from BLOB)
+def data_generation(file_path):
+    generation = read_manifest(file_path).get("generation", 0)
+    if generation:
+        return generation
+    # No Manifest (Files copied in by Hand): the Chart Files' Modification Times stand in
+    chart_files = [os.path.join(file_path, x) for x in (PAST_24_HOUR_TREND_DATAFILE, INTERVAL_TRENDS_DATAFILE,
+                                                        DAILY_TRENDS_DATAFILE, MONTHLY_TRENDS_DATAFILE)]
+    return ",".join(str(os.stat(x).st_mtime_ns) for x in chart_files if os.path.exists(x))
+
+
+def build_grid(list_df, x_col, y_cols, xaxis_label, yaxis_label, span_col=None, scatter=True, tick_interval=None,
+               datetime_axis=False):
+    grid_children = []
+    for df in list_df:
+        colors = ['rgb(114,160,193)', 'rgb(175,0,42)', 'rgb(255,191,0)', 'rgb(59,122,87)', 'rgb(242,103,0)']
+        source = ColumnDataSource(data=df)
+        tools_to_show = 'box_zoom,pan,save,reset,wheel_zoom'
+        # A Numeric Datetime Axis keeps the Payload to the Points themselves, not one Category per Point
+        x_axis_args = {"x_axis_type": "datetime"} if datetime_axis else {"x_range": df[x_col].tolist()}
+        p = figure(plot_height=300,
+                   y_axis_label=yaxis_label,
+                   toolbar_location='right',
+                   tools=tools_to_show,
+                   **x_axis_args)
+
+        for i in range(len(y_cols)):
+            c = p.line(x_col, y_cols[i],
+                       source=source,
+                       line_width=2,
+                       color=colors[i])
+            if scatter:
+                circle = p.circle(x_col, y_cols[i],
+                                  source=source,
+                                  fill_color=colors[i],
+                                  color=colors[i],
+                                  size=6)
+
+                p.add_tools(HoverTool(tooltips=[(f"{y_cols[i]}", "@%s{'0.00'}" % (y_cols[i]))],
+                                      renderers=[circle], mode='mouse',
+                                      formatters={f'{y_cols[i]}': 'numeral'}))
+        # create span for average level
+        if span_col:
+            _span(df, span_col, p)
+        p.title.text_font_size = "12pt"
+        p.xaxis.major_label_text_font_size = "10pt"
+        p.xaxis.major_label_orientation = 1
+        p.yaxis.major_label_text_font_size = "11pt"
+        p.yaxis[0].formatter.use_scientific = False
+        p.yaxis[0].formatter = NumeralTickFormatter(format='0.00')
+        p.y_range.start = 0
+        p.x_range.range_padding = 0.05
+        p.y_range.range_padding = 0.1
+        grid_children.append(p)
+
+    return gridplot(children=[grid_children[i:i + 1] for i in range(0, len(grid_children), 1)],
+                    sizing_mode="stretch_width")
+
+
+def _span(df, col_name, p):
+    level = df[col_name].values[0]
+    average_span = Span(location=level,
+                        dimension='width', line_color='black',
+                        line_dash='dashed', line_width=2)
+    p.add_layout(average_span)
+
+
+# The Charts every Viewer of a Meter sees, as (Title, Grid Arguments); the History Chart depends on the Viewer
+def static_charts(file_path=None):
+    file_path = file_path or data_file_path
+    past_24_hours = read_aggregate(PAST_24_HOUR_USAGE_AGGREGATE, PAST_24_HOUR_TREND_DATAFILE, past_24_hour_usage,
+                                   file_path)
+    past_45_days = read_aggregate(DAILY_USAGE_AGGREGATE, DAILY_TRENDS_DATAFILE, daily_usage, file_path)
+    past_12_months_grp = read_aggregate(MONTHLY_USAGE_AGGREGATE, MONTHLY_TRENDS_DATAFILE, monthly_usage, file_path)
+    past_day_interval = read_aggregate(INTERVAL_USAGE_AGGREGATE, INTERVAL_TRENDS_DATAFILE, interval_usage,
+                                       file_path)
+    charts = list()
+    # A Chart waits for its Data: a New Meter has no Reading Trend until its First On Demand Read
+    if past_24_hours is not None:
+        unq_day_past_24_hours = ','.join(past_24_hours['USAGE_DATE'].unique().tolist())
+        charts.append((f"Consumption Trends: Past 24 Hours ({unq_day_past_24_hours})",
+                       dict(list_df=[past_24_hours], x_col='USAGE_TIME', y_cols=['USAGE'], xaxis_label='Date Time',
+                            yaxis_label='Usage (in kWh)', span_col='AVERAGE_USAGE', scatter=True,
+                            tick_interval=False)))
+    if past_day_interval is not None:
+        unq_past_day_interval = ','.join(past_day_interval['USAGE_DATE'].unique().tolist())
+        charts.append((f"Consumption Trends: 15 minute Intervals ({unq_past_day_interval})",
+                       dict(list_df=[past_day_interval], x_col='USAGE_TIME', y_cols=['USAGE'],
+                            xaxis_label='Date Time', yaxis_label='Usage (in kWh)', span_col='AVERAGE_USAGE',
+                            scatter=False, tick_interval=False)))
+    if past_45_days is not None:
+        charts.append(("Consumption Trends: Past 45 Days",
+                       dict(list_df=[past_45_days], x_col='DAILY_DATE', y_cols=['USAGE', 'ROLLING_AVERAGE_USAGE'],
+                            xaxis_label='Date', yaxis_label='Usage (in kWh)', span_col='AVERAGE_USAGE',
+                            scatter=False, tick_interval=False)))
+    if past_12_months_grp is not None:
+        charts.append(("Consumption Trends: Past 12 Months",
+                       dict(list_df=[past_12_months_grp], x_col='MONTH_YEAR', y_cols=['USAGE'],
+                            xaxis_label='Month Year', yaxis_label='Usage (in kWh)', span_col='AVERAGE_USAGE',
+                            scatter=True, tick_interval=False)))
+
+    typical_day = read_data_from_file_as_pdf(TYPICAL_DAY_PROFILE_AGGREGATE, file_path) \
+        if os.path.exists(os.path.join(file_path, TYPICAL_DAY_PROFILE_AGGREGATE)) else None
+    if typical_day is not None and not typical_day.empty:
+        charts.append(("Consumption Trends: Typical Day (Average per Hour)",
+                       dict(list_df=[typical_day], x_col='HOUR_OF_DAY', y_cols=['WEEKDAY', 'WEEKEND'],
+                            xaxis_label='Hour of Day', yaxis_label='Usage (in kWh)', scatter=True,
+                            tick_interval=False)))
+    return charts
+
+
+def build_static_figures(file_path=None):
+    return [(title, build_grid(**chart)) for title, chart in static_charts(file_path)]
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Generation Number and Content Hash of every Committed Data File
+DATA_MANIFEST_FILE = "data_manifest.json"
+# Staged Files left behind by a Crash between Staging and Commit are Swept once they are this many Seconds old
+STAGED_FILE_PATTERN = re.compile(r"\.staged-[0-9a-f]{8}$")
+STAGED_FILE_MAX_AGE = 3600
+
+_commit_lock = threading.Lock()
+_local = threading.local()
+
+
+def _fsync_write(local_file_name, data):
+    with open(local_file_name, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# Make the Renames themselves Durable (Not Supported on Windows)
+def _fsync_dir(file_path):
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    dir_fd = os.open(file_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def read_manifest(file_path):
+    manifest_file = os.path.join(file_path, DATA_MANIFEST_FILE)
+    if os.path.exists(manifest_file):
+        try:
+            with open(manifest_file) as f:
+                return json.load(f)
+        except ValueError:
+            print("Discarding Unreadable Data Manifest: [{}]".format(manifest_file))
+    return {"generation": 0, "files": {}}
+
+
+# Only Old Ones: a Batch of another Thread or Process may be Staging into the same Folder right now
+def _sweep_staged(file_path):
+    now = time.time()
+    for file_name in os.listdir(file_path):
+        if not STAGED_FILE_PATTERN.search(file_name):
+            continue
+        staged_file = os.path.join(file_path, file_name)
+        try:
+            if now - os.path.getmtime(staged_file) > STAGED_FILE_MAX_AGE:
+                os.remove(staged_file)
+                print("Removed Stale Staged File: [{}]".format(staged_file))
+        except OSError:
+            pass
+
+
+# Outputs are Staged next to their Targets and Renamed into Place together on Commit
+class WriteBatch:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.staging_suffix = ".staged-" + uuid.uuid4().hex[:8]
+        self.staged = dict()
+        self.commit_callbacks = list()
+
+    def stage(self, file_name, content):
+        data = content.encode() if isinstance(content, str) else content
+        staged_file = os.path.join(self.file_path, file_name + self.staging_suffix)
+        _fsync_write(staged_file, data)
+        self.staged[file_name] = (staged_file, hashlib.md5(data).hexdigest())
+
+    # Side Effects outside the Data Files (e.g. a Series Store Append) that must only happen if the Batch Commits
+    def on_commit(self, callback):
+        self.commit_callbacks.append(callback)
+
+    def commit(self):
+        generation = self._commit_staged() if self.staged else None
+        callbacks, self.commit_callbacks = self.commit_callbacks, list()
+        for callback in callbacks:
+            callback()
+        return generation
+
+    def _commit_staged(self):
+        with _commit_lock:
+            manifest = read_manifest(self.file_path)
+            generation = manifest.get("generation", 0) + 1
+            for file_name, (staged_file, md5) in sorted(self.staged.items()):
+                local_file_name = os.path.join(self.file_path, file_name)
+                os.replace(staged_file, local_file_name)
+                stat = os.stat(local_file_name)
+                manifest.setdefault("files", {})[file_name] = {"generation": generation, "md5": md5,
+                                                               "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            manifest["generation"] = generation
+            # The Manifest goes Last: a Reader that sees the new Generation finds every File of it in Place
+            manifest_file = os.path.join(self.file_path, DATA_MANIFEST_FILE)
+            _fsync_write(manifest_file + self.staging_suffix, json.dumps(manifest, indent=1, sort_keys=True).encode())
+            os.replace(manifest_file + self.staging_suffix, manifest_file)
+            _fsync_dir(self.file_path)
+        self.staged = dict()
+        return generation
+
+    def abort(self):
+        for staged_file, _ in self.staged.values():
+            if os.path.exists(staged_file):
+                os.remove(staged_file)
+        self.staged = dict()
+        self.commit_callbacks = list()
+
+
+# Writes to file_path inside the Block are Committed together; Nested Blocks join the Outer Batch
+@contextmanager
+def write_batch(file_path):
+    batches = _local.__dict__.setdefault("batches", dict())
+    key = os.path.abspath(file_path)
+    if key in batches:
+        yield batches[key]
+        return
+    if os.path.isdir(file_path):
+        _sweep_staged(file_path)
+    batch = batches[key] = WriteBatch(file_path)
+    try:
+        yield batch
+        batch.commit()
+    except BaseException:
+        batch.abort()
+        raise
+    finally:
+        del batches[key]
+
+
+def write_file(local_file_name, content):
+    file_path, file_name = os.path.split(local_file_name)
+    with write_batch(file_path) as batch:
+        batch.stage(file_name, content)
+
+
+def write_frame(df, local_file_name):
+    write_file(local_file_name, df.to_csv(index=False))
@@ -0,0 +1,81 @@
+import os
+
+from data_commit import DATA_MANIFEST_FILE
+from metrics import METRICS_JSON_DATAFILE
+
+# Names of All Data Files. Kept free of Pandas, so Blob Sync can list them without loading the Data Stack
+
+# Set Data Files
+METER_INFO_DATAFILE = "meter_info.csv"
+MONTHLY_TRENDS_DATAFILE = "monthly_trends.csv"
+DAILY_TRENDS_DATAFILE = "daily_trends.csv"
+INTERVAL_TRENDS_DATAFILE = "interval_trends.csv"
+LAST_BILLED_METER_READING_DATAFILE = "last_billed_meter_reading.csv"
+LATEST_METER_READING_DATAFILE = "latest_meter_reading.csv"
+USAGE_SINCE_LAST_READING_DATAFILE = "usage_since_last_reading.csv"
+CURRENT_USAGE_DATAFILE = "current_usage.csv"
+PAST_24_HOUR_TREND_DATAFILE = "past_24_hour_trend.csv"
+HISTORIC_HOURLY_TREND_DATAFILE = "historic_hourly_trend.csv"
+HISTORIC_HOURLY_TREND_STORE = "historic_hourly_trend"
+ODR_RATE_LIMIT_DATAFILE = "odr_rate_limits.json"
+SYNC_WATERMARK_DATAFILE = "sync_watermarks.json"
+SESSION_CACHE_DATAFILE = "session_cache.json"
+INTERVAL_HISTORY_STORE = "interval_history"
+INTERVAL_BACKFILL_CHECKPOINT_DATAFILE = "interval_backfill_checkpoint.json"
+INTERVAL_RATE_LIMIT_DATAFILE = "interval_rate_limits.json"
+USAGE_DB_DATAFILE = "usage.sqlite3"
+# Consistent Single-File Copy of the Database (no WAL) that is Synced to BLOB for the Dashboard
+USAGE_DB_SNAPSHOT_DATAFILE = "usage_snapshot.sqlite3"
+
+# Running Statistics per Hour of Day, and the Readings they Flagged
+ANOMALY_STATE_DATAFILE = "anomaly_state.json"
+ANOMALY_FLAGS_DATAFILE = "anomaly_flags.csv"
+
+# Running Totals of the Open Billing Cycle, and its Projection for the Dashboard
+BILL_CYCLE_DATAFILE = "bill_cycle.json"
+BILL_PROJECTION_DATAFILE = "bill_projection.csv"
+
+# Ready-to-Plot Aggregate Files written by the Data Handler
+PAST_24_HOUR_USAGE_AGGREGATE = "agg_past_24_hour_usage.csv"
+INTERVAL_USAGE_AGGREGATE = "agg_interval_usage.csv"
+DAILY_USAGE_AGGREGATE = "agg_daily_usage.csv"
+MONTHLY_USAGE_AGGREGATE = "agg_monthly_usage.csv"
+TYPICAL_DAY_PROFILE_AGGREGATE = "agg_typical_day_profile.csv"
+# One File per series_lod.ROLLUP_LEVELS Level
+HISTORY_ROLLUP_AGGREGATES = {level: "agg_history_{}.csv".format(level.lower())
+                             for level in ["HOUR", "DAY", "WEEK", "MONTH"]}
+
+aggregate_files_list = [PAST_24_HOUR_USAGE_AGGREGATE,
+                        INTERVAL_USAGE_AGGREGATE,
+                        DAILY_USAGE_AGGREGATE,
+                        MONTHLY_USAGE_AGGREGATE,
+                        TYPICAL_DAY_PROFILE_AGGREGATE] + list(HISTORY_ROLLUP_AGGREGATES.values())
+
+data_files_list = [METER_INFO_DATAFILE,
+                   MONTHLY_TRENDS_DATAFILE,
+                   DAILY_TRENDS_DATAFILE,
+                   INTERVAL_TRENDS_DATAFILE,
+                   LAST_BILLED_METER_READING_DATAFILE,
+                   LATEST_METER_READING_DATAFILE,
+                   USAGE_SINCE_LAST_READING_DATAFILE,
+                   CURRENT_USAGE_DATAFILE,
+                   PAST_24_HOUR_TREND_DATAFILE,
+                   ODR_RATE_LIMIT_DATAFILE,
+                   SYNC_WATERMARK_DATAFILE,
+                   INTERVAL_BACKFILL_CHECKPOINT_DATAFILE,
+                   METRICS_JSON_DATAFILE,
+                   ANOMALY_STATE_DATAFILE,
+                   ANOMALY_FLAGS_DATAFILE,
+                   BILL_CYCLE_DATAFILE,
+                   BILL_PROJECTION_DATAFILE,
+                   DATA_MANIFEST_FILE] + aggregate_files_list
+
+# Append-Only Series Stores (Directories of Monthly Partitions) and their Time / Value Columns
+data_stores_list = [HISTORIC_HOURLY_TREND_STORE, INTERVAL_HISTORY_STORE]
+data_stores_columns = {HISTORIC_HOURLY_TREND_STORE: ("READING_TIME", "METER_READING"),
+                       INTERVAL_HISTORY_STORE: ("USAGE_TIME", "USAGE")}
+# CSV Files the Stores are Migrated from on First Run
+data_stores_legacy_files = {HISTORIC_HOURLY_TREND_STORE: HISTORIC_HOURLY_TREND_DATAFILE}
+
+# Prepare Local Data File Path (Created by the Runs that write to it)
+data_file_path = os.path.join(os.path.abspath(os.path.curdir), "data_files")
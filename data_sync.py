@@ -0,0 +1,136 @@
+import configparser
+import os
+
+from blob_chunks import download_store, upload_store
+from blob_sync import BlobSync
+from data_commit import DATA_MANIFEST_FILE
+from data_layout import (SESSION_CACHE_DATAFILE, USAGE_DB_DATAFILE, USAGE_DB_SNAPSHOT_DATAFILE, data_file_path,
+                         data_files_list, data_stores_columns, data_stores_legacy_files, data_stores_list)
+from metrics import metrics
+
+# Set Storage Mode:
+BLOB_ENABLED = True if os.getenv("BLOB_ENABLED") else False
+
+
+# Prepare Secrets
+def get_meter_credentials():
+    if not os.getenv("FETCH_SECRETS_FROM_ENVIRONMENT"):
+        assert os.path.exists("secrets.ini")
+        key_config = configparser.ConfigParser()
+        key_config.read("secrets.ini")
+        assert key_config
+        username = key_config['CREDENTIALS']['SMART_METER_USERNAME']
+        password = key_config['CREDENTIALS']['SMART_METER_PASSWORD']
+    else:
+        username = os.getenv("SMART_METER_USERNAME")
+        password = os.getenv("SMART_METER_PASSWORD")
+    assert username and password, "Could not source USERNAME and PASSWORD!"
+    return username, password
+
+
+def get_blob_credentials():
+    if not os.getenv("FETCH_SECRETS_FROM_ENVIRONMENT"):
+        assert os.path.exists("secrets.ini")
+        key_config = configparser.ConfigParser()
+        key_config.read("secrets.ini")
+        blob_account_name = key_config['AZURE_BLOB']['BLOB_ACCOUNT_NAME']
+        blob_account_key = key_config['AZURE_BLOB']['BLOB_ACCOUNT_KEY']
+        blob_container_name = key_config['AZURE_BLOB']['BLOB_CONTAINER_NAME']
+    else:
+        blob_account_name = os.getenv("BLOB_ACCOUNT_NAME")
+        blob_account_key = os.getenv("BLOB_ACCOUNT_KEY")
+        blob_container_name = os.getenv("BLOB_CONTAINER_NAME")
+    assert blob_account_name and blob_account_key and blob_container_name, "Could not source BLOB Credentials"
+    return blob_account_name, blob_account_key, blob_container_name
+
+
+def get_blob_obj():
+    # Azure SDK is only loaded on Runs that use BLOB
+    from azure_blob import AzureBlob
+    blob_account_name, blob_account_key, blob_container_name = get_blob_credentials()
+    return AzureBlob(account_name=blob_account_name, account_key=blob_account_key,
+                     container_name=blob_container_name)
+
+
+# Download All Files from Blob (Unchanged Files are Skipped)
+@metrics.span("blob_download")
+def download_all_files_from_blob(file_path=None, blob_prefix="", blob_obj=None):
+    file_path = file_path or data_file_path
+    os.makedirs(file_path, exist_ok=True)
+    blob_sync = BlobSync(blob_obj or get_blob_obj(), file_path, blob_prefix)
+    file_names = list(data_files_list)
+    for store_name in data_stores_list:
+        time_col, value_col = data_stores_columns[store_name]
+        try:
+            # Chunked Layout: only Chunks this Node does not have yet are pulled
+            if download_store(blob_sync.blob_obj, os.path.join(file_path, store_name), store_name, blob_prefix,
+                              time_col=time_col, value_col=value_col) is not None:
+                continue
+            # Raw Partition Files uploaded before the Chunked Layout
+            store_files = blob_sync.list_remote(store_name + "/")
+        except Exception as e:
+            print("Failed to Retrieve Store: [{}] from BLOB".format(store_name))
+            continue
+        file_names.extend(store_files)
+        if not store_files and store_name in data_stores_legacy_files:
+            file_names.append(data_stores_legacy_files[store_name])
+    return blob_sync.download(file_names)
+
+
+# Upload All Files to Blob (Unchanged Files are Skipped)
+@metrics.span("blob_upload")
+def upload_all_files_to_blob(file_path=None, blob_prefix="", blob_obj=None, full_stores=False):
+    file_path = file_path or data_file_path
+    blob_sync = BlobSync(blob_obj or get_blob_obj(), file_path, blob_prefix)
+    file_names = [x for x in data_files_list if x != DATA_MANIFEST_FILE]
+    for store_name in data_stores_list:
+        store_path = os.path.join(file_path, store_name)
+        if not os.path.exists(store_path):
+            continue
+        # Closed Partitions are Compressed Chunks sent once; a Regular Run only adds its new Bytes to the Head
+        time_col, value_col = data_stores_columns[store_name]
+        try:
+            upload_store(blob_sync.blob_obj, store_path, store_name, blob_prefix, full=full_stores, time_col=time_col,
+                         value_col=value_col)
+        except Exception as e:
+            print("Failed to Upload Store: [{}] to BLOB: {}".format(store_name, e))
+    # The Manifest goes Last, so a Reader that sees a new Generation finds its Files in BLOB
+    return blob_sync.upload(file_names) + blob_sync.upload([DATA_MANIFEST_FILE])
+
+
+# Upload a Snapshot of the Usage Database shared by All Meters (the Live File is in WAL Mode and never Sent)
+@metrics.span("blob_upload")
+def upload_usage_database(blob_obj=None):
+    db_file = os.path.join(data_file_path, USAGE_DB_DATAFILE)
+    if not os.path.exists(db_file):
+        return list()
+    # The Database Module is only loaded on Nodes that keep one
+    from usage_db import USAGE_DB_ENABLED, UsageDatabase
+    if not USAGE_DB_ENABLED:
+        return list()
+    UsageDatabase(db_file).snapshot(os.path.join(data_file_path, USAGE_DB_SNAPSHOT_DATAFILE))
+    return BlobSync(blob_obj or get_blob_obj(), data_file_path).upload([USAGE_DB_SNAPSHOT_DATAFILE])
+
+
+# The Session Cache holds Bearer Tokens: it only leaves the Node when Encrypted with its own SESSION_CACHE_KEY,
+# never with a Key Derived from an Account Password
+def session_cache_synced():
+    if os.getenv("SESSION_CACHE_KEY"):
+        return True
+    print("SESSION_CACHE_KEY is not Set. The Session Cache stays on this Node.")
+    return False
+
+
+# Files shared by All Meters sit at the Container Root, outside the Meter Prefixes
+def download_shared_files(blob_obj=None):
+    if not session_cache_synced():
+        return list()
+    return BlobSync(blob_obj or get_blob_obj(), data_file_path).download([SESSION_CACHE_DATAFILE])
+
+
+def upload_shared_files(blob_obj=None):
+    blob_obj = blob_obj or get_blob_obj()
+    uploaded = upload_usage_database(blob_obj)
+    if session_cache_synced():
+        uploaded += BlobSync(blob_obj, data_file_path).upload([SESSION_CACHE_DATAFILE])
+    return uploaded
@@ -0,0 +1,105 @@
+import configparser
+import datetime
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pytz import timezone
+
+import runner
+from meter_session_manager import MeterSessionManager
+from metrics import metrics
+from session_cache import SessionCache
+
+FLEET_CONFIG_FILE = os.getenv("FLEET_CONFIG_FILE", "fleet.ini")
+METER_SECTION_PREFIX = "METER:"
+DEFAULT_MAX_WORKERS = 8
+
+
+# Read the List of Meters (One per Section) from the Fleet Config
+def get_fleet_meters(config_file=FLEET_CONFIG_FILE):
+    assert os.path.exists(config_file), "Could not find Fleet Config: [{}]".format(config_file)
+    fleet_config = configparser.ConfigParser()
+    fleet_config.optionxform = str
+    fleet_config.read(config_file)
+    meters = list()
+    for section in fleet_config.sections():
+        if not section.startswith(METER_SECTION_PREFIX):
+            continue
+        meter_name = section[len(METER_SECTION_PREFIX):].strip()
+        username = fleet_config[section].get('SMART_METER_USERNAME')
+        password = fleet_config[section].get('SMART_METER_PASSWORD')
+        assert meter_name and username and password, "Incomplete Fleet Config Section: [{}]".format(section)
+        # Optional: the Meter to Fetch when the Account holds Several (else the Account's Default Meter)
+        esiid = fleet_config[section].get('ESIID')
+        meters.append({"METER_NAME": meter_name, "USERNAME": username, "PASSWORD": password, "ESIID": esiid})
+    max_workers = fleet_config.getint('FLEET', 'MAX_WORKERS', fallback=DEFAULT_MAX_WORKERS)
+    return meters, max_workers
+
+
+# Fetch a Single Meter of the Fleet into its own Data Directory
+def fetch_meter(meter, blob_obj=None, session_cache=None):
+    meter_name = meter["METER_NAME"]
+    meter_file_path = os.path.join(runner.data_file_path, meter_name)
+    blob_prefix = meter_name + "/"
+    os.makedirs(meter_file_path, exist_ok=True)
+    print("[{}] Fetch Usage Started".format(meter_name))
+    try:
+        if blob_obj:
+            runner.download_all_files_from_blob(file_path=meter_file_path, blob_prefix=blob_prefix,
+                                                blob_obj=blob_obj)
+        msm = MeterSessionManager(username=meter["USERNAME"], password=meter["PASSWORD"],
+                                  session_cache=session_cache, esiid=meter.get("ESIID"))
+        msm.set_auth_keys()
+        runner.fetch_usage(msm, meter_file_path)
+        runner.materialize_aggregates(meter_file_path)
+    finally:
+        if blob_obj:
+            runner.upload_all_files_to_blob(file_path=meter_file_path, blob_prefix=blob_prefix, blob_obj=blob_obj)
+    print("[{}] Fetch Usage Completed".format(meter_name))
+    return meter_name
+
+
+# Fetch All Meters Concurrently on a Bounded Worker Pool
+def fetch_fleet(meters, max_workers=DEFAULT_MAX_WORKERS):
+    blob_obj = runner.get_blob_obj() if runner.BLOB_ENABLED else None
+    if blob_obj:
+        runner.download_shared_files(blob_obj)
+    # One Cache File for the whole Fleet; Entries are keyed and encrypted per Account
+    session_cache = SessionCache(os.path.join(runner.data_file_path, runner.SESSION_CACHE_DATAFILE))
+    failed_meters = list()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(meters)))) as executor:
+        futures = {executor.submit(fetch_meter, meter, blob_obj, session_cache): meter["METER_NAME"]
+                   for meter in meters}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print("[{}] Fetch Usage Failed: {}".format(futures[future], e))
+                failed_meters.append(futures[future])
+    if blob_obj:
+        # The Usage Database and the Session Cache of the Whole Fleet, once all Meters are Done
+        runner.upload_shared_files(blob_obj)
+    return failed_meters
+
+
+def run_fleet():
+    print("#" * 30)
+    start_time = datetime.datetime.now(tz=timezone("US/Central"))
+    print("Fleet Fetch Started At: [{}]".format(start_time))
+    fleet_meters, fleet_max_workers = get_fleet_meters()
+    print("Fetching [{}] Meters with [{}] Workers".format(len(fleet_meters), fleet_max_workers))
+    os.makedirs(runner.data_file_path, exist_ok=True)
+    failed = fetch_fleet(fleet_meters, fleet_max_workers)
+    end_time = datetime.datetime.now(tz=timezone("US/Central"))
+    print("Fleet Fetch Ended At: [{}]".format(end_time))
+    print("Time Taken: [{:.1f}] Seconds".format((end_time - start_time).total_seconds()))
+    metrics.write_files(runner.data_file_path)
+    if failed:
+        print("Failed Meters: {}".format(failed))
+    print("#" * 30)
+    return failed
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run_fleet() else 0)
@@ -0,0 +1,119 @@
+import datetime
+import json
+import os
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from data_commit import write_file, write_frame
+from response_parser import parse_monthly_usage_frame
+from time_series import TimeSeries
+
+# Daily Readings can still be revised by the Portal for a few Days
+DAILY_FINALIZE_DAYS = 3
+# A new Billing Cycle is not expected before this many Days after the Last one
+MONTHLY_MIN_CYCLE_DAYS = 28
+DAILY_WATERMARK = "DAILY"
+MONTHLY_WATERMARK = "MONTHLY"
+# A Monthly Row is one Billing Cycle, keyed by its Start; the Month is only a Bucket for the Charts
+MONTHLY_KEY = "START_DATE"
+MONTHLY_DATE_COLUMNS = ["START_DATE", "END_DATE", "MONTHLY_DATE"]
+
+
+class WatermarkStore:
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.watermarks = dict()
+        if os.path.exists(state_file):
+            with open(state_file) as f:
+                self.watermarks = json.load(f)
+
+    def get(self, name):
+        watermark = self.watermarks.get(name)
+        return datetime.datetime.strptime(watermark, "%Y-%m-%d").date() if watermark else None
+
+    def set(self, name, watermark_date):
+        self.watermarks[name] = watermark_date.strftime("%Y-%m-%d")
+        # Committed with the Merged Series, so a Crash cannot advance the Watermark past Unsaved Rows
+        write_file(self.state_file, json.dumps(self.watermarks, sort_keys=True))
+
+
+def _read_series(file_name, key_col, date_cols=None):
+    if not os.path.exists(file_name):
+        return None
+    try:
+        df = pd.read_csv(file_name)
+    except Exception as e:
+        print("Failed to Read Data from File: [{}]".format(file_name))
+        return None
+    if key_col not in df.columns or df.empty:
+        return None
+    for date_col in date_cols or [key_col]:
+        df[date_col] = pd.to_datetime(df[date_col]).dt.date
+    return df
+
+
+# Merge the Fetched Rows (Frame or Time Series) into the Stored Series; Newer Rows win on the same Key
+def merge_into_file(rows, file_name, key_col, date_cols=None):
+    new_df = rows.to_frame() if isinstance(rows, TimeSeries) else pd.DataFrame(rows).copy()
+    for date_col in date_cols or [key_col]:
+        new_df[date_col] = pd.to_datetime(new_df[date_col]).dt.date
+    old_df = _read_series(file_name, key_col, date_cols)
+    merged_df = pd.concat([old_df, new_df]) if old_df is not None else new_df
+    merged_df = merged_df.drop_duplicates(subset=[key_col], keep='last').sort_values(key_col)
+    write_frame(merged_df, file_name)
+    return merged_df
+
+
+def sync_daily_usage(msm, file_name, watermark_store, default_days=45):
+    today = datetime.date.today()
+    watermark = watermark_store.get(DAILY_WATERMARK)
+    if watermark is None:
+        # First Incremental Run over an Existing File: trust all but the Unfinalized Tail
+        old_df = _read_series(file_name, "DAILY_DATE")
+        if old_df is not None:
+            watermark = old_df["DAILY_DATE"].max() - datetime.timedelta(days=DAILY_FINALIZE_DAYS)
+    if watermark is None:
+        daily_trends = msm.get_daily_usage_trends(default_days, as_frame=True)
+    else:
+        start_date = watermark + datetime.timedelta(days=1)
+        if start_date >= today:
+            print("Daily Trends are up to date till [{}]".format(watermark))
+            return None
+        daily_trends = msm.get_daily_usage_trends(
+            start_date=datetime.datetime.combine(start_date, datetime.time()), as_frame=True)
+    if daily_trends.empty:
+        return None
+    merge_into_file(daily_trends, file_name, "DAILY_DATE")
+    finalized_date = min(daily_trends["DAILY_DATE"].max().date(),
+                         today - datetime.timedelta(days=DAILY_FINALIZE_DAYS))
+    if watermark is None or finalized_date > watermark:
+        watermark_store.set(DAILY_WATERMARK, finalized_date)
+    return daily_trends
+
+
+def sync_monthly_usage(msm, file_name, watermark_store, default_months=12):
+    today = datetime.date.today()
+    watermark = watermark_store.get(MONTHLY_WATERMARK)
+    if watermark is not None and _read_series(file_name, MONTHLY_KEY) is None:
+        # A File from before the Cycle Dates were Kept (one Row per Month): the Cycles are Fetched Again
+        print("Monthly Trends have no Cycle Dates. Fetching the Last [{}] Months Again.".format(default_months))
+        watermark = None
+    if watermark is None:
+        monthly_usage_response = msm.get_monthly_usage_trends(default_months, return_raw=True)
+    else:
+        if (today - watermark).days < MONTHLY_MIN_CYCLE_DAYS:
+            print("Monthly Trends are up to date till [{}]".format(watermark))
+            return None
+        # Start from the Last Closed Cycle so a Cycle overlapping the Watermark is not missed
+        start_date = datetime.datetime.combine(watermark, datetime.time()) - relativedelta(days=1)
+        monthly_usage_response = msm.get_monthly_usage_trends(start_date=start_date, return_raw=True)
+    if not monthly_usage_response:
+        return None
+    monthly_trends = parse_monthly_usage_frame(monthly_usage_response)
+    # An Older File without Cycle Dates is Replaced by the Refetched Cycles, not Merged
+    merge_into_file(monthly_trends, file_name, MONTHLY_KEY, MONTHLY_DATE_COLUMNS)
+    last_cycle_end = max(datetime.datetime.strptime(x["enddate"], "%m/%d/%Y").date() for x in monthly_usage_response)
+    if watermark is None or last_cycle_end > watermark:
+        watermark_store.set(MONTHLY_WATERMARK, last_cycle_end)
+    return monthly_trends
@@ -0,0 +1,150 @@
+import datetime
+import itertools
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from data_layout import (INTERVAL_BACKFILL_CHECKPOINT_DATAFILE, INTERVAL_HISTORY_STORE, INTERVAL_RATE_LIMIT_DATAFILE,
+                         SESSION_CACHE_DATAFILE, data_file_path)
+from data_sync import (BLOB_ENABLED, download_all_files_from_blob, download_shared_files, get_meter_credentials,
+                       upload_all_files_to_blob, upload_shared_files)
+from meter_session_manager import MeterSessionManager
+from metrics import metrics
+from odr_scheduler import TokenBucketStore
+from request_scheduler import PRIORITY_BACKFILL
+from series_store import SeriesStore
+from session_cache import SessionCache
+from usage_db import USAGE_DB_ENABLED
+
+BACKFILL_DAYS = 730
+BACKFILL_CHUNK_DAYS = int(os.getenv("BACKFILL_CHUNK_DAYS", 7))
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 4))
+# Chunks Submitted ahead per Worker; the Rest are only Submitted as Earlier ones are Committed
+BACKFILL_WINDOW_PER_WORKER = 2
+# Interval Requests allowed per Minute across all Backfill Workers
+BACKFILL_REQUESTS_PER_MINUTE = int(os.getenv("BACKFILL_REQUESTS_PER_MINUTE", 10))
+
+
+class IntervalBackfill:
+    def __init__(self, msm, store_path, checkpoint_file, rate_limit_file, chunk_days=BACKFILL_CHUNK_DAYS,
+                 max_workers=BACKFILL_WORKERS):
+        self.msm = msm
+        self.store = SeriesStore(store_path, time_col="USAGE_TIME", value_col="USAGE")
+        self.checkpoint_file = checkpoint_file
+        self.chunk_days = chunk_days
+        self.max_workers = max_workers
+        self.esiid = msm.meter_details['esiid']
+        self.bucket_store = TokenBucketStore(rate_limit_file,
+                                             limits={"MINUTE": (BACKFILL_REQUESTS_PER_MINUTE, 60)})
+
+    def _load_checkpoint(self):
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file) as f:
+                return json.load(f)
+        return {}
+
+    def _save_checkpoint(self, checkpoint):
+        tmp_file = self.checkpoint_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(checkpoint, f, sort_keys=True)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def _chunks(self, start_date, end_date):
+        chunks = list()
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(end_date, chunk_start + datetime.timedelta(days=self.chunk_days - 1))
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end + datetime.timedelta(days=1)
+        return chunks
+
+    def _fetch_chunk(self, chunk):
+        while not self.bucket_store.try_acquire(self.esiid):
+            time.sleep(self.bucket_store.seconds_until_available(self.esiid))
+        chunk_start, chunk_end = chunk
+        # Chunks yield to On Demand Reads and Regular Calls of every Meter in the Scheduler
+        return self.msm.get_interval_usage(datetime.datetime.combine(chunk_start, datetime.time()),
+                                           datetime.datetime.combine(chunk_end, datetime.time()),
+                                           priority=PRIORITY_BACKFILL)
+
+    def run(self, num_days=BACKFILL_DAYS):
+        end_date = datetime.date.today() - datetime.timedelta(days=1)
+        window_start = end_date - datetime.timedelta(days=num_days - 1)
+        checkpoint = self._load_checkpoint()
+        next_date = datetime.datetime.strptime(checkpoint["next_date"], "%Y-%m-%d").date() \
+            if checkpoint.get("next_date") else None
+        # A Checkpoint is only Resumed within the Requested Window; an Older or Finished one starts Afresh
+        if next_date is not None and window_start <= next_date <= end_date:
+            start_date = next_date
+            print("Resuming Interval Backfill from [{}]".format(start_date))
+        else:
+            start_date = window_start
+            if self.store.last_time is not None:
+                start_date = max(start_date, self.store.last_time.date())
+        chunks = self._chunks(start_date, end_date)
+        print("Backfilling [{}] Chunks of [{}] Days with [{}] Workers".format(len(chunks), self.chunk_days,
+                                                                              self.max_workers))
+        rows = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Only a Window of Chunks is in Flight: a Failed Chunk does not leave the Rest of the Range queued,
+            # spending the Rate Limit on Results that are Thrown Away
+            window = deque()
+            pending_chunks = iter(chunks)
+            for chunk in itertools.islice(pending_chunks, self.max_workers * BACKFILL_WINDOW_PER_WORKER):
+                window.append((chunk, executor.submit(self._fetch_chunk, chunk)))
+            try:
+                # Chunks are fetched concurrently but committed in Date Order, so the Checkpoint never skips a Gap
+                while window:
+                    chunk, future = window.popleft()
+                    interval_usage = future.result()
+                    for next_chunk in itertools.islice(pending_chunks, 1):
+                        window.append((next_chunk, executor.submit(self._fetch_chunk, next_chunk)))
+                    rows += self.store.append_frame(interval_usage)
+                    next_date = chunk[1] + datetime.timedelta(days=1)
+                    self._save_checkpoint({"next_date": next_date.strftime("%Y-%m-%d")})
+                    print("Backfilled Interval Usage till [{}]".format(chunk[1]))
+            except BaseException:
+                for _, future in window:
+                    future.cancel()
+                raise
+        # Nothing left to Resume: the Next Run starts from the Store and its own Window (an Empty Checkpoint,
+        # not a Deleted one, so the Copy Synced to BLOB is Cleared as well)
+        self._save_checkpoint({})
+        print("Interval Backfill Completed: [{}] Rows Added".format(rows))
+        return rows
+
+
+# Pull up to Two Years of 15 Minute Interval Usage into the Interval Store (Resumable)
+@metrics.span("backfill")
+def backfill_interval_usage(msm, file_path=None, num_days=BACKFILL_DAYS):
+    file_path = file_path or data_file_path
+    msm.get_dashboard()
+    interval_backfill = IntervalBackfill(msm, os.path.join(file_path, INTERVAL_HISTORY_STORE),
+                                         os.path.join(file_path, INTERVAL_BACKFILL_CHECKPOINT_DATAFILE),
+                                         os.path.join(file_path, INTERVAL_RATE_LIMIT_DATAFILE))
+    rows = interval_backfill.run(num_days)
+    if USAGE_DB_ENABLED:
+        # The Fetch Pipeline is only loaded to Index the Backfilled History
+        from runner import index_usage_database
+        index_usage_database(file_path)
+    return rows
+
+
+def run_backfill(num_days=BACKFILL_DAYS):
+    os.makedirs(data_file_path, exist_ok=True)
+    username, password = get_meter_credentials()
+    if BLOB_ENABLED:
+        download_all_files_from_blob()
+        download_shared_files()
+    try:
+        session_cache = SessionCache(os.path.join(data_file_path, SESSION_CACHE_DATAFILE))
+        msm = MeterSessionManager(username=username, password=password, session_cache=session_cache)
+        msm.set_auth_keys()
+        backfill_interval_usage(msm, num_days=num_days)
+    finally:
+        metrics.write_files(data_file_path)
+        if BLOB_ENABLED:
+            upload_all_files_to_blob(full_stores=True)
+            upload_shared_files()
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import shutil
+from types import SimpleNamespace
+
+BLOCKS_SUFFIX = ".blocks"
+STAGED_SUFFIX = ".staged"
+
+
+# Filesystem-Backed Stand-In for BlockBlobService (Containers are Folders, Blobs are Files)
+class LocalBlockBlobService:
+    def __init__(self, root_path):
+        self.root_path = root_path
+
+    def _blob_file(self, container_name, blob_name):
+        return os.path.join(self.root_path, container_name, *blob_name.split("/"))
+
+    @staticmethod
+    def _etag(file_name):
+        with open(file_name, "rb") as f:
+            return '"0x{}"'.format(hashlib.md5(f.read()).hexdigest().upper())
+
+    def _properties(self, file_name):
+        return SimpleNamespace(etag=self._etag(file_name), content_length=os.path.getsize(file_name))
+
+    def create_blob_from_path(self, container_name, blob_name, file_path, **kwargs):
+        blob_file = self._blob_file(container_name, blob_name)
+        os.makedirs(os.path.dirname(blob_file), exist_ok=True)
+        # A Whole-Blob Upload replaces the Committed Blocks
+        shutil.rmtree(blob_file + BLOCKS_SUFFIX, ignore_errors=True)
+        shutil.copyfile(file_path, blob_file + ".tmp")
+        os.replace(blob_file + ".tmp", blob_file)
+        return self._properties(blob_file)
+
+    # Staged Blocks are kept as Files until a Block List Commits them
+    def put_block(self, container_name, blob_name, block, block_id, **kwargs):
+        blocks_path = self._blob_file(container_name, blob_name) + BLOCKS_SUFFIX
+        os.makedirs(blocks_path, exist_ok=True)
+        with open(os.path.join(blocks_path, block_id + STAGED_SUFFIX), "wb") as f:
+            f.write(block)
+
+    def put_block_list(self, container_name, blob_name, block_list, **kwargs):
+        blob_file = self._blob_file(container_name, blob_name)
+        blocks_path = blob_file + BLOCKS_SUFFIX
+        block_ids = [x.id for x in block_list]
+        block_files = list()
+        for block_id in block_ids:
+            # Latest: the Staged Block if there is one, else the Committed one
+            staged_file = os.path.join(blocks_path, block_id + STAGED_SUFFIX)
+            block_file = os.path.join(blocks_path, block_id)
+            if os.path.exists(staged_file):
+                os.replace(staged_file, block_file)
+            if not os.path.exists(block_file):
+                raise ValueError("Invalid Block List: Block [{}] of [{}] not Found".format(block_id, blob_name))
+            block_files.append(block_file)
+        with open(blob_file + ".tmp", "wb") as f:
+            for block_file in block_files:
+                with open(block_file, "rb") as b:
+                    f.write(b.read())
+        os.replace(blob_file + ".tmp", blob_file)
+        for file_name in os.listdir(blocks_path):
+            if file_name not in block_ids:
+                os.remove(os.path.join(blocks_path, file_name))
+        return self._properties(blob_file)
+
+    def get_blob_to_bytes(self, container_name, blob_name, **kwargs):
+        blob_file = self._blob_file(container_name, blob_name)
+        if not os.path.exists(blob_file):
+            raise FileNotFoundError("Blob Not Found: [{}]".format(blob_name))
+        with open(blob_file, "rb") as f:
+            return SimpleNamespace(name=blob_name, content=f.read(), properties=self._properties(blob_file))
+
+    def get_blob_to_path(self, container_name, blob_name, file_path, **kwargs):
+        blob_file = self._blob_file(container_name, blob_name)
+        if not os.path.exists(blob_file):
+            raise FileNotFoundError("Blob Not Found: [{}]".format(blob_name))
+        shutil.copyfile(blob_file, file_path)
+        return SimpleNamespace(name=blob_name, properties=self._properties(blob_file))
+
+    def get_blob_properties(self, container_name, blob_name, **kwargs):
+        blob_file = self._blob_file(container_name, blob_name)
+        if not os.path.exists(blob_file):
+            raise FileNotFoundError("Blob Not Found: [{}]".format(blob_name))
+        return SimpleNamespace(name=blob_name, properties=self._properties(blob_file))
+
+    def delete_blob(self, container_name, blob_name, **kwargs):
+        blob_file = self._blob_file(container_name, blob_name)
+        if not os.path.exists(blob_file):
+            raise FileNotFoundError("Blob Not Found: [{}]".format(blob_name))
+        os.remove(blob_file)
+        shutil.rmtree(blob_file + BLOCKS_SUFFIX, ignore_errors=True)
+
+    def list_blobs(self, container_name, prefix=None, **kwargs):
+        container_path = os.path.join(self.root_path, container_name)
+        blobs = list()
+        for dir_path, dir_names, file_names in os.walk(container_path):
+            dir_names[:] = [x for x in dir_names if not x.endswith(BLOCKS_SUFFIX)]
+            for file_name in file_names:
+                if file_name.endswith(".tmp"):
+                    continue
+                blob_name = os.path.relpath(os.path.join(dir_path, file_name), container_path).replace(os.sep, "/")
+                if not prefix or blob_name.startswith(prefix):
+                    blobs.append(SimpleNamespace(name=blob_name))
+        return sorted(blobs, key=lambda x: x.name)
@@ -0,0 +1,181 @@
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pytz import timezone
+
+import runner
+from data_commit import write_batch
+from meter_session_manager import MeterSessionManager
+from metrics import METRICS_PORT, metrics, start_metrics_server
+from odr_scheduler import OdrScheduler
+from session_cache import SessionCache
+
+# Cadence (Seconds) of each Fetch Stage
+DAEMON_ODR_INTERVAL = int(os.getenv("DAEMON_ODR_INTERVAL", 3600))
+DAEMON_METER_INFO_INTERVAL = int(os.getenv("DAEMON_METER_INFO_INTERVAL", 86400))
+DAEMON_TRENDS_INTERVAL = int(os.getenv("DAEMON_TRENDS_INTERVAL", 86400))
+# Wait before a Failed Stage is tried again
+DAEMON_RETRY_INTERVAL = int(os.getenv("DAEMON_RETRY_INTERVAL", 300))
+DAEMON_MAX_SLEEP = 60
+DAEMON_MAX_WORKERS = int(os.getenv("DAEMON_MAX_WORKERS", 8))
+# Aggregate Sources each Stage Writes; only those are Aggregated again after it Ran
+STAGE_AGGREGATE_SOURCES = {"METER_INFO": [runner.INTERVAL_TRENDS_DATAFILE],
+                           "TRENDS": [runner.DAILY_TRENDS_DATAFILE, runner.MONTHLY_TRENDS_DATAFILE],
+                           "ODR": [runner.PAST_24_HOUR_TREND_DATAFILE, runner.HISTORIC_HOURLY_TREND_STORE]}
+
+
+class MeterWorker:
+    def __init__(self, meter_name, username, password, file_path, blob_prefix="", session_cache=None, esiid=None):
+        self.meter_name = meter_name
+        self.username = username
+        self.password = password
+        self.esiid = esiid
+        self.file_path = file_path
+        self.blob_prefix = blob_prefix
+        self.session_cache = session_cache
+        self.msm = None
+        self.latest_billed_data = None
+        # History Rollups as last Materialized, Updated in Place from the New Readings
+        self.history_rollups = None
+        self.next_due = {"METER_INFO": 0, "TRENDS": 0, "ODR": 0}
+        os.makedirs(file_path, exist_ok=True)
+
+    def _load_billed_reading(self):
+        last_billed = runner.read_data_from_file_as_pdf(runner.LAST_BILLED_METER_READING_DATAFILE, self.file_path) \
+            if os.path.exists(os.path.join(self.file_path, runner.LAST_BILLED_METER_READING_DATAFILE)) else None
+        if last_billed is None or last_billed.empty:
+            return None
+        return {"LAST_BILLED_DATE": last_billed['LAST_BILLED_DATE'][0],
+                "LAST_BILLED_READING": last_billed['LAST_BILLED_READING'][0]}
+
+    # Each Stage Commits its own Writes: a Failed Stage leaves nothing Half Written behind
+    def _run_stage(self, stage, interval, stage_func):
+        try:
+            with write_batch(self.file_path):
+                stage_func()
+            self.next_due[stage] = time.time() + interval
+            return True
+        except Exception as e:
+            print("[{}] Stage [{}] Failed: {}".format(self.meter_name, stage, e))
+            self.next_due[stage] = time.time() + DAEMON_RETRY_INTERVAL
+            return False
+
+    def next_due_time(self):
+        return min(self.next_due.values())
+
+    def run_due(self, now):
+        if self.msm is None:
+            # Session and Token live as long as the Process; an Expired Token is renewed on a 401
+            self.msm = MeterSessionManager(username=self.username, password=self.password,
+                                           session_cache=self.session_cache, esiid=self.esiid)
+            self.msm.set_auth_keys()
+            self.latest_billed_data = self._load_billed_reading()
+        start_time = datetime.datetime.now(tz=timezone("US/Central"))
+        ran_stages = list()
+        if self.next_due["METER_INFO"] <= now or self.msm.meter_details is None:
+            if self._run_stage("METER_INFO", DAEMON_METER_INFO_INTERVAL,
+                               lambda: runner.fetch_meter_info(self.msm, self.file_path)):
+                ran_stages.append("METER_INFO")
+            if self.msm.meter_details is None:
+                return ran_stages
+
+        odr_scheduler = None
+        if self.next_due["ODR"] <= now:
+            odr_scheduler = OdrScheduler(self.msm, os.path.join(self.file_path, runner.ODR_RATE_LIMIT_DATAFILE))
+            if not self._run_stage("ODR", DAEMON_ODR_INTERVAL, odr_scheduler.submit):
+                odr_scheduler = None
+
+        if self.next_due["TRENDS"] <= now:
+            def fetch_trends():
+                # The Billed Reading is only asked for once its Next Check is Due, whatever the Trends did before
+                self.latest_billed_data = runner.fetch_billed_reading(self.msm, self.file_path)
+                runner.fetch_usage_trends(self.msm, self.file_path)
+
+            if self._run_stage("TRENDS", DAEMON_TRENDS_INTERVAL, fetch_trends):
+                ran_stages.append("TRENDS")
+
+        if odr_scheduler:
+            try:
+                if runner.store_meter_reading(odr_scheduler.collect(), self.latest_billed_data, self.file_path,
+                                              start_time):
+                    ran_stages.append("ODR")
+            except Exception as e:
+                print("[{}] Storing Meter Reading Failed: {}".format(self.meter_name, e))
+        return ran_stages
+
+
+class MeterDaemon:
+    def __init__(self, workers, max_workers=DAEMON_MAX_WORKERS):
+        self.workers = workers
+        self.max_workers = max_workers
+        self.blob_obj = runner.get_blob_obj() if runner.BLOB_ENABLED else None
+
+    def _run_worker(self, worker):
+        ran_stages = worker.run_due(time.time())
+        if ran_stages:
+            print("[{}] Completed Stages: {}".format(worker.meter_name, ran_stages))
+            sources = [source for stage in ran_stages for source in STAGE_AGGREGATE_SOURCES[stage]]
+            worker.history_rollups = runner.materialize_aggregates(worker.file_path, sources, worker.history_rollups)
+        return ran_stages
+
+    def run_cycle(self):
+        due_workers = [x for x in self.workers if x.msm is None or x.next_due_time() <= time.time()]
+        if not due_workers:
+            return list()
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(due_workers)))) as executor:
+            results = list(executor.map(self._safe_run_worker, due_workers))
+        dirty_workers = [worker for worker, ran_stages in zip(due_workers, results) if ran_stages]
+        metrics.write_files(runner.data_file_path)
+        # One Batched Flush per Cycle; Unchanged Files are Skipped by the Blob Sync
+        if self.blob_obj:
+            for worker in dirty_workers:
+                # The Daemon's Metrics (all its Meters) go up with each Meter's Files, where the Data Files expect them
+                metrics.write_files(worker.file_path)
+                runner.upload_all_files_to_blob(file_path=worker.file_path, blob_prefix=worker.blob_prefix,
+                                                blob_obj=self.blob_obj)
+            if dirty_workers:
+                runner.upload_shared_files(blob_obj=self.blob_obj)
+        return dirty_workers
+
+    def _safe_run_worker(self, worker):
+        try:
+            return self._run_worker(worker)
+        except Exception as e:
+            print("[{}] Cycle Failed: {}".format(worker.meter_name, e))
+            worker.msm = None
+            worker.next_due = {stage: time.time() + DAEMON_RETRY_INTERVAL for stage in worker.next_due}
+            return list()
+
+    def run_forever(self):
+        if METRICS_PORT:
+            start_metrics_server(METRICS_PORT)
+        if self.blob_obj:
+            runner.download_shared_files(self.blob_obj)
+            for worker in self.workers:
+                runner.download_all_files_from_blob(file_path=worker.file_path, blob_prefix=worker.blob_prefix,
+                                                    blob_obj=self.blob_obj)
+        print("Meter Daemon Started for [{}] Meters".format(len(self.workers)))
+        while True:
+            self.run_cycle()
+            next_due = min(worker.next_due_time() for worker in self.workers)
+            time.sleep(min(DAEMON_MAX_SLEEP, max(1, next_due - time.time())))
+
+
+def build_workers(fleet=False):
+    session_cache = SessionCache(os.path.join(runner.data_file_path, runner.SESSION_CACHE_DATAFILE))
+    if not fleet:
+        username, password = runner.get_meter_credentials()
+        return [MeterWorker("default", username, password, runner.data_file_path, session_cache=session_cache)]
+    import fleet_runner
+    meters, _ = fleet_runner.get_fleet_meters()
+    return [MeterWorker(meter["METER_NAME"], meter["USERNAME"], meter["PASSWORD"],
+                        os.path.join(runner.data_file_path, meter["METER_NAME"]), meter["METER_NAME"] + "/",
+                        session_cache, meter["ESIID"]) for meter in meters]
+
+
+if __name__ == "__main__":
+    # Usage: python meter_daemon.py [fleet]
+    MeterDaemon(build_workers(fleet=sys.argv[1:2] == ["fleet"])).run_forever()
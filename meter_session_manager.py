@@ -1,20 +1,46 @@
 import configparser
 import datetime
 import json
+import os
 import time
+from urllib.parse import urlparse
 
 from dateutil.relativedelta import relativedelta
-from pytz import timezone
-from requests import sessions
+
+from meter_transport import default_transport
+from metrics import metrics
+from odr_scheduler import OdrScheduler, backoff_delays
+from request_scheduler import PRIORITY_DEFAULT, PRIORITY_ODR, default_scheduler
+from response_parser import parse_daily_usage_frame, parse_interval_read_frame, parse_monthly_usage_frame
+from time_series import TimeSeries
 
 api_config = configparser.ConfigParser()
 api_config.read("api_endpoints.ini")
+# Point the Manager at another Portal (e.g. the Local Mock Server) without editing the INI
+if os.getenv("SMART_METER_PORTAL_BASE"):
+    api_config['API_ENDPOINTS']['PORTAL_BASE'] = os.getenv("SMART_METER_PORTAL_BASE")
+if os.getenv("SMART_METER_API_BASE"):
+    api_config['API_ENDPOINTS']['API_BASE'] = os.getenv("SMART_METER_API_BASE")
+
+
+# Endpoint Path -> (Requests per Minute, Concurrent Requests) from the [RATE_LIMITS] Section
+def get_endpoint_limits():
+    if not api_config.has_section('RATE_LIMITS'):
+        return {}
+    endpoint_limits = dict()
+    for endpoint_key, limits in api_config['RATE_LIMITS'].items():
+        requests_per_minute, concurrency = (x.strip() for x in limits.split(','))
+        api_name = urlparse(api_config['API_ENDPOINTS']['API_BASE'] + api_config['API_ENDPOINTS'][endpoint_key]).path
+        endpoint_limits[api_name] = (float(requests_per_minute), int(concurrency))
+    return endpoint_limits
 
 
 class MeterSessionManager:
-    def __init__(self, username, password):
-        self.meter_session = sessions.session()
-        self.meter_session.headers.update({
+    def __init__(self, username, password, session_cache=None, transport=None, scheduler=None, esiid=None):
+        self.transport = transport or default_transport()
+        # All Portal Requests of the Process (every Meter) share one Scheduler
+        self.scheduler = scheduler or default_scheduler(get_endpoint_limits())
+        self.meter_session = self.transport.new_session({
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) AppleWebKit/537.36 (KHTML,'
                           ' like Gecko) Chrome/77.0.3865.90 Safari/537.36',
             'Accept-Encoding': 'gzip, deflate',
@@ -26,46 +52,91 @@ class MeterSessionManager:
         })
         self.username = username
         self.password = password
+        self.session_cache = session_cache
         self.meter_session_cookies = None
         self.meter_auth_token = None
+        # An Account can hold several Meters: ESIID picks one, else the Account's Default Meter is used
+        self.esiid = esiid
         self.meter_details = None
-        self.set_cookies()
+        if not self.load_cached_session():
+            self.set_cookies()
         print("Created Meter Session Manager Object")
 
-    def call_meter_api(self, url, method="GET", payload=None, total_tries=3, retry_delay=30, pass_auth_header=True,
-                       parse_response=True):
+    def _send_request(self, url, method, data, pass_auth_header, priority=PRIORITY_DEFAULT):
+        api_name = urlparse(url).path
+        with self.scheduler.slot(api_name, priority):
+            start = time.perf_counter()
+            try:
+                response = self.transport.send(self.meter_session, method, url, data=data,
+                                               auth_token=self.meter_auth_token if pass_auth_header else None)
+            except Exception:
+                metrics.inc("api_requests_total", api=api_name, status="error")
+                raise
+            finally:
+                metrics.observe("api_request_duration_seconds", time.perf_counter() - start, api=api_name)
+        metrics.inc("api_requests_total", api=api_name, status=response.status_code)
+        metrics.inc("api_bytes_total", len(data or ""), api=api_name, direction="out")
+        # Bytes on the Wire: the Compressed Length when the Portal gzips the Response
+        metrics.inc("api_bytes_total", int(response.headers.get("Content-Length") or len(response.content or b"")),
+                    api=api_name, direction="in")
+        if response.headers.get("Content-Encoding") == "gzip":
+            metrics.inc("api_gzip_responses_total", api=api_name)
+        return response
+
+    def call_meter_api(self, url, method="GET", payload=None, total_tries=3, retry_delay=5, pass_auth_header=True,
+                       parse_response=True, idempotent=True, priority=PRIORITY_DEFAULT):
         print("Calling URL : [{}]".format(url))
+        api_name = urlparse(url).path
         data = json.dumps(payload) if payload else None
+        retry_delays = backoff_delays(retry_delay, retry_delay * 8)
+        reauthenticated = False
         for try_num in range(1, total_tries + 1):
+            response = error = None
             try:
-                if method == "GET":
-                    response = self.meter_session.get(url=url, data=json.dumps(payload))
-                else:
-                    if pass_auth_header:
-                        auth_header = {"Authorization": "Bearer {}".format(self.meter_auth_token)}
-                        self.meter_session.headers.update(auth_header)
-                        response = self.meter_session.post(url=url, data=data)
-                    else:
-                        response = self.meter_session.post(url=url, data=data)
-                if 200 <= int(response.status_code) < 300:
-                    if parse_response:
-                        return response.json()
-                    else:
-                        return response
-                else:
-                    raise RuntimeError(response.content)
+                response = self._send_request(url, method, data, pass_auth_header, priority)
+                if int(response.status_code) == 401 and pass_auth_header and not reauthenticated:
+                    # Cached Token has Expired on the Portal: Log in again and replay the Request once
+                    print("Authorization Token Rejected. Re-Authenticating.")
+                    reauthenticated = True
+                    metrics.inc("api_retries_total", api=api_name, reason="unauthorized")
+                    self.reauthenticate()
+                    response = self._send_request(url, method, data, pass_auth_header, priority)
             except Exception as e:
-                time.sleep(retry_delay)
-                if try_num == total_tries:
-                    print("Max Retries Reached while making the request.")
-                    raise OverflowError("Max Tries Exhausted")
+                error = e
+            if error is None and 200 <= int(response.status_code) < 300:
+                self.scheduler.report(api_name, ok=True)
+                if parse_response:
+                    return response.json()
+                else:
+                    return response
+            if not self.transport.is_retryable(response, error, idempotent):
+                # Client Errors (Bad Request, Rejected Login) will not succeed on a Retry
+                if error is not None:
+                    raise error
+                raise RuntimeError(response.content)
+            if try_num == total_tries:
+                print("Max Retries Reached while making the request.")
+                raise OverflowError("Max Tries Exhausted")
+            delay = next(retry_delays)
+            retry_after = self.transport.retry_after(response) if response is not None else None
+            metrics.inc("api_retries_total", api=api_name,
+                        reason=type(error).__name__ if error is not None else str(response.status_code))
+            # The Retry waits in the Scheduler, which also holds back other Requests to the Failing Endpoint
+            self.scheduler.report(api_name, ok=False, delay=max(delay, retry_after or 0),
+                                  throttled=response is not None and (int(response.status_code) == 429 or
+                                                                      retry_after is not None))
 
     def set_cookies(self):
         print("Setting the Session Cookies")
-        self.meter_session.get(url=api_config['API_ENDPOINTS']['PORTAL_BASE'])
+        portal_base = api_config['API_ENDPOINTS']['PORTAL_BASE']
+        with self.scheduler.slot(urlparse(portal_base).path or "/"):
+            self.transport.send(self.meter_session, "GET", portal_base)
         self.meter_session_cookies = self.meter_session.cookies
 
-    def set_auth_keys(self):
+    def set_auth_keys(self, force=False):
+        if self.meter_auth_token and not force:
+            print("Reusing Cached Authorization Token")
+            return
         print("Fetching Authorization Token")
         req_payload = {
             "username": self.username,
@@ -73,26 +144,75 @@ class MeterSessionManager:
             "rememberMe": "true"
         }
         api_url = api_config['API_ENDPOINTS']['API_BASE'] + api_config['API_ENDPOINTS']['AUTHENTICATE_API']
-        auth_response = self.call_meter_api(url=api_url, payload=req_payload, method="POST", pass_auth_header=False)
+        with metrics.span("login"):
+            auth_response = self.call_meter_api(url=api_url, payload=req_payload, method="POST",
+                                                pass_auth_header=False)
         self.meter_auth_token = auth_response.get('token')
+        self.save_cached_session()
+
+    def reauthenticate(self):
+        if self.session_cache:
+            self.session_cache.invalidate(self.username)
+        self.meter_session.cookies.clear()
+        self.set_cookies()
+        self.set_auth_keys(force=True)
+
+    def load_cached_session(self):
+        if not self.session_cache:
+            return False
+        cached_session = self.session_cache.get(self.username, self.password)
+        if not cached_session:
+            return False
+        print("Restoring Session Cookies and Token from Cache")
+        for cookie in cached_session["cookies"]:
+            self.meter_session.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"],
+                                           path=cookie["path"])
+        self.meter_session_cookies = self.meter_session.cookies
+        self.meter_auth_token = cached_session["token"]
+        return True
+
+    def save_cached_session(self):
+        if not self.session_cache or not self.meter_auth_token:
+            return
+        cookies = [{"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+                   for c in self.meter_session.cookies]
+        self.session_cache.put(self.username, self.password, {"cookies": cookies, "token": self.meter_auth_token})
 
     def get_dashboard(self):
         print("Fetching Dashboard MetaData")
         dashboard_url = api_config['API_ENDPOINTS']['API_BASE'] + api_config['API_ENDPOINTS']['DASHBOARD_API']
         dashboard_meta = self.call_meter_api(url=dashboard_url, method="POST")
         dashboard_meta = dashboard_meta['data']
-        self.meter_details = dashboard_meta['defaultMeterDetails']
+        self.meter_details = self.select_meter(dashboard_meta)
         assert self.meter_details['esiid']
         print("Meter Details Fetched : {}".format(self.meter_details))
+        if str(self.meter_details['esiid']) != str(dashboard_meta['defaultMeterDetails']['esiid']):
+            # The Latest Intervals on the Dashboard belong to the Default Meter, not the Selected one
+            dashboard_meta = dict(dashboard_meta, usageData=None)
         return dashboard_meta
 
-    def get_monthly_usage_trends(self, num_months=12, return_raw=False):
-        print("Fetching Monthly Trends for Last [{}] months".format(num_months))
+    # The Dashboard lists every Meter of the Account next to the Default one
+    def select_meter(self, dashboard_meta):
+        default_meter = dashboard_meta['defaultMeterDetails']
+        if not self.esiid:
+            return default_meter
+        meters = [default_meter] + [meter for value in dashboard_meta.values() if isinstance(value, list)
+                                    for meter in value if isinstance(meter, dict) and 'esiid' in meter]
+        for meter in meters:
+            if str(meter['esiid']) == str(self.esiid):
+                return meter
+        raise AssertionError("ESIID [{}] is not a Meter of this Account".format(self.esiid))
+
+    def get_monthly_usage_trends(self, num_months=12, return_raw=False, start_date=None, as_frame=False):
         monthly_usage_url = api_config['API_ENDPOINTS']['API_BASE'] + api_config['API_ENDPOINTS'][
             'MONTHLY_METER_READ_API']
         end_date = datetime.datetime.today()
-        start_date = end_date - relativedelta(months=num_months)
-        start_date = start_date.replace(day=1)
+        if start_date:
+            print("Fetching Monthly Trends since [{}]".format(start_date.strftime("%m/%d/%Y")))
+        else:
+            print("Fetching Monthly Trends for Last [{}] months".format(num_months))
+            start_date = end_date - relativedelta(months=num_months)
+            start_date = start_date.replace(day=1)
         payload = {"esiid": str(self.meter_details['esiid']),
                    "startDate": start_date.strftime("%m/%d/%Y"),
                    "endDate": end_date.strftime("%m/%d/%Y")}
@@ -100,21 +220,26 @@ class MeterSessionManager:
             "monthlyData")
         if return_raw:
             return monthly_usage_response
-        monthly_usage = list()
-        for usage_month in monthly_usage_response:
-            read_start_date = datetime.datetime.strptime(usage_month["startdate"], "%m/%d/%Y")
-            read_end_date = datetime.datetime.strptime(usage_month["enddate"], "%m/%d/%Y")
-            kwh_usage = usage_month["actl_kwh_usg"]
-            read_date = read_start_date + (read_end_date - read_start_date) / 2
-            monthly_usage.append({"MONTHLY_DATE": read_date.date().replace(day=1), "USAGE": kwh_usage})
-        return monthly_usage
-
-    def get_daily_usage_trends(self, num_days=30, specific_date=None, return_raw=False):
-        print("Fetching Daily Trends for Last [{}] days".format(num_days))
+        if as_frame:
+            return parse_monthly_usage_frame(monthly_usage_response)
+        return self.parse_monthly_usage(monthly_usage_response)
+
+    # One Row Dict per Billing Cycle (Two Cycles can fall in the same Month); as_frame skips building them
+    @staticmethod
+    def parse_monthly_usage(monthly_usage_response):
+        return parse_monthly_usage_frame(monthly_usage_response).to_dict(orient='records')
+
+    def get_daily_usage_trends(self, num_days=30, specific_date=None, return_raw=False, start_date=None,
+                               as_frame=False):
         daily_usage_url = api_config['API_ENDPOINTS']['API_BASE'] + api_config['API_ENDPOINTS']['DAILY_METER_READ_API']
         if specific_date:
+            print("Fetching Daily Trends for [{}]".format(specific_date.strftime("%m/%d/%Y")))
             start_date = end_date = specific_date
+        elif start_date:
+            end_date = datetime.datetime.today() - relativedelta(days=1)
+            print("Fetching Daily Trends since [{}]".format(start_date.strftime("%m/%d/%Y")))
         else:
+            print("Fetching Daily Trends for Last [{}] days".format(num_days))
             end_date = datetime.datetime.today() - relativedelta(days=1)
             start_date = end_date - relativedelta(days=num_days)
         payload = {"esiid": str(self.meter_details['esiid']),
@@ -123,62 +248,60 @@ class MeterSessionManager:
         daily_usage_response = self.call_meter_api(url=daily_usage_url, method="POST", payload=payload).get("dailyData")
         if return_raw:
             return daily_usage_response
-        daily_usage = list()
-        for usage_day in daily_usage_response:
-            read_date = datetime.datetime.strptime(usage_day["date"], "%m/%d/%Y")
-            kwh_usage = usage_day["reading"]
-            daily_usage.append({"DAILY_DATE": read_date.date(), "USAGE": kwh_usage})
-        return daily_usage
-
-    def get_on_demand_read(self):
+        if as_frame:
+            return parse_daily_usage_frame(daily_usage_response)
+        return self.parse_daily_usage(daily_usage_response)
+
+    @staticmethod
+    def parse_daily_usage(daily_usage_response):
+        return TimeSeries.from_frame(parse_daily_usage_frame(daily_usage_response), "DAILY_DATE", "USAGE")
+
+    def get_interval_usage(self, start_date, end_date, return_raw=False, priority=PRIORITY_DEFAULT):
+        print("Fetching Interval Usage from [{}] to [{}]".format(start_date.strftime("%m/%d/%Y"),
+                                                                 end_date.strftime("%m/%d/%Y")))
+        interval_usage_url = api_config['API_ENDPOINTS']['API_BASE'] + api_config['API_ENDPOINTS'][
+            'INTERVAL_METER_READ_API']
+        payload = {"esiid": str(self.meter_details['esiid']),
+                   "startDate": start_date.strftime("%m/%d/%Y"),
+                   "endDate": end_date.strftime("%m/%d/%Y")}
+        interval_usage_response = self.call_meter_api(url=interval_usage_url, method="POST", payload=payload,
+                                                      priority=priority).get("intervaldata")
+        if return_raw:
+            return interval_usage_response
+        return parse_interval_read_frame(interval_usage_response)
+
+    def get_on_demand_read(self, state_file=os.path.join("data_files", "odr_rate_limits.json")):
         print("Invoking On Demand Meter Reading")
-        invoke = False
-        l_odr = self.get_last_reading()
-        if not l_odr.get("odrstatus"):
-            print("No Recent On-Demand Meter Reads. Ready to Trigger one now.")
-            invoke = True
-        else:
-            l_odr_time = l_odr.get("odrdate")
-            print("Last On Demand Read Triggered at: [{}]".format(l_odr_time))
-            print("Last On Demand Read Status: [{}]".format(l_odr.get("odrstatus")))
-            l_odr_time = l_odr_time if l_odr_time else "01/01/1970 00:00:00"
-            l_odr_time = datetime.datetime.strptime(l_odr_time, "%m/%d/%Y %H:%M:%S")
-            l_odr_time = timezone("US/Central").localize(l_odr_time)
-            current_time = datetime.datetime.now(tz=timezone("US/Central"))
-            time_diff = (current_time - l_odr_time).seconds
-            # ODR API Limit: 2 - Per hour, 24 - Per Day
-            print("Last ODR Call was made [{}] seconds earlier".format(time_diff))
-            if time_diff > 3600:
-                print("Last On Demand Read was before 60 minutes. Ready to Trigger one now.")
-                invoke = True
-        if invoke:
-            on_demand_read_url = api_config['API_ENDPOINTS']['API_BASE'] + api_config['API_ENDPOINTS'][
-                'ON_DEMAND_METER_READ_API']
-            payload = {"ESIID": str(self.meter_details['esiid']), "MeterNumber": str(self.meter_details['meterNumber'])}
-            on_demand_read_response = self.call_meter_api(url=on_demand_read_url, method="POST", payload=payload).get(
-                "data")
-            print("Response: [{}]".format(on_demand_read_response))
-            if on_demand_read_response.get("statusCode") != '0':
-                print("Failed to Submit On Demand Meter Read Request")
-                pass
-        else:
-            print("Latest Meter Read was less than 60 minutes before. Not calling now.")
-            pass
-        for i in range(10):
-            l_odr = self.get_last_reading()
-            if l_odr.get("odrstatus") == "COMPLETED":
-                odr_date = datetime.datetime.strptime(l_odr["odrdate"], "%m/%d/%Y %H:%M:%S")
-                odr_reading = float(l_odr["odrread"])
-                usage_since_last_read = {"USAGE_SINCE_LAST_OD_READ": int(float(l_odr["odrusage"]))}
-                return usage_since_last_read, {"CURRENT_READING_TIME": odr_date, "CURRENT_READING": odr_reading}
-            time.sleep(30)
-        return 0, 0
+        odr_scheduler = OdrScheduler(self, state_file)
+        odr_scheduler.submit()
+        return odr_scheduler.collect()
+
+    def submit_on_demand_read(self):
+        on_demand_read_url = api_config['API_ENDPOINTS']['API_BASE'] + api_config['API_ENDPOINTS'][
+            'ON_DEMAND_METER_READ_API']
+        payload = {"ESIID": str(self.meter_details['esiid']), "MeterNumber": str(self.meter_details['meterNumber'])}
+        # Not Idempotent: a Timed-Out Submit may already have triggered a Read
+        on_demand_read_response = self.call_meter_api(url=on_demand_read_url, method="POST", payload=payload,
+                                                      idempotent=False, priority=PRIORITY_ODR).get("data")
+        print("Response: [{}]".format(on_demand_read_response))
+        if on_demand_read_response.get("statusCode") != '0':
+            print("Failed to Submit On Demand Meter Read Request")
+            return False
+        return True
+
+    @staticmethod
+    def parse_on_demand_read(l_odr):
+        odr_date = datetime.datetime.strptime(l_odr["odrdate"], "%m/%d/%Y %H:%M:%S")
+        odr_reading = float(l_odr["odrread"])
+        usage_since_last_read = {"USAGE_SINCE_LAST_OD_READ": int(float(l_odr["odrusage"]))}
+        return usage_since_last_read, {"CURRENT_READING_TIME": odr_date, "CURRENT_READING": odr_reading}
 
     def get_last_reading(self):
         print("Check Last Reading Status")
         last_reading_url = api_config['API_ENDPOINTS']['API_BASE'] + api_config['API_ENDPOINTS']['LAST_METER_READ_API']
         payload = {"ESIID": str(self.meter_details['esiid'])}
-        last_reading_response = self.call_meter_api(url=last_reading_url, method="POST", payload=payload).get("data")
+        last_reading_response = self.call_meter_api(url=last_reading_url, method="POST", payload=payload,
+                                                    priority=PRIORITY_ODR).get("data")
         return last_reading_response
 
     def get_latest_billed_reading(self):
@@ -0,0 +1,70 @@
+import os
+import threading
+
+from requests import sessions
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, ConnectTimeout, Timeout
+
+# Connections kept open per Host; sized for the Fleet / Daemon Worker Pools
+TRANSPORT_POOL_SIZE = int(os.getenv("TRANSPORT_POOL_SIZE", 32))
+TRANSPORT_CONNECT_TIMEOUT = float(os.getenv("TRANSPORT_CONNECT_TIMEOUT", 5))
+TRANSPORT_READ_TIMEOUT = float(os.getenv("TRANSPORT_READ_TIMEOUT", 60))
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Rejected before the Portal acts on them, so even a Meter Read Request can be sent again
+UNPROCESSED_STATUS_CODES = {429, 503}
+
+_transport_lock = threading.Lock()
+_default_transport = None
+
+
+# One Connection Pool shared by every Meter Session; Cookies stay per Session, the Token goes per Request
+class MeterTransport:
+    def __init__(self, pool_size=TRANSPORT_POOL_SIZE, connect_timeout=TRANSPORT_CONNECT_TIMEOUT,
+                 read_timeout=TRANSPORT_READ_TIMEOUT):
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.timeout = (connect_timeout, read_timeout)
+
+    # Sessions must not be closed: Closing one would close the Shared Adapter
+    def new_session(self, headers=None):
+        session = sessions.session()
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+        session.headers.update(headers or {})
+        return session
+
+    def send(self, session, method, url, data=None, auth_token=None):
+        headers = {"Authorization": "Bearer {}".format(auth_token)} if auth_token else None
+        return session.request(method, url, data=data, headers=headers, timeout=self.timeout)
+
+    # Transient Failures are retried; a Request that may have Changed State only if it never reached the Portal
+    @staticmethod
+    def is_retryable(response=None, error=None, idempotent=True):
+        if error is not None:
+            return isinstance(error, ConnectTimeout) or (idempotent and isinstance(error, (ConnectionError, Timeout)))
+        return int(response.status_code) in (RETRYABLE_STATUS_CODES if idempotent else UNPROCESSED_STATUS_CODES)
+
+    @staticmethod
+    def retry_after(response):
+        try:
+            return float(response.headers.get("Retry-After"))
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+    # Connections opened vs Requests sent shows how well Keep-Alive is working
+    def stats(self):
+        connections_opened = requests_sent = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections_opened += pool.num_connections
+                requests_sent += pool.num_requests
+        return {"CONNECTIONS_OPENED": connections_opened, "REQUESTS_SENT": requests_sent}
+
+
+def default_transport():
+    global _default_transport
+    with _transport_lock:
+        if _default_transport is None:
+            _default_transport = MeterTransport()
+        return _default_transport
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_PREFIX = "smart_meter_"
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_JSON_DATAFILE = "metrics.json"
+METRICS_PROMETHEUS_DATAFILE = "metrics.prom"
+
+METRIC_HELP = {
+    "stage_duration_seconds": "Wall Time spent in a Pipeline Stage",
+    "stage_failures_total": "Pipeline Stages that raised an Exception",
+    "stage_duration_seconds_max": "Slowest Run of a Pipeline Stage",
+    "api_request_duration_seconds": "Latency of a single Smart Meter API Request",
+    "api_request_duration_seconds_max": "Slowest single Smart Meter API Request",
+    "api_requests_total": "Smart Meter API Requests by Response Status",
+    "api_retries_total": "Smart Meter API Requests that were Retried",
+    "api_bytes_total": "Smart Meter API Payload Bytes by Direction",
+    "api_gzip_responses_total": "Smart Meter API Responses that arrived Gzip Compressed",
+    "startup_seconds": "Time from CLI Start until a Command had its Modules loaded",
+    "odr_polls_total": "On Demand Read Status Polls",
+    "odr_requests_total": "On Demand Reads by Outcome",
+    "blob_files_total": "Files Transferred to or from BLOB by Direction",
+    "blob_bytes_total": "Store Bytes (as Sent, Compressed) Transferred to or from BLOB by Direction",
+    "anomalies_total": "Meter Readings Flagged by the Anomaly Detector by Kind",
+    "snapshots_total": "Dashboard Snapshots by Outcome of the Render Service",
+    "scheduler_wait_seconds": "Time a Portal Request waited in the Request Scheduler by Priority",
+    "scheduler_wait_seconds_max": "Longest Wait of a Portal Request in the Request Scheduler by Priority",
+    "scheduler_backoffs_total": "Endpoints Paused and Slowed by the Request Scheduler after a Failed Request",
+}
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels) + "}"
+
+
+# Process-Wide Counters and Timings; Spans time a Stage and count its Failures
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = dict()
+        self.timings = dict()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            timing = self.timings.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["sum"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    # Usable as a Context Manager or as a Function Decorator
+    @contextmanager
+    def span(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("stage_failures_total", stage=stage, **labels)
+            raise
+        finally:
+            self.observe("stage_duration_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters = dict()
+            self.timings = dict()
+
+    def snapshot(self):
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            timings = [dict({"name": name, "labels": dict(labels)}, **timing)
+                       for (name, labels), timing in sorted(self.timings.items())]
+        return {"generated_at": time.time(), "counters": counters, "timings": timings}
+
+    def to_prometheus(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+        lines = list()
+        described = set()
+
+        def describe(name, metric_type):
+            if name not in described:
+                described.add(name)
+                lines.append("# HELP {}{} {}".format(METRICS_PREFIX, name, METRIC_HELP.get(name, name)))
+                lines.append("# TYPE {}{} {}".format(METRICS_PREFIX, name, metric_type))
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append("{}{}{} {}".format(METRICS_PREFIX, name, _label_text(labels), value))
+        for (name, labels), timing in timings:
+            describe(name, "summary")
+            for suffix in ("count", "sum"):
+                lines.append("{}{}_{}{} {}".format(METRICS_PREFIX, name, suffix, _label_text(labels), timing[suffix]))
+        for (name, labels), timing in timings:
+            describe(name + "_max", "gauge")
+            lines.append("{}{}_max{} {}".format(METRICS_PREFIX, name, _label_text(labels), timing["max"]))
+        return "\n".join(lines) + "\n"
+
+    # JSON for the Data Files, Prometheus Text for the Node Exporter Textfile Collector
+    def write_files(self, file_path):
+        for file_name, content in ((METRICS_JSON_DATAFILE, json.dumps(self.snapshot(), indent=1, sort_keys=True)),
+                                   (METRICS_PROMETHEUS_DATAFILE, self.to_prometheus())):
+            local_file_name = os.path.join(file_path, file_name)
+            with open(local_file_name + ".tmp", "w") as f:
+                f.write(content)
+            os.replace(local_file_name + ".tmp", local_file_name)
+
+
+metrics = MetricsRegistry()
+
+
+# Serve /metrics (Prometheus) and /metrics.json from a Background Thread
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                payload, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+            elif self.path.startswith("/metrics"):
+                payload, content_type = metrics.to_prometheus().encode(), "text/plain; version=0.0.4"
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-server", daemon=True).start()
+    print("Serving Metrics at [http://{}:{}/metrics]".format(host, httpd.server_address[1]))
+    return httpd
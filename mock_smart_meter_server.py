@@ -0,0 +1,228 @@
+import configparser
+import datetime
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+api_config = configparser.ConfigParser()
+api_config.read("api_endpoints.ini")
+API_PREFIX = "/api"
+STATS_PATH = "/__stats"
+
+
+def _route(api_name):
+    return API_PREFIX + api_config['API_ENDPOINTS'][api_name]
+
+
+# Deterministic Pseudo-Random kWh so Repeated Runs see the same Data
+def _usage(esiid, key, scale):
+    digest = hashlib.md5("{}:{}".format(esiid, key).encode()).hexdigest()
+    return round(int(digest[:8], 16) / 0xFFFFFFFF * scale, 3)
+
+
+class MockMeterState:
+    def __init__(self, odr_delay):
+        self.odr_delay = odr_delay
+        self.tokens = dict()
+        self.odr_requests = dict()
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.route_counts = dict()
+
+    def record(self, route, bytes_in, bytes_out, error):
+        with self.lock:
+            self.request_count += 1
+            self.error_count += 1 if error else 0
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.route_counts[route] = self.route_counts.get(route, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            return {"REQUEST_COUNT": self.request_count, "ERROR_COUNT": self.error_count,
+                    "BYTES_IN": self.bytes_in, "BYTES_OUT": self.bytes_out, "ROUTES": dict(self.route_counts)}
+
+    def reset(self):
+        with self.lock:
+            self.request_count = self.error_count = self.bytes_in = self.bytes_out = 0
+            self.route_counts = dict()
+
+
+class MockSmartMeterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.mock_state
+
+    def _esiid(self):
+        token = self.headers.get("Authorization", "").replace("Bearer ", "")
+        return self.state.tokens.get(token)
+
+    def _send(self, status, body, route, bytes_in, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        self.state.record(route, bytes_in, len(payload), status >= 400)
+
+    def do_GET(self):
+        if self.path == STATS_PATH:
+            payload = json.dumps(self.state.stats()).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        self._send(200, {}, "PORTAL", 0, headers={"Set-Cookie": "JSESSIONID={}; Path=/".format(uuid.uuid4().hex)})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        body = json.loads(raw_body) if raw_body else {}
+        route = self.path
+        time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            self._send(500, {"error": "Injected Failure"}, route, length)
+            return
+        if route == _route('AUTHENTICATE_API'):
+            # ESIID is derived from the Username so every Mock Account is its own Meter
+            esiid = "1044" + hashlib.md5(body.get("username", "").encode()).hexdigest()[:13].upper()
+            token = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.tokens[token] = esiid
+            self._send(200, {"token": token}, route, length)
+            return
+        esiid = self._esiid()
+        if esiid is None:
+            self._send(401, {"error": "Unauthorized"}, route, length)
+            return
+        handler = {
+            _route('DASHBOARD_API'): self._dashboard,
+            _route('DAILY_METER_READ_API'): self._daily,
+            _route('MONTHLY_METER_READ_API'): self._monthly,
+            _route('INTERVAL_METER_READ_API'): self._interval,
+            _route('ON_DEMAND_METER_READ_API'): self._on_demand_read,
+            _route('LAST_METER_READ_API'): self._last_read,
+        }.get(route)
+        if handler is None:
+            self._send(404, {"error": "Unknown Route"}, route, length)
+            return
+        self._send(200, handler(esiid, body), route, length)
+
+    @staticmethod
+    def _date_range(body):
+        start_date = datetime.datetime.strptime(body["startDate"], "%m/%d/%Y").date()
+        end_date = datetime.datetime.strptime(body["endDate"], "%m/%d/%Y").date()
+        return [start_date + datetime.timedelta(days=x) for x in range((end_date - start_date).days + 1)]
+
+    @staticmethod
+    def _intervals(esiid, day, date_format):
+        rows = list()
+        for i in range(1, 97):
+            end_time = datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(minutes=15 * i)
+            rows.append({"date": day.strftime(date_format),
+                         "endtime": end_time.strftime(" %I:%M %p").lower(),
+                         "consumption": _usage(esiid, "{}:{}".format(day, i), 1.5)})
+        return rows
+
+    def _dashboard(self, esiid, body):
+        day = datetime.date.today() - datetime.timedelta(days=2)
+        return {"data": {"defaultMeterDetails": {"esiid": esiid, "meterNumber": "M" + esiid[-8:],
+                                                 "fullAddress": "MOCK ADDRESS {}".format(esiid[-4:])},
+                         "usageData": self._intervals(esiid, day, "%Y-%m-%d")}}
+
+    def _daily(self, esiid, body):
+        rows = list()
+        for day in self._date_range(body):
+            start_reading = 20000 + (day - datetime.date(2020, 1, 1)).days * 40
+            rows.append({"date": day.strftime("%m/%d/%Y"), "reading": _usage(esiid, day, 60),
+                         "startreading": start_reading, "endreading": start_reading + 40})
+        return {"dailyData": rows}
+
+    def _monthly(self, esiid, body):
+        rows = list()
+        for day in self._date_range(body):
+            if day.day != 1 or day >= datetime.date.today().replace(day=1):
+                continue
+            end_date = (day + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+            rows.append({"startdate": day.strftime("%m/%d/%Y"), "enddate": end_date.strftime("%m/%d/%Y"),
+                         "actl_kwh_usg": _usage(esiid, day, 1500)})
+        return {"monthlyData": rows}
+
+    def _interval(self, esiid, body):
+        rows = list()
+        for day in self._date_range(body):
+            rows.extend(self._intervals(esiid, day, "%m/%d/%Y"))
+        return {"intervaldata": rows}
+
+    def _on_demand_read(self, esiid, body):
+        with self.state.lock:
+            self.state.odr_requests[esiid] = datetime.datetime.now()
+        return {"data": {"statusCode": "0", "statusReason": "Request Submitted"}}
+
+    def _last_read(self, esiid, body):
+        with self.state.lock:
+            requested_at = self.state.odr_requests.get(esiid)
+        if requested_at is None:
+            return {"data": {}}
+        completed = (datetime.datetime.now() - requested_at).total_seconds() >= self.state.odr_delay
+        reading = 20000 + (datetime.datetime.now() - datetime.datetime(2020, 1, 1)).total_seconds() / 3600 * 1.5
+        return {"data": {"odrstatus": "COMPLETED" if completed else "PENDING",
+                         "odrdate": requested_at.strftime("%m/%d/%Y %H:%M:%S"),
+                         "odrread": round(reading, 3), "odrusage": _usage(esiid, requested_at, 5)}}
+
+
+class MockSmartMeterServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, odr_delay=2.0):
+        self.httpd = ThreadingHTTPServer((host, port), MockSmartMeterHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.error_rate = error_rate
+        self.httpd.mock_state = MockMeterState(odr_delay)
+        self.thread = None
+
+    @property
+    def portal_base(self):
+        return "http://{}:{}".format(*self.httpd.server_address[:2])
+
+    @property
+    def api_base(self):
+        return self.portal_base + API_PREFIX
+
+    @property
+    def state(self):
+        return self.httpd.mock_state
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-smart-meter", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    # Usage: python mock_smart_meter_server.py [port] [latency_seconds] [error_rate] [odr_delay_seconds]
+    args = sys.argv[1:] + [None] * 4
+    server = MockSmartMeterServer(port=int(args[0] or 8080), latency=float(args[1] or 0),
+                                  error_rate=float(args[2] or 0), odr_delay=float(args[3] or 2))
+    print("Mock Smart Meter Texas Portal at [{}] (API Base [{}])".format(server.portal_base, server.api_base))
+    server.httpd.serve_forever()
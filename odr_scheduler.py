@@ -0,0 +1,156 @@
+import datetime
+import json
+import os
+import random
+import threading
+import time
+
+from pytz import timezone
+
+from metrics import metrics
+
+# ODR API Limit: 2 - Per hour, 24 - Per Day
+ODR_RATE_LIMITS = {"HOURLY": (2, 3600), "DAILY": (24, 86400)}
+# A Completed Read newer than this is reused instead of triggering a new one
+ODR_REUSE_SECONDS = 3600
+ODR_POLL_BASE_DELAY = 5
+ODR_POLL_MAX_DELAY = 60
+ODR_POLL_TIMEOUT = 300
+
+_state_lock = threading.Lock()
+
+
+# Exponential Backoff Delays with Jitter (Half Fixed, Half Random)
+def backoff_delays(base_delay, max_delay, total_wait=None):
+    attempt = 0
+    waited = 0
+    while total_wait is None or waited < total_wait:
+        delay = min(max_delay, base_delay * (2 ** attempt))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        if total_wait is not None:
+            delay = min(delay, total_wait - waited)
+        waited += delay
+        attempt += 1
+        yield delay
+
+
+class TokenBucketStore:
+    def __init__(self, state_file, limits=None):
+        self.state_file = state_file
+        self.limits = limits or ODR_RATE_LIMITS
+
+    def _load(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file) as f:
+                    return json.load(f)
+            except ValueError:
+                print("Discarding Unreadable Rate Limit State: [{}]".format(self.state_file))
+        return {}
+
+    def _save(self, state):
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(state, f, sort_keys=True)
+        os.replace(tmp_file, self.state_file)
+
+    def _refill(self, buckets, now):
+        for name, (capacity, period) in self.limits.items():
+            bucket = buckets.setdefault(name, {"tokens": capacity, "updated": now})
+            elapsed = max(0, now - bucket["updated"])
+            bucket["tokens"] = min(capacity, bucket["tokens"] + elapsed * capacity / period)
+            bucket["updated"] = now
+        return buckets
+
+    def try_acquire(self, key, now=None):
+        now = time.time() if now is None else now
+        with _state_lock:
+            state = self._load()
+            buckets = self._refill(state.setdefault(str(key), {}), now)
+            if any(bucket["tokens"] < 1 for bucket in buckets.values()):
+                self._save(state)
+                return False
+            for bucket in buckets.values():
+                bucket["tokens"] -= 1
+            self._save(state)
+            return True
+
+    def seconds_until_available(self, key, now=None):
+        now = time.time() if now is None else now
+        with _state_lock:
+            buckets = self._refill(self._load().get(str(key), {}), now)
+        wait = 0
+        for name, (capacity, period) in self.limits.items():
+            wait = max(wait, (1 - buckets[name]["tokens"]) * period / capacity)
+        return wait
+
+
+class OdrScheduler:
+    def __init__(self, msm, state_file, poll_timeout=ODR_POLL_TIMEOUT):
+        self.msm = msm
+        self.bucket_store = TokenBucketStore(state_file)
+        self.poll_timeout = poll_timeout
+        self.awaiting_read = False
+        self.last_read = None
+        self.submitted_after = None
+
+    @staticmethod
+    def _read_age_seconds(l_odr):
+        l_odr_time = l_odr.get("odrdate") or "01/01/1970 00:00:00"
+        l_odr_time = datetime.datetime.strptime(l_odr_time, "%m/%d/%Y %H:%M:%S")
+        l_odr_time = timezone("US/Central").localize(l_odr_time)
+        current_time = datetime.datetime.now(tz=timezone("US/Central"))
+        return (current_time - l_odr_time).total_seconds()
+
+    # Trigger a Read if allowed and return immediately without waiting for the Meter
+    @metrics.span("odr_submit")
+    def submit(self):
+        print("Scheduling On Demand Meter Reading")
+        esiid = self.msm.meter_details['esiid']
+        l_odr = self.msm.get_last_reading()
+        odr_status = l_odr.get("odrstatus")
+        if odr_status:
+            print("Last On Demand Read Triggered at: [{}]".format(l_odr.get("odrdate")))
+            print("Last On Demand Read Status: [{}]".format(odr_status))
+            age = self._read_age_seconds(l_odr)
+            print("Last ODR Call was made [{}] seconds earlier".format(int(age)))
+            if odr_status != "COMPLETED" and age < ODR_POLL_TIMEOUT:
+                print("Last On Demand Read is still in progress. Not calling now.")
+                metrics.inc("odr_requests_total", outcome="in_progress")
+                self.awaiting_read = True
+                return False
+            if odr_status == "COMPLETED" and age < ODR_REUSE_SECONDS:
+                print("Latest Meter Read was less than 60 minutes before. Not calling now.")
+                metrics.inc("odr_requests_total", outcome="reused")
+                self.last_read = l_odr
+                return False
+        # Fall back to the Previous Completed Read if a new one cannot be taken
+        self.last_read = l_odr if odr_status == "COMPLETED" else None
+        if not self.bucket_store.try_acquire(esiid):
+            print("On Demand Read Limit reached for ESIID [{}]. Next slot in [{}] seconds.".format(
+                esiid, int(self.bucket_store.seconds_until_available(esiid))))
+            metrics.inc("odr_requests_total", outcome="rate_limited")
+            return False
+        self.submitted_after = l_odr.get("odrdate")
+        self.awaiting_read = self.msm.submit_on_demand_read()
+        metrics.inc("odr_requests_total", outcome="submitted")
+        return self.awaiting_read
+
+    # Wait for the Read with Exponential Backoff, only as long as the Meter needs
+    @metrics.span("odr_collect")
+    def collect(self):
+        if not self.awaiting_read:
+            return self.msm.parse_on_demand_read(self.last_read) if self.last_read else (0, 0)
+        poll_num = 0
+        for delay in [0] + list(backoff_delays(ODR_POLL_BASE_DELAY, ODR_POLL_MAX_DELAY, self.poll_timeout)):
+            time.sleep(delay)
+            poll_num += 1
+            metrics.inc("odr_polls_total")
+            l_odr = self.msm.get_last_reading()
+            if l_odr.get("odrstatus") == "COMPLETED" and l_odr.get("odrdate") != self.submitted_after:
+                print("On Demand Read Completed after [{}] polls".format(poll_num))
+                metrics.inc("odr_requests_total", outcome="completed")
+                return self.msm.parse_on_demand_read(l_odr)
+        print("On Demand Read did not Complete within [{}] seconds".format(self.poll_timeout))
+        metrics.inc("odr_requests_total", outcome="timed_out")
+        return self.msm.parse_on_demand_read(self.last_read) if self.last_read else (0, 0)
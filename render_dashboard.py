@@ -1,22 +1,34 @@
 import configparser
 import os
+import sqlite3
+import threading
 from datetime import datetime
 
 import pandas as pd
 import streamlit as st
-from bokeh.layouts import gridplot
-from bokeh.models import (ColumnDataSource, NumeralTickFormatter, HoverTool,
-                          Span)
-from bokeh.plotting import figure
 
-from azure_blob import AzureBlob
+from anomaly_detector import ANOMALY_FLAGS_DATAFILE
+from billing import BILL_PROJECTION_DATAFILE
+from blob_chunks import download_store
+from blob_sync import BlobSync
+from data_commit import DATA_MANIFEST_FILE
+from aggregates import HISTORY_ROLLUP_AGGREGATES, aggregate_files_list, history_rollups
+from dashboard_cache import frame_cache, ensure_blob_refresher
+from dashboard_figures import (DAILY_TRENDS_DATAFILE, INTERVAL_TRENDS_DATAFILE, MONTHLY_TRENDS_DATAFILE,
+                               PAST_24_HOUR_TREND_DATAFILE, build_grid, build_static_figures, data_file_path,
+                               data_generation, get_dashboard_meters, read_data_from_file_as_pdf)
+from render_service import read_snapshot, snapshot_figures
+from series_lod import DEFAULT_PIXEL_BUDGET, choose_level, level_of_detail, lttb
+from series_store import SeriesStore
+from usage_db import USAGE_DB_DATAFILE, USAGE_DB_ENABLED, USAGE_DB_SNAPSHOT_DATAFILE, UsageDatabase
 
 # Set Storage Mode:
 BLOB_ENABLED = True if os.getenv("BLOB_ENABLED") else False
 BLOB_ENABLED = True
 
+
 # Prepare Secrets
-if BLOB_ENABLED:
+def get_blob_credentials():
     if os.getenv("FETCH_SECRETS_FROM_ENVIRONMENT"):
         blob_account_name = os.getenv("BLOB_ACCOUNT_NAME")
         blob_account_key = os.getenv("BLOB_ACCOUNT_KEY")
@@ -29,18 +41,23 @@ if BLOB_ENABLED:
         blob_account_key = key_config['AZURE_BLOB']['BLOB_ACCOUNT_KEY']
         blob_container_name = key_config['AZURE_BLOB']['BLOB_CONTAINER_NAME']
     assert blob_account_name and blob_account_key and blob_container_name, "Could not source BLOB Credentials"
+    return blob_account_name, blob_account_key, blob_container_name
+
 
 # Set Data Files
 METER_INFO_DATAFILE = "meter_info.csv"
-MONTHLY_TRENDS_DATAFILE = "monthly_trends.csv"
-DAILY_TRENDS_DATAFILE = "daily_trends.csv"
-INTERVAL_TRENDS_DATAFILE = "interval_trends.csv"
 LAST_BILLED_METER_READING_DATAFILE = "last_billed_meter_reading.csv"
 LATEST_METER_READING_DATAFILE = "latest_meter_reading.csv"
 USAGE_SINCE_LAST_READING_DATAFILE = "usage_since_last_reading.csv"
 CURRENT_USAGE_DATAFILE = "current_usage.csv"
-PAST_24_HOUR_TREND_DATAFILE = "past_24_hour_trend.csv"
 HISTORIC_HOURLY_TREND_DATAFILE = "historic_hourly_trend.csv"
+HISTORIC_HOURLY_TREND_STORE = "historic_hourly_trend"
+
+# Latest Anomaly Flags listed on the Dashboard
+ANOMALY_FLAGS_SHOWN = 10
+
+# Visible Range Options for the History Chart
+HISTORY_RANGES = {"Past Week": 7, "Past Month": 31, "Past Year": 366, "All": None}
 
 data_files_list = [METER_INFO_DATAFILE,
                    MONTHLY_TRENDS_DATAFILE,
@@ -51,32 +68,36 @@ data_files_list = [METER_INFO_DATAFILE,
                    USAGE_SINCE_LAST_READING_DATAFILE,
                    CURRENT_USAGE_DATAFILE,
                    PAST_24_HOUR_TREND_DATAFILE,
-                   HISTORIC_HOURLY_TREND_DATAFILE]
-
-# Prepare Local Data File Path
-data_file_path = os.path.join(os.path.abspath(os.path.curdir), "data_files")
-os.makedirs(data_file_path, exist_ok=True)
-
+                   ANOMALY_FLAGS_DATAFILE,
+                   BILL_PROJECTION_DATAFILE] + aggregate_files_list
 
-# Read File from Local
-def read_data_from_file_as_pdf(file_name):
-    try:
-        local_file_name = os.path.join(data_file_path, file_name)
-        return pd.read_csv(local_file_name)
-    except Exception as e:
-        print("Failed to Read Data from File: [{}]".format(file_name))
-        return None
+# Download a Meter's Files from Blob (Unchanged Files are Skipped); Other Meters' Prefixes are never Listed
+def download_all_files_from_blob(file_path=None, blob_prefix=""):
+    # Azure SDK is only loaded when the Dashboard pulls from BLOB
+    from azure_blob import AzureBlob
+    blob_account_name, blob_account_key, blob_container_name = get_blob_credentials()
+    blob_obj = AzureBlob(account_name=blob_account_name, account_key=blob_account_key,
+                         container_name=blob_container_name)
+    blob_sync = BlobSync(blob_obj, file_path or data_file_path, blob_prefix=blob_prefix)
+    # The Data Handler uploads the Manifest Last: an Unchanged Manifest means an Unchanged Snapshot
+    if blob_sync.is_current(DATA_MANIFEST_FILE):
+        return
+    blob_sync.download(data_files_list)
+    # Only the History Chunks this Process does not hold yet; Raw Partition Files from before the Chunked Layout
+    if download_store(blob_obj, os.path.join(blob_sync.local_path, HISTORIC_HOURLY_TREND_STORE),
+                      HISTORIC_HOURLY_TREND_STORE, blob_prefix) is None:
+        blob_sync.download(blob_sync.list_remote(HISTORIC_HOURLY_TREND_STORE + "/"))
+    # Taken Last, so a Partly Failed Pull is tried again on the next Refresh
+    blob_sync.download([DATA_MANIFEST_FILE])
 
 
-# Download All Files from Blob
-def download_all_files_from_blob():
+# The Usage Database Snapshot the Data Handler Uploads; it is shared by All Meters, so it sits outside their Prefixes
+def download_usage_database():
+    from azure_blob import AzureBlob
+    blob_account_name, blob_account_key, blob_container_name = get_blob_credentials()
     blob_obj = AzureBlob(account_name=blob_account_name, account_key=blob_account_key,
                          container_name=blob_container_name)
-    for file_name in data_files_list:
-        try:
-            blob_obj.download_files_from_blob(local_path=data_file_path, file_name=file_name)
-        except Exception as e:
-            print("Failed to Retrieve File: [{}] from BLOB".format(file_name))
+    BlobSync(blob_obj, data_file_path).download([USAGE_DB_SNAPSHOT_DATAFILE])
 
 
 def _max_width_():
@@ -93,147 +114,180 @@ def _max_width_():
     )
 
 
-def grid_plot(list_df, x_col, y_cols, xaxis_label, yaxis_label, span_col=None, scatter=True, tick_interval=None):
-    grid_children = []
-    for df in list_df:
-        colors = ['rgb(114,160,193)', 'rgb(175,0,42)', 'rgb(255,191,0)', 'rgb(59,122,87)', 'rgb(242,103,0)']
-        source = ColumnDataSource(data=df)
-        tools_to_show = 'box_zoom,pan,save,reset,wheel_zoom'
-        p = figure(x_range=df[x_col].tolist(),
-                   plot_height=300,
-                   y_axis_label=yaxis_label,
-                   toolbar_location='right',
-                   tools=tools_to_show)
-
-        for i in range(len(y_cols)):
-            c = p.line(x_col, y_cols[i],
-                       source=source,
-                       line_width=2,
-                       color=colors[i])
-            if scatter:
-                circle = p.circle(x_col, y_cols[i],
-                                  source=source,
-                                  fill_color=colors[i],
-                                  color=colors[i],
-                                  size=6)
-
-                p.add_tools(HoverTool(tooltips=[(f"{y_cols[i]}", "@%s{'0.00'}" % (y_cols[i]))],
-                                      renderers=[circle], mode='mouse',
-                                      formatters={f'{y_cols[i]}': 'numeral'}))
-        # create span for average level
-        if span_col:
-            _span(df, span_col, p)
-        p.title.text_font_size = "12pt"
-        p.xaxis.major_label_text_font_size = "10pt"
-        p.xaxis.major_label_orientation = 1
-        p.yaxis.major_label_text_font_size = "11pt"
-        p.yaxis[0].formatter.use_scientific = False
-        p.yaxis[0].formatter = NumeralTickFormatter(format='0.00')
-        p.y_range.start = 0
-        p.x_range.range_padding = 0.05
-        p.y_range.range_padding = 0.1
-        grid_children.append(p)
-
-    grid = gridplot(children=[grid_children[i:i + 1] for i in range(0, len(grid_children), 1)],
-                    sizing_mode="stretch_width")
-    st.bokeh_chart(grid)
-
-
-def _span(df, col_name, p):
-    level = df[col_name].values[0]
-    average_span = Span(location=level,
-                        dimension='width', line_color='black',
-                        line_dash='dashed', line_width=2)
-    p.add_layout(average_span)
-
-
-def plot():
+def grid_plot(list_df, x_col, y_cols, xaxis_label, yaxis_label, span_col=None, scatter=True, tick_interval=None,
+              datetime_axis=False):
+    st.bokeh_chart(build_grid(list_df, x_col, y_cols, xaxis_label, yaxis_label, span_col, scatter, tick_interval,
+                              datetime_axis))
+
+
+# Serializing a Layout briefly attaches it to a Document: Viewers sharing the Cached Figures take Turns
+_static_figures_lock = threading.Lock()
+
+
+# The Charts every Viewer sees, Built (or Loaded from the Render Service's Snapshot) once per Data Generation
+def get_static_figures(file_path, meter_name=None):
+    generation = data_generation(file_path)
+
+    def load_figures():
+        snapshot = read_snapshot(meter_name) if meter_name else None
+        if snapshot is not None and snapshot.get("generation") == generation:
+            return snapshot_figures(snapshot)
+        return build_static_figures(file_path)
+
+    return frame_cache.get_or_compute((file_path, "STATIC_FIGURES"), generation, load_figures)
+
+
+# A Data File that may not be Written yet; None when it is Missing or Empty
+def _read_optional(file_name, file_path):
+    df = read_data_from_file_as_pdf(file_name, file_path) \
+        if os.path.exists(os.path.join(file_path, file_name)) else None
+    return df if df is not None and not df.empty else None
+
+
+def plot(file_path=None, meter_name=None):
+    file_path = file_path or data_file_path
     _max_width_()
-    meter_meta = read_data_from_file_as_pdf(METER_INFO_DATAFILE)
+    meter_meta = read_data_from_file_as_pdf(METER_INFO_DATAFILE, file_path)
     address = meter_meta['ADDRESS'][0]
     meter_number = meter_meta['METER_NUMBER'][0]
     esiid = meter_meta['ESIID'][0]
-    current_cycle_usage = read_data_from_file_as_pdf(CURRENT_USAGE_DATAFILE)['CURRENT_CYCLE_USAGE'][0]
-    past_24_hours = read_data_from_file_as_pdf(PAST_24_HOUR_TREND_DATAFILE)
-    past_45_days = read_data_from_file_as_pdf(DAILY_TRENDS_DATAFILE)
-    past_12_months = read_data_from_file_as_pdf(MONTHLY_TRENDS_DATAFILE)
-    past_day_interval = read_data_from_file_as_pdf(INTERVAL_TRENDS_DATAFILE)
-    meter_last_read = read_data_from_file_as_pdf(LATEST_METER_READING_DATAFILE)
-    latest_reading_time = meter_last_read['CURRENT_READING_TIME'][0]
-    latest_reading_time = datetime.strptime(latest_reading_time, "%Y-%m-%d %H:%M:%S")
-    last_billed = read_data_from_file_as_pdf(LAST_BILLED_METER_READING_DATAFILE)
-    last_billed_date = last_billed['LAST_BILLED_DATE'][0]
-    last_billed_units = last_billed['LAST_BILLED_READING'][0]
+    # A New Meter has no Reading (Rate Limited / Still Pending) or no Bill yet: those Lines wait for them
+    current_usage = _read_optional(CURRENT_USAGE_DATAFILE, file_path)
+    meter_last_read = _read_optional(LATEST_METER_READING_DATAFILE, file_path)
+    last_billed = _read_optional(LAST_BILLED_METER_READING_DATAFILE, file_path)
 
     # static info
     st.title("Real-Time Electricity Usage Dashboard")
     st.write("**Address : **{}".format(address))
     st.write("**Meter ID : **{}".format(meter_number), "&nbsp" * 30, "**ESIID : **{}".format(esiid))
-    st.write("**Previous Billed Reading : **", last_billed_units, "&nbsp" * 9, "**Previous Billed Date : **",
-             last_billed_date)
-    st.write("**Latest Meter Units : **", meter_last_read['CURRENT_READING'][0], "&nbsp" * 11,
-             "**Latest Reading Time : **",
-             latest_reading_time.strftime("%A, %B %e, %Y - %I:%M %p"))
-    st.write("# Current Cycle Usage : ", round(current_cycle_usage, 2))
+    if last_billed is not None:
+        st.write("**Previous Billed Reading : **", last_billed['LAST_BILLED_READING'][0], "&nbsp" * 9,
+                 "**Previous Billed Date : **", last_billed['LAST_BILLED_DATE'][0])
+    if meter_last_read is not None:
+        latest_reading_time = datetime.strptime(meter_last_read['CURRENT_READING_TIME'][0], "%Y-%m-%d %H:%M:%S")
+        st.write("**Latest Meter Units : **", meter_last_read['CURRENT_READING'][0], "&nbsp" * 11,
+                 "**Latest Reading Time : **",
+                 latest_reading_time.strftime("%A, %B %e, %Y - %I:%M %p"))
+    else:
+        st.write("**Latest Meter Units : **", "No Meter Reading yet")
+    if current_usage is not None:
+        st.write("# Current Cycle Usage : ", round(current_usage['CURRENT_CYCLE_USAGE'][0], 2))
+    # Projected by the Data Handler on every Reading: only one Row to Load here
+    bill_projection = read_data_from_file_as_pdf(BILL_PROJECTION_DATAFILE, file_path) \
+        if os.path.exists(os.path.join(file_path, BILL_PROJECTION_DATAFILE)) else None
+    if bill_projection is not None and not bill_projection.empty:
+        projection = bill_projection.iloc[0]
+        st.write("**Projected Cycle Usage : **", round(projection['PROJECTED_USAGE'], 2), "kWh", "&nbsp" * 9,
+                 "**Next Bill Date : **", projection['NEXT_BILL_DATE'], "&nbsp" * 9,
+                 "**Days Remaining : **", projection['DAYS_REMAINING'])
+        if not pd.isna(projection['PROJECTED_COST']):
+            st.write("**Cost so far : **$", round(projection['CYCLE_COST'], 2), "&nbsp" * 9,
+                     "**Projected Bill : **$", round(projection['PROJECTED_COST'], 2))
+
+    anomaly_flags = read_data_from_file_as_pdf(ANOMALY_FLAGS_DATAFILE, file_path) \
+        if os.path.exists(os.path.join(file_path, ANOMALY_FLAGS_DATAFILE)) else None
+    if anomaly_flags is not None and not anomaly_flags.empty:
+        st.subheader("**Flagged Readings (Latest First)**")
+        st.table(anomaly_flags.tail(ANOMALY_FLAGS_SHOWN).iloc[::-1].reset_index(drop=True))
 
     # plots
-    past_24_hours['PREV_METER_READING'] = past_24_hours['METER_READING'].shift(1)
-    past_24_hours['USAGE'] = past_24_hours['METER_READING'] - past_24_hours['PREV_METER_READING']
-    past_24_hours = past_24_hours.drop(columns=['PREV_METER_READING', 'METER_READING'])
-    past_24_hours['AVERAGE_USAGE'] = past_24_hours['USAGE'].mean()
-    past_24_hours['USAGE_DATE'] = pd.to_datetime(past_24_hours['READING_TIME']).dt.date.astype('str')
-    past_24_hours['USAGE_TIME'] = pd.to_datetime(past_24_hours['READING_TIME']).dt.time.astype('str')
-    unq_day_past_24_hours = ','.join(past_24_hours['USAGE_DATE'].unique().tolist())
-    st.subheader(f"**Consumption Trends: Past 24 Hours ({unq_day_past_24_hours})**")
-    grid_plot(list_df=[past_24_hours],
-              x_col='USAGE_TIME',
-              y_cols=['USAGE'],
-              xaxis_label='Date Time',
-              yaxis_label='Usage (in kWh)',
-              span_col='AVERAGE_USAGE',
-              scatter=True,
-              tick_interval=False)
-
-    past_day_interval['AVERAGE_USAGE'] = past_day_interval['USAGE'].mean()
-    past_day_interval['USAGE_DATE'] = pd.to_datetime(past_day_interval['USAGE_TIME']).dt.date.astype('str')
-    past_day_interval['USAGE_TIME'] = pd.to_datetime(past_day_interval['USAGE_TIME']).dt.time.astype('str')
-    unq_past_day_interval = ','.join(past_day_interval['USAGE_DATE'].unique().tolist())
-    st.subheader(f"**Consumption Trends: 15 minute Intervals ({unq_past_day_interval})**")
-    grid_plot(list_df=[past_day_interval],
-              x_col='USAGE_TIME',
-              y_cols=['USAGE'],
-              xaxis_label='Date Time',
-              yaxis_label='Usage (in kWh)',
-              span_col='AVERAGE_USAGE',
-              scatter=False,
-              tick_interval=False)
-
-    st.subheader("**Consumption Trends: Past 45 Days**")
-    past_45_days['AVERAGE_USAGE'] = past_45_days['USAGE'].mean()
-    grid_plot(list_df=[past_45_days],
-              x_col='DAILY_DATE',
-              y_cols=['USAGE'],
-              xaxis_label='Date',
-              yaxis_label='Usage (in kWh)',
-              span_col='AVERAGE_USAGE',
-              scatter=False,
-              tick_interval=False)
-
-    st.subheader("**Consumption Trends: Past 12 Months**")
-    past_12_months['MONTH_YEAR'] = pd.to_datetime(past_12_months['MONTHLY_DATE']).dt.to_period('M').astype('str')
-    past_12_months_grp = past_12_months.groupby('MONTH_YEAR').USAGE.sum().reset_index()
-    past_12_months_grp['AVERAGE_USAGE'] = past_12_months_grp['USAGE'].mean()
-    grid_plot(list_df=[past_12_months_grp],
-              x_col='MONTH_YEAR',
-              y_cols=['USAGE'],
-              xaxis_label='Month Year',
-              yaxis_label='Usage (in kWh)',
-              span_col='AVERAGE_USAGE',
-              scatter=True,
-              tick_interval=False)
-
-
-if BLOB_ENABLED:
-    download_all_files_from_blob()
-
-plot()
+    for title, grid in get_static_figures(file_path, meter_name):
+        st.subheader(f"**{title}**")
+        with _static_figures_lock:
+            st.bokeh_chart(grid)
+
+    usage_db = get_usage_database(esiid) if USAGE_DB_ENABLED else None
+    history_rollups = get_history_rollups(file_path) if usage_db is None else None
+    if usage_db or history_rollups:
+        history_range = st.selectbox("History Range", list(HISTORY_RANGES.keys()))
+        if usage_db:
+            history_level, history = get_history_from_database(usage_db, esiid, HISTORY_RANGES[history_range])
+        else:
+            end_time = history_rollups["HOUR"]['READING_TIME'].max()
+            start_time = end_time - pd.Timedelta(days=HISTORY_RANGES[history_range]) \
+                if HISTORY_RANGES[history_range] else None
+            history_level, history = level_of_detail(history_rollups, 'READING_TIME', 'USAGE', start_time,
+                                                     end_time)
+        history['AVERAGE_USAGE'] = history['USAGE'].mean()
+        st.subheader(f"**Consumption Trends: History by {history_level.title()} ({history_range})**")
+        grid_plot(list_df=[history],
+                  x_col='READING_TIME',
+                  y_cols=['USAGE'],
+                  xaxis_label='Date Time',
+                  yaxis_label='Usage (in kWh)',
+                  span_col='AVERAGE_USAGE',
+                  scatter=False,
+                  tick_interval=False,
+                  datetime_axis=True)
+
+
+# The Usage Database, when the Data Handler keeps one and it holds Readings for this Meter: the Live File when
+# both share the Data Folder, else the Snapshot pulled from BLOB (Read Only)
+def get_usage_database(esiid):
+    db_file = os.path.join(data_file_path, USAGE_DB_DATAFILE)
+    snapshot_file = os.path.join(data_file_path, USAGE_DB_SNAPSHOT_DATAFILE)
+    if os.path.exists(db_file):
+        # The Dashboard only Reads: the Schema and WAL Mode are the Data Handler's to Set
+        usage_db = UsageDatabase(db_file, read_only=True)
+    elif os.path.exists(snapshot_file):
+        usage_db = UsageDatabase(snapshot_file, read_only=True)
+    else:
+        return None
+    try:
+        return usage_db if usage_db.time_range("readings", esiid)[1] is not None else None
+    except sqlite3.DatabaseError as e:
+        # A Snapshot caught mid Download: the Rollups serve this Page Load
+        print("Failed to Read the Usage Database: [{}]: {}".format(usage_db.db_file, e))
+        return None
+
+
+# Only the Selected Range is Summed (in SQL) and Loaded, however long the History is
+def get_history_from_database(usage_db, esiid, history_days):
+    first_time, end_time = usage_db.time_range("readings", esiid)
+    start_time = max(first_time, end_time - pd.Timedelta(days=history_days)) if history_days else first_time
+    history_level = choose_level(start_time, end_time)
+    history = usage_db.usage_by(history_level, "readings", esiid, start_time, end_time).dropna()
+    x, y = lttb(history['bucket'].values, history['usage'].values, DEFAULT_PIXEL_BUDGET)
+    return history_level, pd.DataFrame({'READING_TIME': x, 'USAGE': y})
+
+
+# Hour/Day/Week/Month Rollups of the Historic Readings, re-parsed only when the Files change
+def get_history_rollups(file_path=None):
+    file_path = file_path or data_file_path
+    rollup_files = [os.path.join(file_path, x) for x in HISTORY_ROLLUP_AGGREGATES.values()]
+    if all(os.path.exists(x) for x in rollup_files):
+        version = tuple(os.stat(x).st_mtime_ns for x in rollup_files)
+
+        def load_rollups():
+            rollups = dict()
+            for level, aggregate_file in HISTORY_ROLLUP_AGGREGATES.items():
+                rollups[level] = read_data_from_file_as_pdf(aggregate_file, file_path)
+                rollups[level]['READING_TIME'] = pd.to_datetime(rollups[level]['READING_TIME'])
+            return rollups
+
+        return frame_cache.get_or_compute((file_path, "HISTORY_ROLLUPS"), version, load_rollups)
+    store_path = os.path.join(file_path, HISTORIC_HOURLY_TREND_STORE)
+    if not os.path.exists(store_path):
+        return None
+    store = SeriesStore(store_path)
+    if store.is_empty():
+        return None
+    return frame_cache.get_or_compute(store_path, store.last_time, lambda: history_rollups(store.read_series()))
+
+
+def main():
+    meters = get_dashboard_meters()
+    meter_name = st.sidebar.selectbox("Meter", list(meters.keys())) if len(meters) > 1 else list(meters.keys())[0]
+    meter_file_path, blob_prefix = meters[meter_name]
+    os.makedirs(meter_file_path, exist_ok=True)
+    if BLOB_ENABLED:
+        # A Meter is pulled on its First View and then refreshed in the Background while it is Recently Viewed
+        ensure_blob_refresher(lambda: download_all_files_from_blob(meter_file_path, blob_prefix), key=meter_name)
+        if USAGE_DB_ENABLED:
+            ensure_blob_refresher(download_usage_database, key=USAGE_DB_SNAPSHOT_DATAFILE)
+    plot(meter_file_path, meter_name)
+
+
+# Streamlit runs the Script as __main__ on every Page Load
+if __name__ == "__main__":
+    main()
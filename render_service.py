@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bokeh.document import Document
+from bokeh.embed import file_html, json_item
+from bokeh.layouts import column
+from bokeh.models import Div
+from bokeh.resources import CDN
+
+from dashboard_figures import build_static_figures, data_file_path, data_generation, get_dashboard_meters
+from metrics import metrics
+
+# One Folder per Meter holding its Standalone Dashboard (HTML for Kiosks / Email, JSON for the Streamlit Page)
+RENDER_SNAPSHOT_PATH = os.getenv("RENDER_SNAPSHOT_PATH", os.path.join(data_file_path, "snapshots"))
+SNAPSHOT_HTML_FILE = "dashboard.html"
+SNAPSHOT_JSON_FILE = "dashboard.json"
+SNAPSHOT_PNG_FILE = "dashboard.png"
+# Render Processes (0 for one per Core); Meters are Rendered in Parallel, the Charts of one Meter in Sequence
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 0))
+# Seconds between Checks for a New Data Generation when Watching
+RENDER_INTERVAL = int(os.getenv("RENDER_INTERVAL", 60))
+# PNG Export needs Selenium and a Headless Browser; it is Skipped when they are not Installed
+RENDER_PNG = True if os.getenv("RENDER_PNG") else False
+
+
+def _write_atomic(local_file_name, content):
+    with open(local_file_name + ".tmp", "w") as f:
+        f.write(content)
+    os.replace(local_file_name + ".tmp", local_file_name)
+
+
+def snapshot_folder(meter_name, snapshot_path=None):
+    return os.path.join(snapshot_path or RENDER_SNAPSHOT_PATH, meter_name)
+
+
+# The Stored Snapshot of a Meter, or None when there is none (or it is Unreadable)
+def read_snapshot(meter_name, snapshot_path=None):
+    snapshot_file = os.path.join(snapshot_folder(meter_name, snapshot_path), SNAPSHOT_JSON_FILE)
+    if not os.path.exists(snapshot_file):
+        return None
+    try:
+        with open(snapshot_file) as f:
+            return json.load(f)
+    except ValueError:
+        print("Discarding Unreadable Snapshot: [{}]".format(snapshot_file))
+        return None
+
+
+# (Title, Bokeh Layout) of every Chart in a Snapshot, restored without Reading or Aggregating any Data
+def snapshot_figures(snapshot):
+    figures = []
+    for chart in snapshot["charts"]:
+        doc = Document.from_json(chart["item"]["doc"])
+        figures.append((chart["title"], doc.get_model_by_id(chart["item"]["root_id"])))
+    return figures
+
+
+def _export_png(layout, local_file_name):
+    try:
+        from bokeh.io import export_png
+        export_png(layout, filename=local_file_name)
+    except Exception as e:
+        print("Skipped PNG Snapshot [{}]: {}".format(local_file_name, e))
+
+
+# Build one Meter's Snapshot unless it already holds the Current Data Generation; runs in a Worker Process
+def render_meter(meter_name, meter_file_path, snapshot_path=None, png=RENDER_PNG, force=False):
+    start = time.perf_counter()
+    generation = data_generation(meter_file_path)
+    snapshot = read_snapshot(meter_name, snapshot_path)
+    if not force and snapshot is not None and snapshot.get("generation") == generation:
+        return meter_name, None, time.perf_counter() - start
+    figures = build_static_figures(meter_file_path)
+    out_path = snapshot_folder(meter_name, snapshot_path)
+    os.makedirs(out_path, exist_ok=True)
+    charts = [{"title": title, "item": json_item(grid)} for title, grid in figures]
+    layout = column([child for title, grid in figures for child in (Div(text="<h3>{}</h3>".format(title)), grid)],
+                    sizing_mode="stretch_width")
+    _write_atomic(os.path.join(out_path, SNAPSHOT_HTML_FILE),
+                  file_html(layout, CDN, "Electricity Usage: {}".format(meter_name)))
+    if png:
+        _export_png(layout, os.path.join(out_path, SNAPSHOT_PNG_FILE))
+    # The JSON goes Last: its Generation marks the whole Snapshot as Done
+    _write_atomic(os.path.join(out_path, SNAPSHOT_JSON_FILE),
+                  json.dumps({"meter": meter_name, "generation": generation, "charts": charts}))
+    return meter_name, generation, time.perf_counter() - start
+
+
+# Render every Meter whose Data Changed, Meters spread over the Process Pool
+def render_all(meters=None, snapshot_path=None, png=RENDER_PNG, force=False, executor=None):
+    meters = meters or get_dashboard_meters()
+    rendered = 0
+    with metrics.span("render"):
+        if executor is None and len(meters) == 1:
+            # A Single Meter is Rendered in this Process: no Pool to Start
+            results = [(meter_name, _call(lambda: render_meter(meter_name, meter_file_path, snapshot_path, png, force)))
+                       for meter_name, (meter_file_path, _) in meters.items()]
+        else:
+            own_executor = executor is None
+            executor = executor or ProcessPoolExecutor(max_workers=min(RENDER_WORKERS or os.cpu_count() or 1,
+                                                                       len(meters)))
+            try:
+                futures = {executor.submit(render_meter, meter_name, meter_file_path, snapshot_path, png, force):
+                           meter_name for meter_name, (meter_file_path, _) in meters.items()}
+                results = [(futures[future], _call(future.result)) for future in as_completed(futures)]
+            finally:
+                if own_executor:
+                    executor.shutdown()
+    for meter_name, result in results:
+        if isinstance(result, Exception):
+            metrics.inc("snapshots_total", outcome="failed")
+            print("Failed to Render Snapshot of Meter [{}]: {}".format(meter_name, result))
+        elif result[1] is None:
+            metrics.inc("snapshots_total", outcome="unchanged")
+        else:
+            rendered += 1
+            metrics.inc("snapshots_total", outcome="rendered")
+            print("Rendered Snapshot of Meter [{}] (Generation {}) in [{:.2f}] Seconds".format(*result))
+    return rendered
+
+
+def _call(func):
+    try:
+        return func()
+    except Exception as e:
+        return e
+
+
+# Keep the Snapshots Current; the Worker Processes are kept for the Life of the Service
+def run_forever(interval=RENDER_INTERVAL, snapshot_path=None, png=RENDER_PNG):
+    meters = get_dashboard_meters()
+    with ProcessPoolExecutor(max_workers=min(RENDER_WORKERS or os.cpu_count() or 1, len(meters))) as executor:
+        while True:
+            render_all(meters, snapshot_path, png, executor=executor)
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    # Usage: python render_service.py [watch]
+    if len(sys.argv) > 1 and sys.argv[1] == "watch":
+        run_forever()
+    else:
+        render_all()
@@ -0,0 +1,167 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import metrics
+
+# Concurrent Requests and Requests per Minute to the Portal, across all Meters and Endpoints of the Process
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", 8))
+SCHEDULER_REQUESTS_PER_MINUTE = float(os.getenv("SCHEDULER_REQUESTS_PER_MINUTE", 120))
+# Defaults per Endpoint; the [RATE_LIMITS] Section of api_endpoints.ini overrides them for single Endpoints
+SCHEDULER_ENDPOINT_CONCURRENCY = int(os.getenv("SCHEDULER_ENDPOINT_CONCURRENCY", 4))
+SCHEDULER_ENDPOINT_REQUESTS_PER_MINUTE = float(os.getenv("SCHEDULER_ENDPOINT_REQUESTS_PER_MINUTE", 60))
+# Requests an Idle Bucket lets through at once, in Seconds of its Rate
+SCHEDULER_BURST_SECONDS = 10
+# Pushed-Back Rates are Halved down to this Fraction of the Configured Rate, and win back a Step per Success
+SCHEDULER_MIN_RATE_FRACTION = 0.1
+SCHEDULER_RECOVERY_FRACTION = 0.1
+SCHEDULER_MAX_PAUSE = 300
+
+# Lower goes First: On Demand Reads, then Regular Calls (Login, Dashboard, Trends), then Backfill Chunks
+PRIORITY_ODR = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BACKFILL = 2
+PRIORITY_NAMES = {PRIORITY_ODR: "odr", PRIORITY_DEFAULT: "default", PRIORITY_BACKFILL: "backfill"}
+
+_scheduler_lock = threading.Lock()
+_default_scheduler = None
+
+
+# Token Bucket whose Rate can be Lowered and Restored while it runs
+class _RateBucket:
+    def __init__(self, requests_per_minute):
+        self.base_rate = requests_per_minute / 60.0
+        self.rate = self.base_rate
+        self.capacity = max(1.0, self.base_rate * SCHEDULER_BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_seconds(self, now):
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def slow_down(self, now):
+        self._refill(now)
+        self.rate = max(self.base_rate * SCHEDULER_MIN_RATE_FRACTION, self.rate / 2)
+
+    def recover(self, now):
+        self._refill(now)
+        self.rate = min(self.base_rate, self.rate + self.base_rate * SCHEDULER_RECOVERY_FRACTION)
+
+
+class _Endpoint:
+    def __init__(self, requests_per_minute, concurrency):
+        self.bucket = _RateBucket(requests_per_minute)
+        self.concurrency = concurrency
+        self.active = 0
+        self.paused_until = 0.0
+
+
+# Every Portal Request of the Process waits here for its Turn: Priority first, then Arrival Order
+class RequestScheduler:
+    def __init__(self, max_concurrency=SCHEDULER_MAX_CONCURRENCY, requests_per_minute=SCHEDULER_REQUESTS_PER_MINUTE,
+                 endpoint_concurrency=SCHEDULER_ENDPOINT_CONCURRENCY,
+                 endpoint_requests_per_minute=SCHEDULER_ENDPOINT_REQUESTS_PER_MINUTE, endpoint_limits=None):
+        self.condition = threading.Condition()
+        self.max_concurrency = max_concurrency
+        self.bucket = _RateBucket(requests_per_minute)
+        self.active = 0
+        self.paused_until = 0.0
+        # Endpoint Path -> (Requests per Minute, Concurrent Requests)
+        self.endpoint_limits = endpoint_limits or dict()
+        self.endpoint_defaults = (endpoint_requests_per_minute, endpoint_concurrency)
+        self.endpoints = dict()
+        self.waiting = list()
+        self.sequence = itertools.count()
+
+    def _endpoint(self, api):
+        endpoint = self.endpoints.get(api)
+        if endpoint is None:
+            endpoint = self.endpoints[api] = _Endpoint(*self.endpoint_limits.get(api, self.endpoint_defaults))
+        return endpoint
+
+    # Seconds until a Request to the Endpoint may Start; None while it waits for a Running Request to Finish
+    def _wait_seconds(self, api, now):
+        endpoint = self._endpoint(api)
+        if self.active >= self.max_concurrency or endpoint.active >= endpoint.concurrency:
+            return None
+        return max(0.0, self.paused_until - now, endpoint.paused_until - now, self.bucket.wait_seconds(now),
+                   endpoint.bucket.wait_seconds(now))
+
+    # The Waiting Request to Start now, or how long until one may; a Blocked Endpoint does not hold up the Others
+    def _next_turn(self, now):
+        timeout = None
+        for entry in sorted(self.waiting):
+            wait = self._wait_seconds(entry[2], now)
+            if wait == 0:
+                return entry, None
+            if wait is not None:
+                timeout = wait if timeout is None else min(timeout, wait)
+        return None, timeout
+
+    @contextmanager
+    def slot(self, api, priority=PRIORITY_DEFAULT):
+        entry = (priority, next(self.sequence), api)
+        start = time.monotonic()
+        with self.condition:
+            self.waiting.append(entry)
+            while True:
+                turn, timeout = self._next_turn(time.monotonic())
+                if turn == entry:
+                    break
+                if turn is not None:
+                    # Another Request's Turn: wake it rather than wait for a Timeout
+                    self.condition.notify_all()
+                self.condition.wait(timeout)
+            self.waiting.remove(entry)
+            endpoint = self._endpoint(api)
+            self.bucket.take()
+            endpoint.bucket.take()
+            self.active += 1
+            endpoint.active += 1
+            self.condition.notify_all()
+        metrics.observe("scheduler_wait_seconds", time.monotonic() - start,
+                        priority=PRIORITY_NAMES.get(priority, priority))
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                endpoint.active -= 1
+                self.condition.notify_all()
+
+    # Adaptive Backoff: a Failing Endpoint is Paused and Slowed (all of them when Throttled); Successes restore it
+    def report(self, api, ok, delay=0.0, throttled=False):
+        with self.condition:
+            now = time.monotonic()
+            endpoint = self._endpoint(api)
+            if ok:
+                endpoint.bucket.recover(now)
+                self.bucket.recover(now)
+                return
+            endpoint.bucket.slow_down(now)
+            endpoint.paused_until = max(endpoint.paused_until, now + min(delay, SCHEDULER_MAX_PAUSE))
+            if throttled:
+                # A Rate Limit Response speaks for the whole Account / Portal, not one Endpoint
+                self.bucket.slow_down(now)
+                self.paused_until = max(self.paused_until, now + min(delay, SCHEDULER_MAX_PAUSE))
+            self.condition.notify_all()
+        metrics.inc("scheduler_backoffs_total", api=api, reason="throttled" if throttled else "failed")
+
+
+# One Scheduler per Process, shared by every Meter Session (the Limits of the First Caller apply)
+def default_scheduler(endpoint_limits=None):
+    global _default_scheduler
+    with _scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler(endpoint_limits=endpoint_limits)
+        return _default_scheduler
@@ -0,0 +1,58 @@
+import pandas as pd
+
+# Known Portal Formats: Parsing with an Explicit Format avoids per-Row Format Inference
+PORTAL_DATE_FORMAT = "%m/%d/%Y"
+PORTAL_DATE_TIME_FORMAT = "%m/%d/%Y %H:%M:%S"
+DASHBOARD_INTERVAL_FORMAT = "%Y-%m-%d %I:%M %p"
+
+
+def _frame(rows, columns):
+    df = pd.DataFrame.from_records(rows or [])
+    for column in columns:
+        if column not in df.columns:
+            df[column] = pd.Series(dtype='object')
+    return df
+
+
+def parse_daily_usage_frame(daily_usage_response):
+    df = _frame(daily_usage_response, ["date", "reading"])
+    return pd.DataFrame({
+        "DAILY_DATE": pd.to_datetime(df["date"], format=PORTAL_DATE_FORMAT),
+        "USAGE": pd.to_numeric(df["reading"], errors='coerce')
+    })
+
+
+def parse_monthly_usage_frame(monthly_usage_response):
+    df = _frame(monthly_usage_response, ["startdate", "enddate", "actl_kwh_usg"])
+    read_start_date = pd.to_datetime(df["startdate"], format=PORTAL_DATE_FORMAT)
+    read_end_date = pd.to_datetime(df["enddate"], format=PORTAL_DATE_FORMAT)
+    # A Billing Cycle belongs to the Month its Midpoint falls in
+    read_date = read_start_date + (read_end_date - read_start_date) / 2
+    # The Cycle Dates are Kept: they, not the Month, identify a Row (Two Cycles can share a Month)
+    return pd.DataFrame({
+        "START_DATE": read_start_date,
+        "END_DATE": read_end_date,
+        "MONTHLY_DATE": read_date.dt.to_period('M').dt.to_timestamp(),
+        "USAGE": pd.to_numeric(df["actl_kwh_usg"], errors='coerce')
+    })
+
+
+def parse_interval_usage_frame(usage_data):
+    df = _frame(usage_data, ["date", "endtime", "consumption"])
+    usage_time = (df["date"].astype('str') + df["endtime"].astype('str')).str.upper()
+    return pd.DataFrame({
+        "USAGE_TIME": pd.to_datetime(usage_time, format=DASHBOARD_INTERVAL_FORMAT),
+        "USAGE": pd.to_numeric(df["consumption"], errors='coerce')
+    })
+
+
+def parse_interval_read_frame(interval_response):
+    df = _frame(interval_response, ["date", "endtime", "consumption"])
+    usage_time = (df["date"].astype('str') + df["endtime"].astype('str')).str.upper()
+    usage_time = pd.to_datetime(usage_time, format=PORTAL_DATE_FORMAT + " %I:%M %p")
+    # The 12:00 AM Interval closes the Day it is listed under
+    usage_time = usage_time.where(usage_time.dt.time != pd.Timestamp(0).time(), usage_time + pd.Timedelta(days=1))
+    return pd.DataFrame({
+        "USAGE_TIME": usage_time,
+        "USAGE": pd.to_numeric(df["consumption"], errors='coerce')
+    })
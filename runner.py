@@ -1,201 +1,255 @@
-import configparser
 import datetime
 import os
+import sys
 
 import pandas as pd
-from dateutil.relativedelta import relativedelta
 from pytz import timezone
 
-from azure_blob import AzureBlob
+from aggregates import (daily_usage, interval_usage, monthly_usage, past_24_hour_usage, read_history_rollups,
+                        typical_day_profile, update_history_rollups, write_aggregate)
+from anomaly_detector import detect_meter_reading
+from billing import PROFILE_DAYS, Tariff, cached_billed_reading, next_bill_check, update_bill_projection
+from data_commit import write_batch, write_frame
+from data_layout import (CURRENT_USAGE_DATAFILE, DAILY_TRENDS_DATAFILE, DAILY_USAGE_AGGREGATE,
+                         HISTORIC_HOURLY_TREND_DATAFILE, HISTORIC_HOURLY_TREND_STORE, HISTORY_ROLLUP_AGGREGATES,
+                         INTERVAL_HISTORY_STORE, INTERVAL_TRENDS_DATAFILE, INTERVAL_USAGE_AGGREGATE,
+                         LAST_BILLED_METER_READING_DATAFILE, LATEST_METER_READING_DATAFILE, METER_INFO_DATAFILE,
+                         MONTHLY_TRENDS_DATAFILE, MONTHLY_USAGE_AGGREGATE, ODR_RATE_LIMIT_DATAFILE,
+                         PAST_24_HOUR_TREND_DATAFILE, PAST_24_HOUR_USAGE_AGGREGATE, SESSION_CACHE_DATAFILE,
+                         SYNC_WATERMARK_DATAFILE, TYPICAL_DAY_PROFILE_AGGREGATE, USAGE_DB_DATAFILE,
+                         USAGE_SINCE_LAST_READING_DATAFILE, data_file_path)
+from data_sync import (BLOB_ENABLED, download_all_files_from_blob, download_shared_files, get_blob_obj,
+                       get_meter_credentials, upload_all_files_to_blob, upload_shared_files)
+from interval_backfill import BACKFILL_DAYS, run_backfill
+from incremental_sync import WatermarkStore, sync_daily_usage, sync_monthly_usage
 from meter_session_manager import MeterSessionManager
+from metrics import metrics
+from odr_scheduler import OdrScheduler
+from response_parser import parse_interval_usage_frame
+from series_store import SeriesStore
+from session_cache import SessionCache
+from time_series import TimeSeries
+from usage_db import USAGE_DB_ENABLED, UsageDatabase, index_meter_files
 
-# Set Storage Mode:
-BLOB_ENABLED = True if os.getenv("BLOB_ENABLED") else False
-
-# Prepare Secrets
-if not os.getenv("FETCH_SECRETS_FROM_ENVIRONMENT"):
-    assert os.path.exists("secrets.ini")
-    key_config = configparser.ConfigParser()
-    key_config.read("secrets.ini")
-    assert key_config
-    username = key_config['CREDENTIALS']['SMART_METER_USERNAME']
-    password = key_config['CREDENTIALS']['SMART_METER_PASSWORD']
-    if BLOB_ENABLED:
-        blob_account_name = key_config['AZURE_BLOB']['BLOB_ACCOUNT_NAME']
-        blob_account_key = key_config['AZURE_BLOB']['BLOB_ACCOUNT_KEY']
-        blob_container_name = key_config['AZURE_BLOB']['BLOB_CONTAINER_NAME']
-else:
-    username = os.getenv("SMART_METER_USERNAME")
-    password = os.getenv("SMART_METER_PASSWORD")
-    if BLOB_ENABLED:
-        blob_account_name = os.getenv("BLOB_ACCOUNT_NAME")
-        blob_account_key = os.getenv("BLOB_ACCOUNT_KEY")
-        blob_container_name = os.getenv("BLOB_CONTAINER_NAME")
-
-assert username and password, "Could not source USERNAME and PASSWORD!"
-if BLOB_ENABLED:
-    assert blob_account_name and blob_account_key and blob_container_name, "Could not source BLOB Credentials"
-
-# Set Data Files
-METER_INFO_DATAFILE = "meter_info.csv"
-MONTHLY_TRENDS_DATAFILE = "monthly_trends.csv"
-DAILY_TRENDS_DATAFILE = "daily_trends.csv"
-INTERVAL_TRENDS_DATAFILE = "interval_trends.csv"
-LAST_BILLED_METER_READING_DATAFILE = "last_billed_meter_reading.csv"
-LATEST_METER_READING_DATAFILE = "latest_meter_reading.csv"
-USAGE_SINCE_LAST_READING_DATAFILE = "usage_since_last_reading.csv"
-CURRENT_USAGE_DATAFILE = "current_usage.csv"
-PAST_24_HOUR_TREND_DATAFILE = "past_24_hour_trend.csv"
-HISTORIC_HOURLY_TREND_DATAFILE = "historic_hourly_trend.csv"
-
-data_files_list = [METER_INFO_DATAFILE,
-                   MONTHLY_TRENDS_DATAFILE,
-                   DAILY_TRENDS_DATAFILE,
-                   INTERVAL_TRENDS_DATAFILE,
-                   LAST_BILLED_METER_READING_DATAFILE,
-                   LATEST_METER_READING_DATAFILE,
-                   USAGE_SINCE_LAST_READING_DATAFILE,
-                   CURRENT_USAGE_DATAFILE,
-                   PAST_24_HOUR_TREND_DATAFILE,
-                   HISTORIC_HOURLY_TREND_DATAFILE]
-
-# Prepare Local Data File Path
-data_file_path = os.path.join(os.path.abspath(os.path.curdir), "data_files")
-os.makedirs(data_file_path, exist_ok=True)
-
-
-# Write File to Local
-def write_data_to_file_as_pdf(data, file_name):
-    try:
-        if isinstance(data, dict):
-            try:
-                df = pd.DataFrame(data, index=[0])
-            except:
-                df = pd.DataFrame.from_dict(data)
-        elif isinstance(data, list):
-            df = pd.DataFrame(data)
-        else:
-            raise NotImplementedError
-        local_file_name = os.path.join(data_file_path, file_name)
-        df.to_csv(local_file_name, index=False)
-    except Exception as e:
-        print("Failed to Write Data to File: [{}]".format(file_name))
+
+# Write File to Local (Staged in the Open Write Batch of the Folder, else Committed on its own)
+def write_data_to_file_as_pdf(data, file_name, file_path=None):
+    if isinstance(data, pd.DataFrame):
+        df = data
+    elif isinstance(data, TimeSeries):
+        df = data.to_frame()
+    elif isinstance(data, dict):
+        try:
+            df = pd.DataFrame(data, index=[0])
+        except:
+            df = pd.DataFrame.from_dict(data)
+    elif isinstance(data, list):
+        df = pd.DataFrame(data)
+    else:
+        raise NotImplementedError
+    write_frame(df, os.path.join(file_path or data_file_path, file_name))
 
 
 # Read File from Local
-def read_data_from_file_as_pdf(file_name):
+def read_data_from_file_as_pdf(file_name, file_path=None):
     try:
-        local_file_name = os.path.join(data_file_path, file_name)
+        local_file_name = os.path.join(file_path or data_file_path, file_name)
         return pd.read_csv(local_file_name)
     except Exception as e:
         print("Failed to Read Data from File: [{}]".format(file_name))
         return None
 
 
-# Download All Files from Blob
-def download_all_files_from_blob():
-    blob_obj = AzureBlob(account_name=blob_account_name, account_key=blob_account_key,
-                         container_name=blob_container_name)
-    for file_name in data_files_list:
-        try:
-            blob_obj.download_files_from_blob(local_path=data_file_path, file_name=file_name)
-        except Exception as e:
-            print("Failed to Retrieve File: [{}] from BLOB".format(file_name))
+# Fetch the Dashboard (Meter Details and the Latest Day of Intervals)
+@metrics.span("dashboard")
+def fetch_meter_info(msm, file_path):
+    dashboard_meta = msm.get_dashboard()
+    meter_master_info = msm.meter_details
+    if meter_master_info:
+        meter_info = {
+            "ADDRESS": meter_master_info['fullAddress'],
+            "METER_NUMBER": meter_master_info['meterNumber'],
+            "ESIID": meter_master_info['esiid']
+        }
+        write_data_to_file_as_pdf(meter_info, METER_INFO_DATAFILE, file_path)
 
+    interval_usage = parse_interval_usage_frame(dashboard_meta.get("usageData"))
+    if not interval_usage.empty:
+        write_data_to_file_as_pdf(interval_usage, INTERVAL_TRENDS_DATAFILE, file_path)
+    return dashboard_meta
 
-# Download All Files from Blob
-def upload_all_files_to_blob():
-    blob_obj = AzureBlob(account_name=blob_account_name, account_key=blob_account_key,
-                         container_name=blob_container_name)
-    for file_name in data_files_list:
-        try:
-            blob_obj.upload_file_to_blob(local_path=data_file_path, file_name=file_name)
-        except Exception as e:
-            print("Failed to Upload File: [{}] to BLOB".format(file_name))
 
+# Only the Range after the Last Finalized Date is fetched and merged into the Stored Series
+def fetch_usage_trends(msm, file_path):
+    watermark_store = WatermarkStore(os.path.join(file_path, SYNC_WATERMARK_DATAFILE))
+    with metrics.span("monthly"):
+        monthly_trends = sync_monthly_usage(msm, os.path.join(file_path, MONTHLY_TRENDS_DATAFILE), watermark_store,
+                                            12)
+    with metrics.span("daily"):
+        daily_trends = sync_daily_usage(msm, os.path.join(file_path, DAILY_TRENDS_DATAFILE), watermark_store, 45)
+    return monthly_trends, daily_trends
 
-if __name__ == "__main__":
+
+@metrics.span("billed")
+def fetch_billed_reading(msm, file_path):
+    # The Billed Reading only changes with a New Bill: the Portal is asked again once the Next one is Due
+    latest_billed_data = cached_billed_reading(os.path.join(file_path, LAST_BILLED_METER_READING_DATAFILE))
+    if latest_billed_data:
+        return latest_billed_data
+    latest_billed_data = msm.get_latest_billed_reading()
+    if latest_billed_data:
+        latest_billed_data["NEXT_BILL_CHECK"] = next_bill_check(latest_billed_data["LAST_BILLED_DATE"])
+        write_data_to_file_as_pdf(latest_billed_data, LAST_BILLED_METER_READING_DATAFILE, file_path)
+    return latest_billed_data
+
+
+# Store the Collected Meter Reading and the Series derived from it (Committed on their own)
+@metrics.span("storage")
+def store_meter_reading(odr_result, latest_billed_data, file_path, start_time):
+    usage_since_last_on_demand_reading, current_meter_reading = odr_result
+    if not current_meter_reading:
+        # Rate Limited, or Timed Out with no Earlier Completed Read: there is no Reading to Derive anything from
+        print("No Meter Reading Collected. Skipping the Reading Outputs.")
+        return False
+    with write_batch(file_path) as batch:
+        write_data_to_file_as_pdf(current_meter_reading, LATEST_METER_READING_DATAFILE, file_path)
+        if usage_since_last_on_demand_reading:
+            write_data_to_file_as_pdf(usage_since_last_on_demand_reading, USAGE_SINCE_LAST_READING_DATAFILE,
+                                      file_path)
+
+        if latest_billed_data:
+            current_usage = current_meter_reading["CURRENT_READING"] - latest_billed_data["LAST_BILLED_READING"]
+            write_data_to_file_as_pdf({"CURRENT_CYCLE_USAGE": current_usage}, CURRENT_USAGE_DATAFILE, file_path)
+
+        past_24_hour_trend_file = os.path.join(file_path, PAST_24_HOUR_TREND_DATAFILE)
+        past_24_hour_trend = TimeSeries.read_csv(past_24_hour_trend_file) \
+            if os.path.exists(past_24_hour_trend_file) else TimeSeries()
+        trend_start_time = (start_time - datetime.timedelta(hours=24)).replace(tzinfo=None)
+        past_24_hour_trend = past_24_hour_trend.slice(start_time=trend_start_time)
+        if past_24_hour_trend.append(current_meter_reading["CURRENT_READING_TIME"],
+                                     current_meter_reading["CURRENT_READING"]):
+            write_data_to_file_as_pdf(past_24_hour_trend, PAST_24_HOUR_TREND_DATAFILE, file_path)
+
+        historic_hourly_trend_store = SeriesStore(os.path.join(file_path, HISTORIC_HOURLY_TREND_STORE))
+        if historic_hourly_trend_store.is_empty() and \
+                os.path.exists(os.path.join(file_path, HISTORIC_HOURLY_TREND_DATAFILE)):
+            historic_hourly_trend_store.migrate_from_csv(os.path.join(file_path, HISTORIC_HOURLY_TREND_DATAFILE))
+        detect_meter_reading(file_path, current_meter_reading["CURRENT_READING_TIME"],
+                             current_meter_reading["CURRENT_READING"], history_store=historic_hourly_trend_store)
+        if latest_billed_data:
+            update_bill_projection(file_path, latest_billed_data, current_meter_reading["CURRENT_READING_TIME"],
+                                   current_meter_reading["CURRENT_READING"],
+                                   interval_usage=read_recent_interval_usage(file_path), tariff=Tariff.from_config())
+        else:
+            print("No Billed Reading. Skipping the Cycle Usage and Bill Projection.")
+        # The Store only takes the Reading once the State derived from it is Committed
+        batch.on_commit(lambda: historic_hourly_trend_store.append(current_meter_reading["CURRENT_READING_TIME"],
+                                                                   current_meter_reading["CURRENT_READING"]))
+    return True
+
+
+# Recent 15 Minute Usage (the Backfilled History, else the Latest Day) for the Tariff Period Profile
+def read_recent_interval_usage(file_path):
+    store_path = os.path.join(file_path, INTERVAL_HISTORY_STORE)
+    if os.path.exists(store_path):
+        interval_store = SeriesStore(store_path, time_col="USAGE_TIME", value_col="USAGE")
+        if not interval_store.is_empty():
+            return interval_store.read(start_time=pd.Timestamp(interval_store.last_time) -
+                                       pd.Timedelta(days=PROFILE_DAYS))
+    if os.path.exists(os.path.join(file_path, INTERVAL_TRENDS_DATAFILE)):
+        return read_data_from_file_as_pdf(INTERVAL_TRENDS_DATAFILE, file_path)
+    return None
+
+
+# Fetch Usage for One Meter and Write its Data Files into file_path
+@metrics.span("fetch_usage")
+def fetch_usage(msm, file_path=None):
+    file_path = file_path or data_file_path
+    os.makedirs(file_path, exist_ok=True)
+    start_time = datetime.datetime.now(tz=timezone("US/Central"))
+    # The Portal Data is Committed as one Batch; a Failed Meter Read then cannot take it down as well
+    with write_batch(file_path):
+        fetch_meter_info(msm, file_path)
+
+        # Trigger the Meter Read first; the Meter responds while the Trends are being fetched
+        odr_scheduler = OdrScheduler(msm, os.path.join(file_path, ODR_RATE_LIMIT_DATAFILE))
+        odr_scheduler.submit()
+
+        fetch_usage_trends(msm, file_path)
+        latest_billed_data = fetch_billed_reading(msm, file_path)
+    store_meter_reading(odr_scheduler.collect(), latest_billed_data, file_path, start_time)
+
+
+# Materialize Ready-to-Plot Aggregates so the Dashboard only has to Load and Draw them
+# Only the Changed Sources (File Names, or the History Store) are Aggregated again, All of them when not given;
+# the History Rollups are taken from the Caller when it Keeps them, and the Updated ones are Returned
+@metrics.span("aggregates")
+def materialize_aggregates(file_path=None, sources=None, rollups=None):
+    file_path = file_path or data_file_path
+    aggregate_sources = [(PAST_24_HOUR_TREND_DATAFILE, PAST_24_HOUR_USAGE_AGGREGATE, past_24_hour_usage),
+                         (INTERVAL_TRENDS_DATAFILE, INTERVAL_USAGE_AGGREGATE, interval_usage),
+                         (DAILY_TRENDS_DATAFILE, DAILY_USAGE_AGGREGATE, daily_usage),
+                         (MONTHLY_TRENDS_DATAFILE, MONTHLY_USAGE_AGGREGATE, monthly_usage)]
+    with write_batch(file_path):
+        for source_file, aggregate_file, aggregate_func in aggregate_sources:
+            if sources is not None and source_file not in sources:
+                continue
+            if not os.path.exists(os.path.join(file_path, source_file)):
+                continue
+            source_df = read_data_from_file_as_pdf(source_file, file_path)
+            if source_df is not None and not source_df.empty:
+                write_aggregate(aggregate_func(source_df), file_path, aggregate_file)
+        if sources is not None and HISTORIC_HOURLY_TREND_STORE not in sources:
+            return rollups
+        historic_hourly_trend_store = SeriesStore(os.path.join(file_path, HISTORIC_HOURLY_TREND_STORE))
+        if not historic_hourly_trend_store.is_empty():
+            # Only the Readings since the Last Buckets are Read and Rolled; the Earlier Buckets are kept
+            rollups = update_history_rollups(historic_hourly_trend_store,
+                                             rollups if rollups is not None else read_history_rollups(file_path))
+            for level, aggregate_file in HISTORY_ROLLUP_AGGREGATES.items():
+                write_aggregate(rollups[level], file_path, aggregate_file)
+            write_aggregate(typical_day_profile(rollups["HOUR"]), file_path, TYPICAL_DAY_PROFILE_AGGREGATE)
+    if USAGE_DB_ENABLED:
+        index_usage_database(file_path)
+    return rollups
+
+
+# Copy the New History of a Meter into the Usage Database shared by All Meters
+@metrics.span("database")
+def index_usage_database(file_path=None):
+    file_path = file_path or data_file_path
+    meter_info = read_data_from_file_as_pdf(METER_INFO_DATAFILE, file_path) \
+        if os.path.exists(os.path.join(file_path, METER_INFO_DATAFILE)) else None
+    if meter_info is None or meter_info.empty:
+        print("No Meter Info in [{}]. Skipping the Usage Database.".format(file_path))
+        return 0
+    stores = [SeriesStore(os.path.join(file_path, store_name), time_col=time_col, value_col=value_col)
+              if os.path.exists(os.path.join(file_path, store_name)) else None
+              for store_name, time_col, value_col in
+              [(HISTORIC_HOURLY_TREND_STORE, "READING_TIME", "METER_READING"),
+               (INTERVAL_HISTORY_STORE, "USAGE_TIME", "USAGE")]]
+    usage_db = UsageDatabase(os.path.join(data_file_path, USAGE_DB_DATAFILE))
+    rows = index_meter_files(usage_db, file_path, meter_info['ESIID'][0], readings_store=stores[0],
+                             intervals_store=stores[1])
+    print("Indexed [{}] Rows into the Usage Database".format(rows))
+    return rows
+
+
+def run_fetch():
     try:
         print("#" * 30)
         start_time = datetime.datetime.now(tz=timezone("US/Central"))
         print("Fetch Usage Started At: [{}]".format(start_time))
+        os.makedirs(data_file_path, exist_ok=True)
+        username, password = get_meter_credentials()
         if BLOB_ENABLED:
             download_all_files_from_blob()
-        msm = MeterSessionManager(username=username, password=password)
+            download_shared_files()
+        session_cache = SessionCache(os.path.join(data_file_path, SESSION_CACHE_DATAFILE))
+        msm = MeterSessionManager(username=username, password=password, session_cache=session_cache)
         msm.set_auth_keys()
-        dashboard_meta = msm.get_dashboard()
-        meter_master_info = msm.meter_details
-        if meter_master_info:
-            meter_info = {
-                "ADDRESS": meter_master_info['fullAddress'],
-                "METER_NUMBER": meter_master_info['meterNumber'],
-                "ESIID": meter_master_info['esiid']
-            }
-            write_data_to_file_as_pdf(meter_info, METER_INFO_DATAFILE)
-
-        usageData = dashboard_meta.get("usageData")
-        interval_usage = list()
-        for x in usageData:
-            usage_date_time = "{date}{time}".format(date=x['date'], time=x['endtime']).upper()
-            usage_date_time = datetime.datetime.strptime(usage_date_time, "%Y-%m-%d %I:%M %p")
-            usage = x['consumption']
-            interval_usage.append({"USAGE_TIME": usage_date_time, "USAGE": usage})
-        if interval_usage:
-            write_data_to_file_as_pdf(interval_usage, INTERVAL_TRENDS_DATAFILE)
-
-        monthly_trends = msm.get_monthly_usage_trends(12)
-        if monthly_trends:
-            write_data_to_file_as_pdf(monthly_trends, MONTHLY_TRENDS_DATAFILE)
-
-        daily_trends = msm.get_daily_usage_trends(45)
-        if daily_trends:
-            write_data_to_file_as_pdf(daily_trends, DAILY_TRENDS_DATAFILE)
-
-        latest_billed_data = msm.get_latest_billed_reading()
-        if latest_billed_data:
-            write_data_to_file_as_pdf(latest_billed_data, LAST_BILLED_METER_READING_DATAFILE)
-
-        usage_since_last_on_demand_reading, current_meter_reading = msm.get_on_demand_read()
-        if current_meter_reading:
-            write_data_to_file_as_pdf(current_meter_reading, LATEST_METER_READING_DATAFILE)
-        if usage_since_last_on_demand_reading:
-            write_data_to_file_as_pdf(usage_since_last_on_demand_reading, USAGE_SINCE_LAST_READING_DATAFILE)
-
-        current_usage = current_meter_reading["CURRENT_READING"] - latest_billed_data["LAST_BILLED_READING"]
-        current_usage = {"CURRENT_CYCLE_USAGE": current_usage}
-        if current_usage:
-            write_data_to_file_as_pdf(current_usage, CURRENT_USAGE_DATAFILE)
-
-        if os.path.exists(os.path.join(data_file_path, PAST_24_HOUR_TREND_DATAFILE)):
-            past_24_hour_trend_df = read_data_from_file_as_pdf(PAST_24_HOUR_TREND_DATAFILE)
-            trend_start_time = start_time - datetime.timedelta(hours=24)
-            trend_start_time = trend_start_time.replace(tzinfo=None)
-            past_24_hour_trend_df['READING_TIME'] = past_24_hour_trend_df['READING_TIME'].astype('datetime64[ns]')
-            past_24_hour_trend_df = past_24_hour_trend_df[past_24_hour_trend_df["READING_TIME"] >= trend_start_time]
-            past_24_hour_trend_dict = past_24_hour_trend_df.to_dict(orient='list')
-            past_24_hour_trend_dict["READING_TIME"] = [x.to_pydatetime() for x in
-                                                       past_24_hour_trend_dict["READING_TIME"]]
-        else:
-            past_24_hour_trend_dict = {"READING_TIME": list(), "METER_READING": list()}
-
-        if current_meter_reading["CURRENT_READING_TIME"] not in past_24_hour_trend_dict["READING_TIME"]:
-            past_24_hour_trend_dict["READING_TIME"].append(current_meter_reading["CURRENT_READING_TIME"])
-            past_24_hour_trend_dict["METER_READING"].append(current_meter_reading["CURRENT_READING"])
-            write_data_to_file_as_pdf(past_24_hour_trend_dict, PAST_24_HOUR_TREND_DATAFILE)
-
-        if os.path.exists(os.path.join(data_file_path, HISTORIC_HOURLY_TREND_DATAFILE)):
-            historic_hourly_trend_df = read_data_from_file_as_pdf(HISTORIC_HOURLY_TREND_DATAFILE)
-            historic_hourly_trend_df['READING_TIME'] = historic_hourly_trend_df['READING_TIME'].astype('datetime64[ns]')
-            historic_hourly_trend_dict = historic_hourly_trend_df.to_dict(orient='list')
-            historic_hourly_trend_dict["READING_TIME"] = [x.to_pydatetime() for x in
-                                                       historic_hourly_trend_dict["READING_TIME"]]
-        else:
-            historic_hourly_trend_dict = {"READING_TIME": list(), "METER_READING": list()}
-
-        if current_meter_reading["CURRENT_READING_TIME"] not in historic_hourly_trend_dict["READING_TIME"]:
-            historic_hourly_trend_dict["READING_TIME"].append(current_meter_reading["CURRENT_READING_TIME"])
-            historic_hourly_trend_dict["METER_READING"].append(current_meter_reading["CURRENT_READING"])
-            write_data_to_file_as_pdf(historic_hourly_trend_dict, HISTORIC_HOURLY_TREND_DATAFILE)
+        fetch_usage(msm)
+        materialize_aggregates()
 
         print("-" * 30)
         print(read_data_from_file_as_pdf(PAST_24_HOUR_TREND_DATAFILE))
@@ -205,12 +259,21 @@ if __name__ == "__main__":
         print("-" * 30)
         end_time = datetime.datetime.now(tz=timezone("US/Central"))
         print("Fetch Usage Ended At: [{}]".format(end_time))
-        elapsed_time = relativedelta(end_time, start_time)
-        print("Time Taken: [{}]Minutes [{}]Seconds".format(elapsed_time.minutes, elapsed_time.seconds))
+        print("Time Taken: [{:.1f}] Seconds".format((end_time - start_time).total_seconds()))
         print("#" * 30)
         print("\n")
     except Exception as e:
         print(e)
     finally:
+        metrics.write_files(data_file_path)
         if BLOB_ENABLED:
             upload_all_files_to_blob()
+            upload_shared_files()
+
+
+if __name__ == "__main__":
+    # Usage: python runner.py [backfill [num_days]] (cli.py has All Commands)
+    if sys.argv[1:2] == ["backfill"]:
+        run_backfill(int(sys.argv[2]) if len(sys.argv) > 2 else BACKFILL_DAYS)
+    else:
+        run_fetch()
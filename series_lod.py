@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+# Rollup Levels from Finest to Coarsest, with their Pandas Resample Rule
+ROLLUP_LEVELS = [("HOUR", "H"), ("DAY", "D"), ("WEEK", "W"), ("MONTH", "MS")]
+DEFAULT_PIXEL_BUDGET = 1000
+
+
+# Turn a Cumulative Meter Reading Series into Usage per Reading
+def readings_to_usage(df, time_col="READING_TIME", value_col="METER_READING"):
+    df = df.sort_values(time_col)
+    usage = df[value_col].diff().values
+    # A Negative Delta is a Meter Reset / Replacement, not Consumption
+    usage[usage < 0] = np.nan
+    return pd.DataFrame({time_col: pd.to_datetime(df[time_col]).values, "USAGE": usage}).dropna()
+
+
+def build_rollups(df, time_col, value_col="USAGE", levels=None):
+    series = df.set_index(pd.to_datetime(df[time_col]))[value_col]
+    rollups = dict()
+    for level, rule in ROLLUP_LEVELS:
+        if levels is not None and level not in levels:
+            continue
+        rolled = series.resample(rule).sum(min_count=1).dropna()
+        rollups[level] = pd.DataFrame({time_col: rolled.index, value_col: rolled.values})
+    return rollups
+
+
+# Finest Level whose Point Count over the Range fits the Pixel Budget
+def choose_level(start_time, end_time, pixel_budget=DEFAULT_PIXEL_BUDGET):
+    span = pd.Timestamp(end_time) - pd.Timestamp(start_time)
+    for level, rule in ROLLUP_LEVELS:
+        step = pd.Timedelta(days=7) if rule == "W" else pd.Timedelta(days=30) if rule == "MS" \
+            else pd.Timedelta(1, unit=rule.lower())
+        if span / step <= pixel_budget:
+            return level
+    return ROLLUP_LEVELS[-1][0]
+
+
+# Largest-Triangle-Three-Buckets: Picks the Visually Most Significant Point per Bucket
+def lttb(x, y, n_out):
+    x, y = np.asarray(x), np.asarray(y, dtype='float64')
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    xf = x.astype('int64').astype('float64') if np.issubdtype(x.dtype, np.datetime64) else x.astype('float64')
+    edges = np.linspace(1, n - 1, n_out - 1).astype('int64')
+    keep = np.empty(n_out, dtype='int64')
+    keep[0], keep[-1] = 0, n - 1
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = xf[end:next_end].mean(), y[end:next_end].mean()
+        prev_x, prev_y = xf[keep[i]], y[keep[i]]
+        areas = np.abs((prev_x - avg_x) * (y[start:end] - prev_y) - (prev_x - xf[start:end]) * (avg_y - prev_y))
+        keep[i + 1] = start + int(np.argmax(areas))
+    return x[keep], y[keep]
+
+
+def level_of_detail(rollups, time_col, value_col="USAGE", start_time=None, end_time=None,
+                    pixel_budget=DEFAULT_PIXEL_BUDGET):
+    finest = rollups[ROLLUP_LEVELS[0][0]]
+    start_time = pd.Timestamp(start_time) if start_time is not None else finest[time_col].min()
+    end_time = pd.Timestamp(end_time) if end_time is not None else finest[time_col].max()
+    level = choose_level(start_time, end_time, pixel_budget)
+    df = rollups[level]
+    df = df[(df[time_col] >= start_time) & (df[time_col] <= end_time)]
+    x, y = lttb(df[time_col].values, df[value_col].values, pixel_budget)
+    return level, pd.DataFrame({time_col: x, value_col: y})
@@ -0,0 +1,172 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+# Pandas is only loaded by the Methods that Append or Read Rows: Blob Sync moves the Column Files as they are
+
+# Column Encodings: Epoch Nanoseconds for Time, Float64 for Values
+TIME_COLUMN_DTYPE = np.dtype('<i8')
+VALUE_COLUMN_DTYPE = np.dtype('<f8')
+INDEX_FILE = "index.json"
+
+
+class SeriesStore:
+    def __init__(self, store_path, time_col="READING_TIME", value_col="METER_READING"):
+        self.store_path = store_path
+        self.time_col = time_col
+        self.value_col = value_col
+        self.index_file = os.path.join(store_path, INDEX_FILE)
+        os.makedirs(store_path, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                return json.load(f)
+        return {"last_time": None, "partitions": {}}
+
+    def _save_index(self):
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.index, f, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.index_file)
+
+    @staticmethod
+    def _partition_name(ts):
+        import pandas as pd
+        return pd.Timestamp(ts).strftime("%Y-%m")
+
+    def _column_file(self, partition, column, dtype):
+        return os.path.join(self.store_path, partition, "{}.{}".format(column, dtype.str[1:]))
+
+    def _partition_files(self, partition):
+        return [self._column_file(partition, self.time_col, TIME_COLUMN_DTYPE),
+                self._column_file(partition, self.value_col, VALUE_COLUMN_DTYPE)]
+
+    def _append_columns(self, partition, times, values):
+        os.makedirs(os.path.join(self.store_path, partition), exist_ok=True)
+        rows = self.index["partitions"].get(partition, 0)
+        for file_name, dtype, column in zip(self._partition_files(partition),
+                                            [TIME_COLUMN_DTYPE, VALUE_COLUMN_DTYPE], [times, values]):
+            with open(file_name, "ab") as f:
+                # Drop any Torn Tail left behind by an Interrupted Append
+                f.truncate(rows * dtype.itemsize)
+                f.write(np.asarray(column, dtype=dtype).tobytes())
+        self.index["partitions"][partition] = rows + len(times)
+
+    @property
+    def last_time(self):
+        import pandas as pd
+        last_time = self.index.get("last_time")
+        return pd.Timestamp(last_time) if last_time is not None else None
+
+    def is_empty(self):
+        return not self.index["partitions"]
+
+    def append(self, reading_time, value):
+        import pandas as pd
+        ts = pd.Timestamp(reading_time)
+        if self.index["last_time"] is not None and ts.value <= self.index["last_time"]:
+            print("Reading at [{}] already present in Store [{}]".format(ts, self.store_path))
+            return False
+        self._append_columns(self._partition_name(ts), [ts.value], [value])
+        self.index["last_time"] = ts.value
+        self._save_index()
+        return True
+
+    def append_frame(self, df):
+        from time_series import TimeSeries
+        return self.append_series(TimeSeries.from_frame(df[[self.time_col, self.value_col]].dropna(),
+                                                        self.time_col, self.value_col))
+
+    # The Series is already Sorted and Unique: only the Part after the Last Stored Time is Appended
+    def append_series(self, series):
+        if self.index["last_time"] is not None:
+            series = series.slice(start_time=self.index["last_time"] + 1)
+        times, values = series.times, series.values
+        if not len(times):
+            return 0
+        import pandas as pd
+        partitions = pd.to_datetime(times).strftime("%Y-%m").values
+        for partition in pd.unique(partitions):
+            mask = partitions == partition
+            self._append_columns(partition, times[mask], values[mask])
+        self.index["last_time"] = int(times[-1])
+        self._save_index()
+        return len(times)
+
+    def read(self, start_time=None, end_time=None):
+        return self.read_series(start_time, end_time).to_frame()
+
+    def read_series(self, start_time=None, end_time=None):
+        import pandas as pd
+        from time_series import TimeSeries
+        start_ns = pd.Timestamp(start_time).value if start_time is not None else None
+        end_ns = pd.Timestamp(end_time).value if end_time is not None else None
+        times_list, values_list = list(), list()
+        for partition in sorted(self.index["partitions"]):
+            if start_time is not None and partition < self._partition_name(start_time):
+                continue
+            if end_time is not None and partition > self._partition_name(end_time):
+                continue
+            rows = self.index["partitions"][partition]
+            time_file, value_file = self._partition_files(partition)
+            times = np.fromfile(time_file, dtype=TIME_COLUMN_DTYPE, count=rows)
+            values = np.fromfile(value_file, dtype=VALUE_COLUMN_DTYPE, count=rows)
+            mask = np.ones(len(times), dtype=bool)
+            if start_ns is not None:
+                mask &= times >= start_ns
+            if end_ns is not None:
+                mask &= times <= end_ns
+            times_list.append(times[mask])
+            values_list.append(values[mask])
+        times = np.concatenate(times_list) if times_list else np.array([], dtype=TIME_COLUMN_DTYPE)
+        values = np.concatenate(values_list) if values_list else np.array([], dtype=VALUE_COLUMN_DTYPE)
+        return TimeSeries(times, values, self.time_col, self.value_col)
+
+    # Last (Time, Value) before ts: Partitions are read backwards from the one holding ts, usually just that one
+    def last_before(self, ts):
+        import pandas as pd
+        ts_ns = pd.Timestamp(ts).value
+        for partition in sorted((x for x in self.index["partitions"] if x <= self._partition_name(ts)), reverse=True):
+            rows = self.index["partitions"][partition]
+            time_file, value_file = self._partition_files(partition)
+            times = np.fromfile(time_file, dtype=TIME_COLUMN_DTYPE, count=rows)
+            i = int(np.searchsorted(times, ts_ns)) - 1
+            if i >= 0:
+                return int(times[i]), float(np.fromfile(value_file, dtype=VALUE_COLUMN_DTYPE, count=rows)[i])
+        return None
+
+    def list_files(self, partitions=None):
+        partitions = sorted(self.index["partitions"]) if partitions is None else partitions
+        files = [INDEX_FILE]
+        for partition in partitions:
+            files.extend(os.path.relpath(x, self.store_path) for x in self._partition_files(partition))
+        return files
+
+    def migrate_from_csv(self, csv_file):
+        if not self.is_empty():
+            print("Store [{}] already populated. Skipping Migration.".format(self.store_path))
+            return 0
+        import pandas as pd
+        df = pd.read_csv(csv_file)
+        rows = self.append_frame(df)
+        print("Migrated [{}] rows from [{}] into Store [{}]".format(rows, csv_file, self.store_path))
+        return rows
+
+
+def migrate_csv_to_store(csv_file, store_path, time_col="READING_TIME", value_col="METER_READING"):
+    store = SeriesStore(store_path, time_col=time_col, value_col=value_col)
+    return store.migrate_from_csv(csv_file)
+
+
+if __name__ == "__main__":
+    # Usage: python series_store.py <csv_file> <store_path>
+    if len(sys.argv) != 3:
+        print("Usage: python series_store.py <csv_file> <store_path>")
+        sys.exit(1)
+    migrate_csv_to_store(sys.argv[1], sys.argv[2])
@@ -0,0 +1,77 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+# Portal Tokens are re-validated lazily on a 401, so this only bounds how long a stale entry is tried
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", 12 * 3600))
+KDF_ITERATIONS = 100000
+
+_cache_lock = threading.Lock()
+
+
+class SessionCache:
+    def __init__(self, cache_file, ttl=SESSION_CACHE_TTL, secret=None):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        # Entries are encrypted with SESSION_CACHE_KEY if set, otherwise with the Account Password
+        self.secret = secret or os.getenv("SESSION_CACHE_KEY")
+
+    @staticmethod
+    def _entry_key(username):
+        return hashlib.sha256(username.encode()).hexdigest()
+
+    def _fernet(self, password, salt):
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=KDF_ITERATIONS,
+                         backend=default_backend())
+        return Fernet(base64.urlsafe_b64encode(kdf.derive((self.secret or password).encode())))
+
+    def _load(self):
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file) as f:
+                    return json.load(f)
+            except ValueError:
+                print("Discarding Unreadable Session Cache: [{}]".format(self.cache_file))
+        return {}
+
+    def _save(self, entries):
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(entries, f, sort_keys=True)
+        os.chmod(tmp_file, 0o600)
+        os.replace(tmp_file, self.cache_file)
+
+    def get(self, username, password):
+        with _cache_lock:
+            entry = self._load().get(self._entry_key(username))
+        if not entry or entry["expires_at"] < time.time():
+            return None
+        try:
+            fernet = self._fernet(password, base64.b64decode(entry["salt"]))
+            return json.loads(fernet.decrypt(entry["data"].encode()).decode())
+        except InvalidToken:
+            print("Session Cache Entry could not be Decrypted. Ignoring it.")
+            return None
+
+    def put(self, username, password, session_data):
+        salt = os.urandom(16)
+        token = self._fernet(password, salt).encrypt(json.dumps(session_data).encode()).decode()
+        with _cache_lock:
+            entries = self._load()
+            entries[self._entry_key(username)] = {"salt": base64.b64encode(salt).decode(), "data": token,
+                                                  "expires_at": time.time() + self.ttl}
+            self._save(entries)
+
+    def invalidate(self, username):
+        with _cache_lock:
+            entries = self._load()
+            if entries.pop(self._entry_key(username), None) is not None:
+                self._save(entries)
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+# Same Encodings as the Series Store: Epoch Nanoseconds for Time, Float64 for Values
+TIME_DTYPE = np.dtype('<i8')
+VALUE_DTYPE = np.dtype('<f8')
+MIN_CAPACITY = 16
+
+
+def _to_ns(ts):
+    return int(ts) if isinstance(ts, (int, np.integer)) else pd.Timestamp(ts).value
+
+
+# Sorted, Unique Times with one Value each, held in two Flat Arrays instead of Rows of Python Objects
+class TimeSeries:
+    def __init__(self, times=None, values=None, time_col="READING_TIME", value_col="METER_READING"):
+        times = np.asarray(times if times is not None else [], dtype=TIME_DTYPE)
+        values = np.asarray(values if values is not None else [], dtype=VALUE_DTYPE)
+        assert len(times) == len(values), "Times and Values must have the same Length"
+        if len(times) > 1 and not np.all(np.diff(times) > 0):
+            # Sort, and keep the Last Value of a Repeated Time (Newer Rows win)
+            order = np.argsort(times, kind='mergesort')
+            times, values = times[order], values[order]
+            keep = np.append(np.diff(times) > 0, True)
+            times, values = times[keep], values[keep]
+        self.time_col = time_col
+        self.value_col = value_col
+        self._times = times
+        self._values = values
+        self._size = len(times)
+
+    @classmethod
+    def from_frame(cls, df, time_col="READING_TIME", value_col="METER_READING"):
+        times = pd.to_datetime(df[time_col]).values.astype('datetime64[ns]').astype(TIME_DTYPE)
+        return cls(times, pd.to_numeric(df[value_col], errors='coerce').values, time_col, value_col)
+
+    @classmethod
+    def read_csv(cls, local_file_name, time_col="READING_TIME", value_col="METER_READING"):
+        return cls.from_frame(pd.read_csv(local_file_name, usecols=[time_col, value_col]), time_col, value_col)
+
+    @property
+    def times(self):
+        return self._times[:self._size]
+
+    @property
+    def values(self):
+        return self._values[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def last_time(self):
+        return pd.Timestamp(int(self._times[self._size - 1])) if self._size else None
+
+    @property
+    def last_value(self):
+        return float(self._values[self._size - 1]) if self._size else None
+
+    def _grow(self):
+        capacity = max(MIN_CAPACITY, 2 * len(self._times))
+        for name in ("_times", "_values"):
+            grown = np.empty(capacity, dtype=getattr(self, name).dtype)
+            grown[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, grown)
+
+    # Amortized O(1) at the End; an Out-of-Order Time is inserted in Place. A Known Time is left as it is.
+    def append(self, reading_time, value):
+        ts = _to_ns(reading_time)
+        if self._size and ts <= self._times[self._size - 1]:
+            i = int(np.searchsorted(self.times, ts))
+            if self._times[i] == ts:
+                return False
+            self._times = np.insert(self.times, i, ts)
+            self._values = np.insert(self.values, i, value)
+            self._size += 1
+            return True
+        if self._size == len(self._times):
+            self._grow()
+        self._times[self._size] = ts
+        self._values[self._size] = value
+        self._size += 1
+        return True
+
+    def index_of(self, reading_time):
+        ts = _to_ns(reading_time)
+        i = int(np.searchsorted(self.times, ts))
+        return i if i < self._size and self._times[i] == ts else None
+
+    def __contains__(self, reading_time):
+        return self.index_of(reading_time) is not None
+
+    def value_at(self, reading_time, default=None):
+        i = self.index_of(reading_time)
+        return float(self._values[i]) if i is not None else default
+
+    # Times in [start_time, end_time] by Binary Search; shares the Arrays instead of copying them
+    def slice(self, start_time=None, end_time=None):
+        lo = int(np.searchsorted(self.times, _to_ns(start_time), side='left')) if start_time is not None else 0
+        hi = int(np.searchsorted(self.times, _to_ns(end_time), side='right')) if end_time is not None \
+            else self._size
+        return TimeSeries(self.times[lo:hi], self.values[lo:hi], self.time_col, self.value_col)
+
+    # Usage per Reading of a Cumulative Meter Reading Series; a Negative Delta is a Meter Reset, not Consumption
+    def deltas(self, value_col="USAGE"):
+        usage = np.diff(self.values)
+        usage[usage < 0] = np.nan
+        return TimeSeries(self.times[1:], usage, self.time_col, value_col)
+
+    def to_frame(self):
+        return pd.DataFrame({self.time_col: self.times.view('datetime64[ns]'), self.value_col: self.values})
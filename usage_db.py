@@ -0,0 +1,237 @@
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from data_layout import (DAILY_TRENDS_DATAFILE, INTERVAL_TRENDS_DATAFILE, MONTHLY_TRENDS_DATAFILE, USAGE_DB_DATAFILE,
+                         USAGE_DB_SNAPSHOT_DATAFILE)
+
+# Set this to keep an Indexed SQLite Copy of the Usage History next to the Data Files
+USAGE_DB_ENABLED = True if os.getenv("USAGE_DB_ENABLED") else False
+DB_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DB_BUSY_TIMEOUT = 30
+
+# Table -> (Time Column, Value Column); every Table is keyed by (ESIID, Time)
+USAGE_TABLES = {
+    "readings": ("reading_time", "meter_reading"),
+    "intervals": ("usage_time", "usage"),
+    "daily_usage": ("usage_date", "usage"),
+    "monthly_usage": ("usage_month", "usage"),
+}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (esiid TEXT NOT NULL, reading_time TEXT NOT NULL, meter_reading REAL,
+    usage REAL, PRIMARY KEY (esiid, reading_time)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS intervals (esiid TEXT NOT NULL, usage_time TEXT NOT NULL, usage REAL,
+    PRIMARY KEY (esiid, usage_time)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_usage (esiid TEXT NOT NULL, usage_date TEXT NOT NULL, usage REAL,
+    PRIMARY KEY (esiid, usage_date)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS monthly_usage (esiid TEXT NOT NULL, usage_month TEXT NOT NULL, usage REAL,
+    PRIMARY KEY (esiid, usage_month)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS index_state (esiid TEXT NOT NULL, source TEXT NOT NULL, last_time TEXT,
+    PRIMARY KEY (esiid, source)) WITHOUT ROWID;
+"""
+# SQL Bucket per Rollup Level; Weeks end on Sunday like the Pandas "W" Rule
+LEVEL_BUCKETS = {
+    "HOUR": "strftime('%Y-%m-%d %H:00:00', {col})",
+    "DAY": "date({col})",
+    "WEEK": "date({col}, 'weekday 0')",
+    "MONTH": "strftime('%Y-%m-01', {col})",
+}
+
+_schema_lock = threading.Lock()
+
+
+def _db_time(ts):
+    return pd.Timestamp(ts).strftime(DB_TIME_FORMAT)
+
+
+class UsageDatabase:
+    def __init__(self, db_file, read_only=False):
+        self.db_file = db_file
+        self.read_only = read_only
+        if read_only:
+            return
+        with _schema_lock, self._connect() as conn:
+            # WAL lets the Dashboard read while a Run writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    # One Short Transaction per Call; Connections are not shared between Threads
+    @contextmanager
+    def _connect(self):
+        if self.read_only:
+            conn = sqlite3.connect("file:{}?mode=ro".format(self.db_file), timeout=DB_BUSY_TIMEOUT, uri=True)
+        else:
+            conn = sqlite3.connect(self.db_file, timeout=DB_BUSY_TIMEOUT)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # Online Backup: a Consistent Copy while Runs keep Writing, the WAL folded into the one File
+    def snapshot(self, snapshot_file):
+        tmp_file = snapshot_file + ".tmp"
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        source, target = sqlite3.connect(self.db_file, timeout=DB_BUSY_TIMEOUT), sqlite3.connect(tmp_file)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+        os.replace(tmp_file, snapshot_file)
+        return snapshot_file
+
+    def upsert(self, table, esiid, df, columns):
+        time_col = USAGE_TABLES[table][0]
+        rows = [(str(esiid), _db_time(row[0])) + tuple(None if pd.isna(x) else float(x) for x in row[1:])
+                for row in df[columns].itertuples(index=False)]
+        if not rows:
+            return 0
+        db_columns = [time_col] + [x.lower() for x in columns[1:]]
+        statement = "INSERT OR REPLACE INTO {} (esiid, {}) VALUES (?, {})".format(
+            table, ", ".join(db_columns), ", ".join("?" * len(db_columns)))
+        with self._connect() as conn:
+            conn.executemany(statement, rows)
+        return len(rows)
+
+    def last_row(self, table, esiid):
+        time_col, value_col = USAGE_TABLES[table]
+        with self._connect() as conn:
+            row = conn.execute("SELECT {0}, {1} FROM {2} WHERE esiid = ? ORDER BY {0} DESC LIMIT 1".format(
+                time_col, value_col, table), (str(esiid),)).fetchone()
+        return (pd.Timestamp(row[0]), row[1]) if row else (None, None)
+
+    # Last Time copied from an Append-Only Source
+    def get_watermark(self, esiid, source):
+        with self._connect() as conn:
+            row = conn.execute("SELECT last_time FROM index_state WHERE esiid = ? AND source = ?",
+                               (str(esiid), source)).fetchone()
+        return pd.Timestamp(row[0]) if row and row[0] else None
+
+    def set_watermark(self, esiid, source, last_time):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO index_state (esiid, source, last_time) VALUES (?, ?, ?)",
+                         (str(esiid), source, _db_time(last_time)))
+
+    def time_range(self, table, esiid):
+        time_col = USAGE_TABLES[table][0]
+        with self._connect() as conn:
+            row = conn.execute("SELECT MIN({0}), MAX({0}) FROM {1} WHERE esiid = ?".format(time_col, table),
+                               (str(esiid),)).fetchone()
+        return (pd.Timestamp(row[0]), pd.Timestamp(row[1])) if row and row[0] else (None, None)
+
+    def meters(self):
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT esiid FROM daily_usage UNION "
+                                                   "SELECT DISTINCT esiid FROM readings")]
+
+    @staticmethod
+    def _where(time_col, esiids, start_time, end_time, hours, weekdays):
+        clauses, params = list(), list()
+        if esiids:
+            esiids = [esiids] if isinstance(esiids, str) else list(esiids)
+            clauses.append("esiid IN ({})".format(", ".join("?" * len(esiids))))
+            params.extend(str(x) for x in esiids)
+        if start_time is not None:
+            clauses.append("{} >= ?".format(time_col))
+            params.append(_db_time(start_time))
+        if end_time is not None:
+            clauses.append("{} <= ?".format(time_col))
+            params.append(_db_time(end_time))
+        if hours is not None:
+            # Hour Window [Start, End), e.g. (18, 21) is 6 PM to 9 PM
+            clauses.append("CAST(strftime('%H', {}) AS INTEGER) BETWEEN ? AND ?".format(time_col))
+            params.extend([int(hours[0]), int(hours[1]) - 1])
+        if weekdays is not None:
+            clauses.append("strftime('%w', {}) {} IN ('0', '6')".format(time_col, "NOT" if weekdays else ""))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    # Rows in the Range only: Memory follows the Result, not the Stored History
+    def query(self, table, esiids=None, start_time=None, end_time=None, hours=None, weekdays=None):
+        time_col = USAGE_TABLES[table][0]
+        where, params = self._where(time_col, esiids, start_time, end_time, hours, weekdays)
+        with self._connect() as conn:
+            df = pd.read_sql_query("SELECT * FROM {}{} ORDER BY esiid, {}".format(table, where, time_col),
+                                   conn, params=params)
+        df[time_col] = pd.to_datetime(df[time_col])
+        return df
+
+    # Usage Summed per Rollup Level and Meter inside the Database
+    def usage_by(self, level, table="readings", esiids=None, start_time=None, end_time=None, hours=None,
+                 weekdays=None):
+        time_col = USAGE_TABLES[table][0]
+        where, params = self._where(time_col, esiids, start_time, end_time, hours, weekdays)
+        bucket = LEVEL_BUCKETS[level].format(col=time_col)
+        with self._connect() as conn:
+            df = pd.read_sql_query("SELECT esiid, {0} AS bucket, SUM(usage) AS usage FROM {1}{2} "
+                                   "GROUP BY esiid, {0} ORDER BY esiid, {0}".format(bucket, table, where),
+                                   conn, params=params)
+        df["bucket"] = pd.to_datetime(df["bucket"])
+        return df
+
+
+def _read_csv(file_path, file_name):
+    local_file_name = os.path.join(file_path, file_name)
+    return pd.read_csv(local_file_name) if os.path.exists(local_file_name) else None
+
+
+# Copy what is New in a Meter's Data Files and Stores into the Database
+def index_meter_files(db, file_path, esiid, readings_store=None, intervals_store=None):
+    # Only the Data Handler Indexes; the Dashboard Image does not ship the Sync Module
+    from incremental_sync import DAILY_FINALIZE_DAYS
+    rows = 0
+    # The Interval Store has its own Watermark: a Backfill adds Days older than the Latest Dashboard Day
+    if intervals_store is not None and not intervals_store.is_empty():
+        last_time = db.get_watermark(esiid, "interval_history")
+        df = intervals_store.read(start_time=last_time)
+        if not df.empty:
+            rows += db.upsert("intervals", esiid, df, ["USAGE_TIME", "USAGE"])
+            db.set_watermark(esiid, "interval_history", df["USAGE_TIME"].max())
+    if readings_store is not None and not readings_store.is_empty():
+        last_time, last_reading = db.last_row("readings", esiid)
+        df = readings_store.read(start_time=last_time)
+        if last_time is not None:
+            df = df[df["READING_TIME"] > last_time]
+        # Usage per Reading is the Delta to the Previous one, continuing from the Last Indexed Reading
+        values = df["METER_READING"].values.astype('float64')
+        previous = np.concatenate([[np.nan if last_reading is None else last_reading], values[:-1]])
+        usage = values - previous
+        # A Negative Delta is a Meter Reset / Replacement, not Consumption
+        usage[usage < 0] = np.nan
+        rows += db.upsert("readings", esiid, df.assign(USAGE=usage), ["READING_TIME", "METER_READING", "USAGE"])
+    # Trend Files are Rewritten on every Run: only Rows from the Watermark back over the Days the Portal can
+    # still Revise are Copied (the Last Month is Re-Summed whole)
+    for file_name, table, time_col, revise_window in (
+            (DAILY_TRENDS_DATAFILE, "daily_usage", "DAILY_DATE", pd.Timedelta(days=DAILY_FINALIZE_DAYS)),
+            (MONTHLY_TRENDS_DATAFILE, "monthly_usage", "MONTHLY_DATE", pd.Timedelta(0)),
+            (INTERVAL_TRENDS_DATAFILE, "intervals", "USAGE_TIME", pd.Timedelta(days=1))):
+        df = _read_csv(file_path, file_name)
+        if df is None or df.empty:
+            continue
+        df[time_col] = pd.to_datetime(df[time_col])
+        if table == "monthly_usage":
+            # One Row per Billing Cycle in the File: Cycles sharing a Month are Summed, not Replaced
+            df = df.groupby(time_col, as_index=False)["USAGE"].sum(min_count=1)
+        last_time = db.get_watermark(esiid, file_name)
+        if last_time is not None:
+            df = df[df[time_col] >= last_time - revise_window]
+        if not df.empty:
+            rows += db.upsert(table, esiid, df, [time_col, "USAGE"])
+            db.set_watermark(esiid, file_name, df[time_col].max())
+    return rows
+
+
+if __name__ == "__main__":
+    # Usage: python usage_db.py <db_file> <table> [start] [end]
+    if len(sys.argv) < 3:
+        print("Usage: python usage_db.py <db_file> <table> [start] [end]")
+        sys.exit(1)
+    usage_db = UsageDatabase(sys.argv[1])
+    print(usage_db.query(sys.argv[2], start_time=(sys.argv[3:4] or [None])[0], end_time=(sys.argv[4:5] or [None])[0]))